@@ -0,0 +1,99 @@
+"""Benchmark the streaming BibTeX scanner against bibtexparser.
+
+Usage:
+    python benchmarks/bench_bibscan.py [library.bib] [--entries N] [--processes N]
+
+Without a BibTeX file, a synthetic library with the given number of entries
+(each with a handful of fields and a file attachment) is generated.
+"""
+
+import argparse
+import multiprocessing
+import random
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import bibtexparser
+
+from bib4llm.bibscan import scan_bibtex
+
+
+def write_library(path: Path, num_entries: int):
+    """Write a synthetic BibTeX library resembling a BetterBibTeX export."""
+    rng = random.Random(0)
+    words = ["quantum", "neural", "network", "spiking", "model", "dynamics", "learning", "{GPU}", "brain"]
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(num_entries):
+            title = " ".join(rng.choice(words) for _ in range(8))
+            abstract = " ".join(rng.choice(words) for _ in range(150))
+            file_name = title.replace("{", "").replace("}", "")[:30]
+            f.write(
+                f"@article{{Author{i}Key,\n"
+                f"  title = {{{title}}},\n"
+                f"  author = {{Doe, Jane and Smith, John and M{{\\\"u}}ller, Anna}},\n"
+                f"  journal = {{Journal of Benchmarks}},\n"
+                f"  volume = {{{i % 50}}},\n"
+                f"  pages = {{1--{i % 30 + 2}}},\n"
+                f"  year = {{{2000 + i % 25}}},\n"
+                f"  month = jan,\n"
+                f"  doi = {{10.1000/bench.{i}}},\n"
+                f"  abstract = {{{abstract}}},\n"
+                f"  file = {{/home/user/Zotero/storage/{i:08d}/Author {i} - {file_name}.pdf}}\n"
+                f"}}\n\n"
+            )
+
+
+def with_bibtexparser(path: Path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [(entry["ID"], entry.get("file")) for entry in bibtexparser.load(f).entries]
+
+
+def with_scanner(path: Path, num_workers: int = None):
+    return [(entry.citation_key, entry.file) for entry in scan_bibtex(path, num_workers=num_workers)]
+
+
+def measure(label: str, func, *args):
+    """Run func once for its time and once more for its peak Python memory."""
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{label:<28} {elapsed:8.2f}s   peak {peak / 1024**2:8.1f} MiB")
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("bibtex_file", nargs="?", type=Path, help="BibTeX file to scan (default: synthetic library)")
+    parser.add_argument("--entries", type=int, default=20000, help="Number of entries of the synthetic library")
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count(),
+                        help="Number of processes for the parallel scan")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = args.bibtex_file
+        if path is None:
+            path = Path(temp_dir) / "library.bib"
+            write_library(path, args.entries)
+        print(f"{path}: {path.stat().st_size / 1024**2:.1f} MiB\n")
+
+        expected, baseline = measure("bibtexparser.load", with_bibtexparser, path)
+        serial, serial_time = measure("scan_bibtex (1 process)", with_scanner, path)
+        # Parallel parsing only kicks in above bibscan.PARALLEL_THRESHOLD
+        parallel, parallel_time = measure(
+            f"scan_bibtex ({args.processes} processes)", with_scanner, path, args.processes
+        )
+
+    print(f"\nSpeedup: {baseline / serial_time:.1f}x serial, {baseline / parallel_time:.1f}x parallel")
+    print(f"Results identical: {expected == serial == parallel} ({len(expected)} entries)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Benchmark the time until worker processes run their first conversion.
+
+Usage:
+    python benchmarks/bench_startup.py [--workers 1 8 64] [--start-methods fork forkserver spawn]
+
+For each start method and number of workers, a fresh interpreter starts a
+WorkerPool and submits one task per worker converting a one-page PDF. The
+time until the first task finished and until all tasks finished are reported.
+Both include starting the fork server with the 'forkserver' start method, and
+importing the conversion libraries in every worker with 'spawn'.
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+from concurrent.futures import as_completed
+
+from bib4llm.convert import warm_up_converter
+from bib4llm.workers import START_METHODS, WorkerLimits, WorkerPool
+
+
+def run(start_method: str, num_workers: int):
+    """Measure a single configuration and print the times in seconds."""
+    start = time.perf_counter()
+    with WorkerPool(num_workers, WorkerLimits(start_method=start_method)) as pool:
+        futures = [pool.submit(warm_up_converter) for _ in range(num_workers)]
+        first = None
+        for future in as_completed(futures):
+            future.result()
+            if first is None:
+                first = time.perf_counter() - start
+        elapsed = time.perf_counter() - start
+    print(f"{first:.3f} {elapsed:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8, 64], help="Numbers of workers")
+    parser.add_argument("--start-methods", nargs="+", choices=START_METHODS, default=START_METHODS,
+                        help="Start methods to compare")
+    parser.add_argument("--run", nargs=2, metavar=("START_METHOD", "WORKERS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.run[0], int(args.run[1]))
+        return
+
+    print(f"{'start method':<14} {'workers':>8} {'first task':>12} {'all tasks':>12}")
+    for start_method in args.start_methods:
+        for num_workers in args.workers:
+            # A fresh interpreter, so that no fork server is running yet
+            output = subprocess.run(
+                [sys.executable, __file__, "--run", start_method, str(num_workers)],
+                capture_output=True, text=True, check=True
+            ).stdout.split()
+            first, elapsed = map(float, output[-2:])
+            print(f"{start_method:<14} {num_workers:>8} {first:>11.3f}s {elapsed:>11.3f}s")
+
+
+if __name__ == "__main__":
+    main()
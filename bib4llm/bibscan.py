@@ -0,0 +1,317 @@
+"""Streaming scanner for BibTeX files.
+
+bib4llm only needs the citation key and the ``file`` field of each entry.
+Parsing every field of every entry with bibtexparser is slow and memory hungry
+for large libraries, so this module scans the file in chunks instead:
+
+1. The text is split into top-level ``@`` blocks. Candidate boundaries are
+   ``@`` characters at the start of a line; a candidate is only accepted if the
+   braces of the block before it are balanced, so ``@`` signs inside field
+   values are never mistaken for the start of an entry.
+2. Each block is matched against the header ``@type{key,`` and the ``file``
+   field is extracted at the top level of the entry.
+3. Blocks that don't fit this simple form (parenthesized entries, ``file``
+   fields using string macros or concatenation, several entries on one line,
+   ...) are handed to bibtexparser.
+
+The result is the same as with ``bibtexparser.load``: non-standard entry types
+are ignored and continuation lines of field values are stripped of leading
+whitespace. Each entry also carries a digest of its raw text, which changes
+whenever anything in the entry changes.
+"""
+
+import logging
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import bibtexparser
+from bibtexparser.bparser import STANDARD_TYPES
+
+from .fingerprint import FileHasher
+from .workers import get_context
+
+# Create logger
+logger = logging.getLogger(__name__)
+
+# Size of the chunks read from the BibTeX file
+CHUNK_SIZE = 1024 * 1024
+
+# Number of raw entries parsed per task when scanning in parallel
+BATCH_SIZE = 2000
+
+# Files smaller than this are always scanned in a single process, since
+# starting worker processes would take longer than the scan itself
+PARALLEL_THRESHOLD = 16 * 1024 * 1024
+
+# Candidate entry boundaries: '@' at the start of a line
+_BOUNDARY = re.compile(r'^[ \t]*@', re.MULTILINE)
+_TYPE = re.compile(r'\s*@\s*([A-Za-z]+)')
+_HEADER = re.compile(r'\s*@\s*[A-Za-z]+\s*\{\s*([^\s,{}()"#=]+)\s*,')
+_FIELD_NAME = re.compile(r'\s*([^\s=,{}"#]+)\s*=\s*')
+_BARE_VALUE = re.compile(r'[^\s,#{}"]+')
+_VALUE_END = re.compile(r'\s*(,|#|$)\s*')
+_BRACES = re.compile(r'[{}]')
+_BRACES_OR_QUOTE = re.compile(r'[{}"]')
+
+
+class ScannedEntry(NamedTuple):
+    """Citation key and attachments of a BibTeX entry.
+
+    Attributes:
+        citation_key: Citation key of the entry
+        file: Value of the file field, or None if the entry has none
+        digest: Digest of the raw entry text
+    """
+    citation_key: str
+    file: Optional[str]
+    digest: str
+
+    def as_entry(self) -> Dict[str, str]:
+        """Get the entry in the dictionary form produced by bibtexparser.
+
+        Returns:
+            Dict[str, str]: Entry with the 'ID' and, if present, 'file' fields
+        """
+        entry = {'ID': self.citation_key}
+        if self.file is not None:
+            entry['file'] = self.file
+        return entry
+
+
+class _OddEntry(Exception):
+    """Raised for entries that the scanner can't handle itself."""
+
+
+def _strip_after_new_lines(value: str) -> str:
+    """Strip leading whitespace of all but the first line, as bibtexparser does."""
+    lines = value.splitlines()
+    if len(lines) > 1:
+        lines = [lines[0]] + [line.lstrip() for line in lines[1:]]
+    return '\n'.join(lines)
+
+
+def _is_balanced(text: str) -> bool:
+    return text.count('{') == text.count('}')
+
+
+def split_entries(f) -> Iterator[str]:
+    """Split a BibTeX file into the raw text of its top-level @ blocks.
+
+    Text before the first block belongs to no block. Text between blocks is
+    part of the preceding block.
+
+    Args:
+        f: BibTeX file opened in text mode
+
+    Yields:
+        str: Raw text of each block, starting with '@'
+    """
+    buffer = ''
+    started = False
+    for chunk in iter(lambda: f.read(CHUNK_SIZE), ''):
+        buffer += chunk
+        block_start = 0
+        for match in _BOUNDARY.finditer(buffer):
+            boundary = match.end() - 1
+            if not started:
+                started = True
+                block_start = boundary
+            elif boundary > block_start and _is_balanced(buffer[block_start:boundary]):
+                yield buffer[block_start:boundary]
+                block_start = boundary
+        if not started:
+            # Keep only a possibly incomplete last line before the first block
+            buffer = buffer[buffer.rfind('\n') + 1:]
+        else:
+            # The last block may continue in the next chunk
+            buffer = buffer[block_start:]
+    if started and buffer:
+        yield buffer
+
+
+def _find_closing_brace(text: str, start: int) -> int:
+    """Find the brace closing the one at text[start]."""
+    depth = 0
+    for match in _BRACES.finditer(text, start):
+        depth += 1 if match.group() == '{' else -1
+        if depth == 0:
+            return match.start()
+    raise _OddEntry("unbalanced braces")
+
+
+def _find_closing_quote(text: str, start: int) -> int:
+    """Find the quote closing the one at text[start], ignoring quotes inside braces."""
+    depth = 0
+    for match in _BRACES_OR_QUOTE.finditer(text, start + 1):
+        char = match.group()
+        if char == '"' and depth == 0:
+            return match.start()
+        depth += 1 if char == '{' else -1 if char == '}' else 0
+    raise _OddEntry("unterminated quote")
+
+
+def _parse_file_field(raw: str, pos: int, body_end: int) -> Optional[str]:
+    """Extract the file field from the fields of an entry.
+
+    Walks over the top-level fields, skipping their values, so that text
+    looking like a file field inside another field's value is never matched.
+
+    Args:
+        raw: Raw text of the entry
+        pos: Index right after the comma following the citation key
+        body_end: Index of the closing brace of the entry
+
+    Returns:
+        Optional[str]: Value of the file field, or None if the entry has none
+    """
+    file_field = None
+    while True:
+        field = _FIELD_NAME.match(raw, pos, body_end)
+        if not field:
+            if raw[pos:body_end].strip():
+                raise _OddEntry("malformed field")
+            return file_field
+        # A value is one or more parts joined by '#'
+        pos = field.end()
+        parts = []
+        while True:
+            delimiter = raw[pos:pos + 1]
+            if delimiter == '{':
+                value_end = _find_closing_brace(raw, pos)
+            elif delimiter == '"':
+                value_end = _find_closing_quote(raw, pos)
+            else:
+                # String macros and numbers
+                bare = _BARE_VALUE.match(raw, pos, body_end)
+                if not bare:
+                    raise _OddEntry("malformed value")
+                value_end = bare.end() - 1
+                delimiter = None
+            parts.append((pos, value_end, delimiter))
+            separator = _VALUE_END.match(raw, value_end + 1, body_end)
+            if not separator:
+                raise _OddEntry("malformed value")
+            pos = separator.end()
+            if separator.group(1) != '#':
+                break
+        if field.group(1).lower() == 'file':
+            if len(parts) > 1 or parts[0][2] is None:
+                # bibtexparser interpolates macros and concatenations
+                raise _OddEntry("file field with macros")
+            value_start, value_end, _ = parts[0]
+            file_field = _strip_after_new_lines(raw[value_start + 1:value_end])
+
+
+def _parse_with_bibtexparser(raw: str, digest: str, strings: str) -> List[ScannedEntry]:
+    """Parse a raw block with bibtexparser, using the string definitions seen before it."""
+    try:
+        entries = bibtexparser.loads(strings + raw).entries
+    except Exception as e:
+        logger.warning(f"Failed to parse BibTeX block starting with {raw[:40]!r}: {e}")
+        return []
+    return [ScannedEntry(entry['ID'], entry.get('file'), digest) for entry in entries]
+
+
+def scan_entry(raw: str, strings: str = '', hasher: FileHasher = FileHasher()) -> List[ScannedEntry]:
+    """Scan the raw text of one top-level @ block.
+
+    Args:
+        raw: Raw text of the block, as yielded by split_entries
+        strings: Raw text of the @string definitions preceding the block
+        hasher: FileHasher used for the digest of the raw text
+
+    Returns:
+        List[ScannedEntry]: The entries in the block (usually one, none for comments)
+    """
+    digest = hasher.hash_bytes(raw.encode('utf-8'))
+    entry_type = _TYPE.match(raw)
+    if entry_type and entry_type.group(1).lower() not in STANDARD_TYPES:
+        # Comments, string definitions and types ignored by bibtexparser
+        return []
+    header = _HEADER.match(raw)
+    if not header:
+        return _parse_with_bibtexparser(raw, digest, strings)
+
+    try:
+        body_end = _find_closing_brace(raw, raw.index('{', 0, header.end()))
+        if '@' in raw[body_end + 1:]:
+            raise _OddEntry("several entries in one block")
+        file_field = _parse_file_field(raw, header.end(), body_end)
+    except _OddEntry as e:
+        logger.debug(f"Falling back to bibtexparser for {header.group(1)}: {e}")
+        return _parse_with_bibtexparser(raw, digest, strings)
+    return [ScannedEntry(header.group(1), file_field, digest)]
+
+
+def _with_strings(blocks: Iterator[str]) -> Iterator[Tuple[str, str]]:
+    """Pair each block with the @string definitions preceding it.
+
+    Entries whose file field uses a string macro are parsed with bibtexparser,
+    which needs the definitions to interpolate it.
+    """
+    strings = ''
+    for raw in blocks:
+        entry_type = _TYPE.match(raw)
+        if entry_type and entry_type.group(1).lower() == 'string':
+            strings += raw
+        else:
+            yield raw, strings
+
+
+def _scan_batch(batch: List[Tuple[str, str]]) -> List[ScannedEntry]:
+    """Scan a batch of raw blocks in a worker process."""
+    return [entry for raw, strings in batch for entry in scan_entry(raw, strings)]
+
+
+def _batches(blocks: Iterator[Tuple[str, str]]) -> Iterator[List[Tuple[str, str]]]:
+    batch = []
+    for block in blocks:
+        batch.append(block)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def scan_bibtex(
+    path: Union[str, Path],
+    num_workers: int = None,
+    start_method: Optional[str] = None
+) -> Iterator[ScannedEntry]:
+    """Lazily scan the entries of a BibTeX file.
+
+    The calling process may have other threads running (e.g. in watch mode),
+    so the parsing processes are started with workers.get_context instead of
+    being forked from it.
+
+    Args:
+        path: Path to the BibTeX file
+        num_workers: Number of processes used to parse large files in parallel
+            (default: 1, i.e. parse in the calling process)
+        start_method: Start method of the parsing processes (see workers.get_context)
+
+    Yields:
+        ScannedEntry: Entries in the order they appear in the file
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        blocks = _with_strings(split_entries(f))
+        if not num_workers or num_workers <= 1 or os.fstat(f.fileno()).st_size < PARALLEL_THRESHOLD:
+            for raw, strings in blocks:
+                yield from scan_entry(raw, strings)
+            return
+
+        # Keep a bounded number of batches in flight so that memory use
+        # doesn't grow with the size of the file
+        with ProcessPoolExecutor(max_workers=num_workers, mp_context=get_context(start_method)) as executor:
+            pending = deque()
+            for batch in _batches(blocks):
+                pending.append(executor.submit(_scan_batch, batch))
+                if len(pending) >= 2 * num_workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
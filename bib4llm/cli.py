@@ -1,12 +1,15 @@
 import argparse
 import logging
 import shutil
-import multiprocessing
 import sys
 from datetime import datetime
 from pathlib import Path
+from .fingerprint import FileHasher, available_algorithms, DEFAULT_ALGORITHM
 from .process_bibliography import BibliographyProcessor, DirectoryProcessor
-from .watcher import watch_bibtex, watch_pdf, watch_directory
+from .store import ConversionStore, DEFAULT_MAX_SIZE, DEFAULT_SPLIT_PAGES, default_cache_dir, parse_size
+from .watcher import DEFAULT_QUIET_PERIOD, watch_bibtex, watch_pdf, watch_directory
+from .resources import default_memory_budget, parse_processes
+from .workers import DEFAULT_MAX_TASKS, DEFAULT_START_METHOD, DEFAULT_TASK_TIMEOUT, START_METHODS, WorkerLimits
 
 # Create logger at module level
 logger = logging.getLogger(__name__)
@@ -65,9 +68,88 @@ def main():
     
     subparsers = parser.add_subparsers(dest='command', required=True)
 
+    # Options shared by the convert and watch commands
+    conversion_parser = argparse.ArgumentParser(add_help=False)
+    conversion_options = conversion_parser.add_argument_group("conversion options")
+    conversion_options.add_argument(
+        '--paranoid',
+        action='store_true',
+        help="Hash all attachments instead of trusting stored hashes of files with unchanged size, mtime and inode"
+    )
+    conversion_options.add_argument(
+        '--hash-algorithm',
+        choices=available_algorithms(),
+        default=DEFAULT_ALGORITHM,
+        help="Hash algorithm used to detect changed attachments (default: %(default)s). "
+             "Switching algorithms causes all entries to be reprocessed once"
+    )
+    conversion_options.add_argument(
+        '--sampled-hash',
+        action='store_true',
+        help="Only hash the size and the first, middle and last blocks of each attachment (faster, less thorough)"
+    )
+    conversion_options.add_argument(
+        '--cache-dir',
+        type=Path,
+        default=None,
+        help="Directory of the conversion cache shared by all projects "
+             "(default: $BIB4LLM_CACHE_DIR or ~/.cache/bib4llm)"
+    )
+    conversion_options.add_argument(
+        '--cache-size',
+        type=parse_size,
+        default=DEFAULT_MAX_SIZE,
+        help="Maximum size of the conversion cache, e.g. 500M or 20G; least recently used "
+             "conversions are evicted beyond it (default: 10G)"
+    )
+    conversion_options.add_argument(
+        '--split-pages',
+        type=int,
+        default=DEFAULT_SPLIT_PAGES,
+        help="Convert PDFs with more pages in ranges of this many pages, spread over the "
+             "processes (default: %(default)s, 0 to disable)"
+    )
+    conversion_options.add_argument(
+        '--timeout',
+        type=float,
+        default=DEFAULT_TASK_TIMEOUT,
+        help="Seconds after which a conversion is aborted and its entry recorded as failed "
+             "(default: %(default)s, 0 to disable)"
+    )
+    conversion_options.add_argument(
+        '--memory-limit',
+        type=parse_size,
+        default=None,
+        help="Address-space limit of each worker process, e.g. 4G; conversions exceeding it "
+             "fail instead of exhausting the memory of the machine (default: no limit)"
+    )
+    conversion_options.add_argument(
+        '--max-memory',
+        type=parse_size,
+        default=None,
+        help="Memory budget of all worker processes, e.g. 16G; conversions are only started while "
+             "their estimated memory fits into it (default: 80%% of the total memory, bounded by the cgroup "
+             "memory limit; 0 to disable)"
+    )
+    conversion_options.add_argument(
+        '--max-tasks-per-worker',
+        type=int,
+        default=DEFAULT_MAX_TASKS,
+        help="Replace worker processes after this many tasks to release memory "
+             "(default: %(default)s, 0 to keep workers)"
+    )
+    conversion_options.add_argument(
+        '--start-method',
+        choices=START_METHODS,
+        default=DEFAULT_START_METHOD,
+        help="How worker processes are started; 'forkserver' imports the conversion libraries once "
+             "and forks workers from a server process (default: %(default)s)"
+    )
+
     # Convert command
     convert_parser = subparsers.add_parser(
         'convert',
+        parents=[conversion_parser],
         help="Convert BibTeX file, PDF file, or directory once"
     )
     convert_parser.add_argument(
@@ -82,9 +164,11 @@ def main():
     )
     convert_parser.add_argument(
         '--processes', '-p',
-        type=int,
-        default=multiprocessing.cpu_count(),
-        help="Number of parallel processes to use (default: number of CPU cores)"
+        type=parse_processes,
+        default=None,
+        help="Number of parallel processes to use, or 'auto' to pick the number with the best "
+             "throughput on the first documents (default: number of CPUs available to the process, "
+             "considering CPU affinity, cgroup CPU quotas and available memory)"
     )
     convert_parser.add_argument(
         '--dry-run', '-n',
@@ -110,6 +194,7 @@ def main():
     # Watch command
     watch_parser = subparsers.add_parser(
         'watch',
+        parents=[conversion_parser],
         help="Watch BibTeX file, PDF file, or directory for changes and convert automatically"
     )
     watch_parser.add_argument(
@@ -119,9 +204,11 @@ def main():
     )
     watch_parser.add_argument(
         '--processes', '-p',
-        type=int,
-        default=multiprocessing.cpu_count(),
-        help="Number of parallel processes to use (default: number of CPU cores)"
+        type=parse_processes,
+        default=None,
+        help="Number of parallel processes to use, or 'auto' to pick the number with the best "
+             "throughput on the first documents (default: number of CPUs available to the process, "
+             "considering CPU affinity, cgroup CPU quotas and available memory)"
     )
     watch_parser.add_argument(
         '--quiet', '-q',
@@ -138,6 +225,13 @@ def main():
         action='store_true',
         help="Disable recursive watching of directories (only applicable if input is a directory)"
     )
+    watch_parser.add_argument(
+        '--quiet-period',
+        type=float,
+        default=DEFAULT_QUIET_PERIOD,
+        help="Seconds without further changes after which a changed file is processed "
+             "(default: %(default)s)"
+    )
 
     # Clean command
     clean_parser = subparsers.add_parser(
@@ -155,6 +249,27 @@ def main():
         help="Show what would be removed without actually doing it"
     )
 
+    # Verify command
+    verify_parser = subparsers.add_parser(
+        'verify',
+        help="Verify generated files against the recorded output manifests"
+    )
+    verify_parser.add_argument(
+        'input_path',
+        type=Path,
+        help="Path to the BibTeX file, PDF file, or directory whose generated data should be verified"
+    )
+    verify_parser.add_argument(
+        '--dry-run', '-n',
+        action='store_true',
+        help="Only report modified outputs, without marking the affected entries for reconversion"
+    )
+    verify_parser.add_argument(
+        '--no-recursive', '-R',
+        action='store_true',
+        help="Don't verify BibTeX files in subdirectories (only applicable if input is a directory)"
+    )
+
     args = parser.parse_args()
     
     # Validate input path
@@ -175,45 +290,87 @@ def main():
     command_line = ' '.join(sys.argv)
     logger.debug(f"Running command: {command_line}")
 
+    if args.command in ('convert', 'watch'):
+        hasher = FileHasher(args.hash_algorithm, sampled=args.sampled_hash)
+        store = ConversionStore(
+            args.cache_dir or default_cache_dir(), max_size=args.cache_size, split_pages=args.split_pages
+        )
+        limits = WorkerLimits(
+            task_timeout=args.timeout or None,
+            memory_limit=args.memory_limit,
+            max_tasks=args.max_tasks_per_worker or None,
+            max_memory=default_memory_budget() if args.max_memory is None else args.max_memory or None,
+            start_method=args.start_method
+        )
+
     # Determine input type and call appropriate functions
     if input_path.is_dir():
         # Handle directory
         if args.command == 'convert':
             if args.dry_run:
-                processor = DirectoryProcessor(input_path, dry_run=True, quiet=args.quiet)
+                processor = DirectoryProcessor(
+                    input_path, dry_run=True, quiet=args.quiet, hasher=hasher, store=store
+                )
                 processor.process_directory(
                     recursive=not args.no_recursive,
                     force=args.force if hasattr(args, 'force') else False,
-                    num_processes=args.processes
+                    num_processes=args.processes,
+                    paranoid=args.paranoid
                 )
             else:
-                processor = DirectoryProcessor(input_path, quiet=args.quiet)
+                processor = DirectoryProcessor(
+                    input_path, quiet=args.quiet, hasher=hasher, store=store, limits=limits
+                )
                 processor.process_directory(
                     recursive=not args.no_recursive,
                     force=args.force if hasattr(args, 'force') else False,
-                    num_processes=args.processes
+                    num_processes=args.processes,
+                    paranoid=args.paranoid
                 )
         elif args.command == 'watch':
             watch_directory(
                 input_path,
                 recursive=not args.no_recursive,
-                num_processes=args.processes
+                num_processes=args.processes,
+                paranoid=args.paranoid,
+                hasher=hasher,
+                store=store,
+                limits=limits,
+                quiet_period=args.quiet_period
             )
         elif args.command == 'clean':
             logger.error("Clean command is not supported for directories")
             sys.exit(1)
+        elif args.command == 'verify':
+            # Dry-run mode keeps the processor from creating an output directory
+            processor = DirectoryProcessor(input_path, dry_run=True, quiet=True)
+            if processor.verify(invalidate=not args.dry_run, recursive=not args.no_recursive):
+                sys.exit(1)
             
     elif BibliographyProcessor.is_pdf_file(input_path):
         # Handle PDF file
         if args.command == 'convert':
             if args.dry_run:
-                with BibliographyProcessor(input_path, dry_run=True, quiet=args.quiet) as processor:
-                    processor.process_all(force=args.force if hasattr(args, 'force') else False)
+                with BibliographyProcessor(
+                    input_path, dry_run=True, quiet=args.quiet, hasher=hasher, store=store
+                ) as processor:
+                    processor.process_all(
+                        force=args.force if hasattr(args, 'force') else False,
+                        paranoid=args.paranoid
+                    )
             else:
-                with BibliographyProcessor(input_path, quiet=args.quiet) as processor:
-                    processor.process_all(force=args.force if hasattr(args, 'force') else False)
+                with BibliographyProcessor(
+                    input_path, quiet=args.quiet, hasher=hasher, store=store, limits=limits
+                ) as processor:
+                    processor.process_all(
+                        force=args.force if hasattr(args, 'force') else False,
+                        paranoid=args.paranoid
+                    )
         elif args.command == 'watch':
-            watch_pdf(input_path, num_processes=args.processes)
+            watch_pdf(
+                input_path, num_processes=args.processes, paranoid=args.paranoid,
+                hasher=hasher, store=store, limits=limits, quiet_period=args.quiet_period
+            )
         elif args.command == 'clean':
             output_dir = BibliographyProcessor.get_output_dir(input_path)
             if output_dir.exists():
@@ -224,24 +381,38 @@ def main():
                     shutil.rmtree(output_dir)
             else:
                 logging.info(f"No output directory found for {input_path}")
+        elif args.command == 'verify':
+            # Dry-run mode keeps the processor from creating an output directory
+            processor = BibliographyProcessor(input_path, dry_run=True, quiet=True)
+            if processor.verify(invalidate=not args.dry_run):
+                sys.exit(1)
                 
     elif input_path.suffix.lower() in ['.bib', '.bibtex']:
         # Handle BibTeX file
         if args.command == 'convert':
             if args.dry_run:
-                with BibliographyProcessor(input_path, dry_run=True, quiet=args.quiet) as processor:
+                with BibliographyProcessor(
+                    input_path, dry_run=True, quiet=args.quiet, hasher=hasher, store=store
+                ) as processor:
                     processor.process_all(
                         force=args.force if hasattr(args, 'force') else False,
-                        num_processes=args.processes
+                        num_processes=args.processes,
+                        paranoid=args.paranoid
                     )
             else:
-                with BibliographyProcessor(input_path, quiet=args.quiet) as processor:
+                with BibliographyProcessor(
+                    input_path, quiet=args.quiet, hasher=hasher, store=store, limits=limits
+                ) as processor:
                     processor.process_all(
                         force=args.force if hasattr(args, 'force') else False,
-                        num_processes=args.processes
+                        num_processes=args.processes,
+                        paranoid=args.paranoid
                     )
         elif args.command == 'watch':
-            watch_bibtex(input_path, num_processes=args.processes)
+            watch_bibtex(
+                input_path, num_processes=args.processes, paranoid=args.paranoid,
+                hasher=hasher, store=store, limits=limits, quiet_period=args.quiet_period
+            )
         elif args.command == 'clean':
             output_dir = BibliographyProcessor.get_output_dir(input_path)
             if output_dir.exists():
@@ -252,6 +423,11 @@ def main():
                     shutil.rmtree(output_dir)
             else:
                 logging.info(f"No output directory found for {input_path}")
+        elif args.command == 'verify':
+            # Dry-run mode keeps the processor from creating an output directory
+            processor = BibliographyProcessor(input_path, dry_run=True, quiet=True)
+            if processor.verify(invalidate=not args.dry_run):
+                sys.exit(1)
     else:
         logger.error(f"Unsupported file type: {input_path}")
         sys.exit(1)
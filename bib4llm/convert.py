@@ -0,0 +1,277 @@
+"""Conversion of PDF files to markdown with PyMuPDF4LLM."""
+
+import json
+import logging
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import pymupdf
+import pymupdf4llm
+
+from .fingerprint import FileHasher
+
+# Create logger
+logger = logging.getLogger(__name__)
+
+# Options passed to pymupdf4llm.to_markdown. They are part of the conversion
+# cache key, so changing them invalidates all cached conversions.
+CONVERTER_OPTIONS = {"write_images": True}
+
+# Indirect reference to a PDF object, e.g. '12 0 R'
+_REFERENCE = re.compile(r"\b(\d+) \d+ R\b")
+
+
+@dataclass
+class Conversion:
+    """Markdown of the converted pages of a PDF.
+
+    Attributes:
+        pages: Markdown of each converted page, in page order
+        headers: Header levels assigned to font sizes (see header_levels)
+        warning_count: Number of MuPDF warnings emitted during conversion
+    """
+    pages: List[str]
+    headers: Dict
+    warning_count: int = 0
+
+    @property
+    def markdown(self) -> str:
+        """Markdown of all converted pages."""
+        return ''.join(self.pages)
+
+
+def converter_signature() -> str:
+    """Identify the converter versions and options.
+
+    Conversions made with a different signature may differ and must not be reused.
+
+    Returns:
+        str: Identifier such as 'pymupdf4llm-0.0.17-pymupdf-1.25.5-<options hash>'
+    """
+    options = json.dumps(CONVERTER_OPTIONS, sort_keys=True).encode()
+    return (
+        f"pymupdf4llm-{pymupdf4llm.version}-pymupdf-{pymupdf.VersionBind}-"
+        f"{FileHasher().hash_bytes(options)[:8]}"
+    )
+
+
+def collect_mupdf_warnings() -> list:
+    """Collect the MuPDF warnings emitted since the last reset.
+
+    Returns:
+        list: Warning messages, one string per message
+    """
+    warnings = pymupdf.TOOLS.mupdf_warnings()
+    if not warnings:
+        return []
+
+    # Combine characters into complete messages
+    warning_messages = []
+    current_message = []
+    for char in warnings:
+        if char == '\n':
+            if current_message:
+                warning_messages.append(''.join(current_message))
+                current_message = []
+        else:
+            current_message.append(char)
+    if current_message:
+        warning_messages.append(''.join(current_message))
+    return warning_messages
+
+
+def empty_mupdf_store():
+    """Free the resources cached in the MuPDF store of the current process.
+
+    MuPDF keeps decoded fonts and images in a store of up to 256 MiB per
+    process, which PyMuPDF doesn't allow to resize. Worker processes empty it
+    after each task, so that their memory is bounded by the task they run.
+    """
+    pymupdf.TOOLS.store_shrink(100)
+
+
+def warm_up_converter():
+    """Initialize the conversion libraries in the current process.
+
+    Converts a one-page document in memory, so that the imports and the
+    lazy initialization of pymupdf and pymupdf4llm don't delay the first
+    conversion of a worker process.
+    """
+    with pymupdf.open() as doc:
+        doc.new_page().insert_text((72, 72), "bib4llm")
+        pymupdf4llm.to_markdown(doc, show_progress=False)
+    empty_mupdf_store()
+
+
+def page_count(pdf_path: Path) -> int:
+    """Count the pages of a PDF file.
+
+    Args:
+        pdf_path: Path to the PDF file
+
+    Returns:
+        int: Number of pages
+    """
+    with pymupdf.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def identify_headers(pdf_path: Path) -> pymupdf4llm.IdentifyHeaders:
+    """Determine which font sizes of a PDF are converted to markdown headers.
+
+    Requires extracting the text of all pages.
+
+    Args:
+        pdf_path: Path to the PDF file
+
+    Returns:
+        pymupdf4llm.IdentifyHeaders: Header levels of the whole document
+    """
+    return pymupdf4llm.IdentifyHeaders(str(pdf_path))
+
+
+def header_levels(headers: pymupdf4llm.IdentifyHeaders) -> Dict:
+    """Summarize header levels in a form that can be stored as JSON and compared.
+
+    Args:
+        headers: Header levels of a document
+
+    Returns:
+        Dict: Body text font size limit and the header prefix of larger font sizes
+    """
+    return {
+        "body_limit": headers.body_limit,
+        "sizes": {str(size): prefix for size, prefix in sorted(headers.header_id.items())}
+    }
+
+
+def pdf_to_markdown(
+    pdf_path: Path,
+    image_dir: Path,
+    pages: Optional[Sequence[int]] = None,
+    headers: Optional[pymupdf4llm.IdentifyHeaders] = None
+) -> Conversion:
+    """Convert a PDF file to markdown, writing extracted images to a directory.
+
+    Images are named after the PDF file (with spaces replaced by dashes) and
+    the page they are on, and referenced from the markdown by their path
+    inside image_dir. The markdown of a document is the concatenation of the
+    markdown of its pages, and header levels are determined from the font
+    sizes of the whole document, so converting some of the pages gives the
+    same markdown for them as converting all pages.
+
+    Args:
+        pdf_path: Path to the PDF file
+        image_dir: Directory to write the extracted images to
+        pages: 0-based numbers of the pages to convert (default: all pages)
+        headers: Header levels of the document, if already known (see identify_headers)
+
+    Returns:
+        Conversion: Markdown of the converted pages
+    """
+    # Reset MuPDF warnings before processing
+    pymupdf.TOOLS.reset_mupdf_warnings()
+
+    if headers is None:
+        headers = identify_headers(pdf_path)
+    chunks = pymupdf4llm.to_markdown(
+        str(pdf_path),
+        pages=list(pages) if pages is not None else None,
+        hdr_info=headers,
+        page_chunks=True,
+        image_path=str(image_dir),
+        show_progress=False,  # Disable pymupdf4llm progress bar
+        **CONVERTER_OPTIONS
+    )
+
+    # Check for warnings and write them to log
+    warning_messages = collect_mupdf_warnings()
+    if warning_messages:
+        logger.debug(f"MuPDF warnings for '{pdf_path.name}': {';'.join(warning_messages)}")
+    return Conversion([chunk["text"] for chunk in chunks], header_levels(headers), len(warning_messages))
+
+
+class _ObjectDigests:
+    """Digests of PDF objects and everything they reference.
+
+    References are replaced by the digest of the referenced object, so the
+    digests don't depend on object numbers, which change when a PDF is
+    rewritten. Each object is hashed once per document.
+    """
+
+    def __init__(self, doc: pymupdf.Document, hasher: FileHasher):
+        self.doc = doc
+        self.hasher = hasher
+        self.digests: Dict[int, str] = {}
+        self.active = set()
+
+    def digest(self, xref: int) -> str:
+        """Get the digest of an object and the objects it references."""
+        if xref in self.digests:
+            return self.digests[xref]
+        if xref in self.active:
+            # Reference cycle
+            return "cycle"
+        self.active.add(xref)
+        try:
+            data = self.serialize(self.doc.xref_object(xref, compressed=True)).encode()
+            if self.doc.xref_is_stream(xref):
+                data += self.doc.xref_stream_raw(xref)
+        except Exception:
+            data = b"missing"
+        finally:
+            self.active.discard(xref)
+        self.digests[xref] = self.hasher.hash_bytes(data)
+        return self.digests[xref]
+
+    def serialize(self, source: str) -> str:
+        """Replace the references in the source of an object by the digests of the referenced objects."""
+        return _REFERENCE.sub(lambda match: f"<{self.digest(int(match.group(1)))}>", source)
+
+
+def _page_resources(doc: pymupdf.Document, page: pymupdf.Page) -> str:
+    """Get the source of the resources of a page, which may be inherited from the page tree."""
+    xref = page.xref
+    while xref:
+        kind, value = doc.xref_get_key(xref, "Resources")
+        if kind != "null":
+            return value
+        kind, parent = doc.xref_get_key(xref, "Parent")
+        xref = int(parent.split()[0]) if kind == "xref" else 0
+    return ""
+
+
+def page_fingerprints(pdf_path: Path, hasher: Optional[FileHasher] = None) -> List[str]:
+    """Fingerprint the content of each page of a PDF.
+
+    A fingerprint covers what the converter reads from a page: its content
+    streams, its resources (fonts, images, ...), its boxes and rotation, and
+    its links. Other annotations (highlights, notes, ...) and the document
+    metadata are not covered, so adding highlights to a PDF doesn't change
+    the fingerprints of its pages.
+
+    Args:
+        pdf_path: Path to the PDF file
+        hasher: FileHasher whose algorithm is used for the fingerprints (default: SHA-256)
+
+    Returns:
+        List[str]: Fingerprint of each page, in page order
+    """
+    hasher = hasher or FileHasher()
+    with pymupdf.open(pdf_path) as doc:
+        objects = _ObjectDigests(doc, hasher)
+        fingerprints = []
+        for page in doc:
+            layout = (tuple(page.mediabox), tuple(page.cropbox), page.rotation)
+            links = [
+                (link.get("kind"), tuple(link["from"]), link.get("uri"), link.get("page"))
+                for link in page.get_links()
+            ]
+            fingerprints.append(hasher.hash_bytes(b"\0".join((
+                repr((layout, links)).encode(),
+                page.read_contents(),
+                objects.serialize(_page_resources(doc, page)).encode()
+            ))))
+        return fingerprints
@@ -0,0 +1,210 @@
+"""File fingerprinting used for change tracking.
+
+All hashing of attachments and output directories goes through this module.
+Files are hashed in fixed-size chunks so that memory use does not grow with the
+size of the file, which matters when many worker processes hash large scanned
+PDFs at the same time.
+
+Supported algorithms:
+- sha256 (default)
+- blake2b
+- xxh3 (non-cryptographic, requires the optional ``xxhash`` package)
+
+A "sampled" mode hashes only the file size plus a block from the head, middle
+and tail of the file. It is much cheaper for large files but will miss changes
+that don't touch the sampled blocks or the file size.
+"""
+
+import hashlib
+import logging
+import os
+import traceback
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Union
+
+try:
+    import xxhash
+except ImportError:  # optional dependency
+    xxhash = None
+
+# Create logger
+logger = logging.getLogger(__name__)
+
+# Size of the chunks read when hashing full files
+CHUNK_SIZE = 1024 * 1024
+
+# Size of each of the head, middle and tail blocks hashed in sampled mode
+SAMPLE_BLOCK_SIZE = 64 * 1024
+
+DEFAULT_ALGORITHM = 'sha256'
+
+
+def available_algorithms() -> List[str]:
+    """Get the hash algorithms that can be used in this environment.
+
+    Returns:
+        List[str]: Names of the supported algorithms
+    """
+    algorithms = ['sha256', 'blake2b']
+    if xxhash is not None:
+        algorithms.append('xxh3')
+    return algorithms
+
+
+def _new_hasher(algorithm: str):
+    """Create a new hash object for the given algorithm.
+
+    Args:
+        algorithm: Name of the algorithm (see available_algorithms)
+
+    Returns:
+        A hash object with update() and hexdigest() methods
+    """
+    if algorithm == 'sha256':
+        return hashlib.sha256()
+    if algorithm == 'blake2b':
+        return hashlib.blake2b()
+    if algorithm == 'xxh3':
+        if xxhash is None:
+            raise ValueError("The xxh3 hash algorithm requires the 'xxhash' package")
+        return xxhash.xxh3_128()
+    raise ValueError(f"Unsupported hash algorithm: {algorithm}")
+
+
+@dataclass(frozen=True)
+class FileHasher:
+    """Hashes files with a configurable algorithm.
+
+    Instances are small and picklable so they can be passed to worker processes.
+
+    Attributes:
+        algorithm: Name of the hash algorithm (see available_algorithms)
+        sampled: Whether to hash only the size and head/middle/tail blocks of files
+    """
+    algorithm: str = DEFAULT_ALGORITHM
+    sampled: bool = False
+
+    def __post_init__(self):
+        # Fail early on unsupported algorithms instead of in a worker process
+        _new_hasher(self.algorithm)
+
+    @classmethod
+    def from_name(cls, name: str) -> 'FileHasher':
+        """Create a FileHasher from the identifier recorded in the state database.
+
+        Args:
+            name: Identifier as returned by the name property
+
+        Returns:
+            FileHasher: Hasher using the same scheme
+        """
+        if name.endswith('-sampled'):
+            return cls(name[:-len('-sampled')], sampled=True)
+        return cls(name)
+
+    @property
+    def name(self) -> str:
+        """Identifier of the fingerprinting scheme, as recorded in the state database.
+
+        Hashes computed with different schemes are not comparable, so entries
+        recorded under another name must be treated as changed.
+        """
+        return f"{self.algorithm}-sampled" if self.sampled else self.algorithm
+
+    def hash_file(self, filepath: Union[str, Path]) -> str:
+        """Compute the hash of a file.
+
+        Args:
+            filepath: Path to the file to hash
+
+        Returns:
+            str: Hex digest of the file's hash, or empty string on error
+        """
+        try:
+            hasher = _new_hasher(self.algorithm)
+            with open(filepath, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if self.sampled and size > 3 * SAMPLE_BLOCK_SIZE:
+                    hasher.update(str(size).encode())
+                    for offset in (0, (size - SAMPLE_BLOCK_SIZE) // 2, size - SAMPLE_BLOCK_SIZE):
+                        f.seek(offset)
+                        hasher.update(f.read(SAMPLE_BLOCK_SIZE))
+                else:
+                    _update_from_file(hasher, f)
+            return hasher.hexdigest()
+        except Exception as e:
+            logger.error(f"Failed to compute hash for {filepath}: {e}\n{traceback.format_exc()}")
+            return ""
+
+    def hash_bytes(self, data: bytes) -> str:
+        """Compute the hash of an in-memory byte string.
+
+        Args:
+            data: Bytes to hash
+
+        Returns:
+            str: Hex digest of the data's hash
+        """
+        hasher = _new_hasher(self.algorithm)
+        hasher.update(data)
+        return hasher.hexdigest()
+
+    def hash_directory(self, directory: Path) -> str:
+        """Compute a hash of a directory's contents.
+
+        This function hashes:
+        - The relative paths of all files
+        - For regular files: their contents
+        - For symbolic links: their target paths (not the linked content)
+
+        Output files are always hashed in full, even in sampled mode.
+
+        Args:
+            directory: Path to the directory to hash
+
+        Returns:
+            str: Hex digest of the directory's hash, or empty string if directory doesn't exist
+        """
+        if not directory.exists():
+            return ""
+
+        # Get all files in directory, including symlinks
+        files = sorted(f for f in directory.glob('**/*') if f.is_file() or f.is_symlink())
+        hasher = _new_hasher(self.algorithm)
+
+        for file_path in files:
+            try:
+                # Add relative path to hash
+                rel_path = file_path.relative_to(directory)
+                hasher.update(str(rel_path).encode())
+
+                if file_path.is_symlink():
+                    # For symlinks, hash only the target path string
+                    # This ensures the hash only changes if the symlink target changes
+                    target_path = os.readlink(file_path)
+                    hasher.update(str(target_path).encode())
+                else:
+                    # For regular files, hash the contents
+                    with open(file_path, 'rb') as f:
+                        _update_from_file(hasher, f)
+            except Exception as e:
+                logger.error(f"Failed to hash file {file_path}: {e}\n{traceback.format_exc()}")
+
+        return hasher.hexdigest()
+
+
+def _update_from_file(hasher, f):
+    """Feed the remaining contents of an open binary file to a hash object in fixed-size chunks.
+
+    Args:
+        hasher: Hash object to update
+        f: File object opened in binary mode
+    """
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    while True:
+        n = f.readinto(buffer)
+        if not n:
+            break
+        hasher.update(view[:n])
@@ -0,0 +1,156 @@
+"""Output manifests for converted entries.
+
+A manifest records every file in an entry's output directory together with its
+size, modification time and hash. It is written once, right after an entry has
+been converted. Later runs check the output directory against the manifest
+using only ``lstat`` calls, so unchanged outputs are never read again. Full
+content verification is done explicitly by ``bib4llm verify``.
+
+Manifests are dictionaries mapping the relative (POSIX-style) path of each
+output file to ``[size, mtime_ns, hash]``. For symbolic links, the size and
+mtime are those of the link itself and the hash is the hash of the link target
+path, so the linked content is never read.
+"""
+
+import json
+import logging
+import os
+import traceback
+from pathlib import Path
+from typing import Dict, List
+
+from .fingerprint import FileHasher
+
+# Create logger
+logger = logging.getLogger(__name__)
+
+Manifest = Dict[str, List]
+
+
+def _scan_directory(directory: Path) -> Dict[str, os.stat_result]:
+    """List all files and symlinks below a directory with their lstat results.
+
+    Args:
+        directory: Directory to scan
+
+    Returns:
+        Dict mapping relative POSIX paths to lstat results
+    """
+    files = {}
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = Path(root) / filename
+            try:
+                files[path.relative_to(directory).as_posix()] = os.lstat(path)
+            except OSError as e:
+                logger.debug(f"Failed to stat {path}: {e}")
+    return files
+
+
+def _hash_output_file(path: Path, st: os.stat_result, hasher: FileHasher) -> str:
+    """Hash a single output file, or the target path if it is a symlink.
+
+    Args:
+        path: Path to the output file
+        st: lstat result of the file
+        hasher: FileHasher used to compute the hash
+
+    Returns:
+        str: Hex digest, or empty string on error
+    """
+    if os.path.islink(path):
+        return hasher.hash_bytes(os.readlink(path).encode())
+    # Output files are always hashed in full, even if the hasher samples attachments
+    return FileHasher(hasher.algorithm).hash_file(path)
+
+
+def build_manifest(directory: Path, hasher: FileHasher) -> Manifest:
+    """Build the manifest of an output directory, hashing every file once.
+
+    Args:
+        directory: Output directory of an entry
+        hasher: FileHasher used to compute the hashes
+
+    Returns:
+        Manifest: Mapping of relative paths to [size, mtime_ns, hash]
+    """
+    if not directory.exists():
+        return {}
+
+    manifest = {}
+    for rel_path, st in sorted(_scan_directory(directory).items()):
+        try:
+            file_hash = _hash_output_file(directory / rel_path, st, hasher)
+        except Exception as e:
+            logger.error(f"Failed to hash file {directory / rel_path}: {e}\n{traceback.format_exc()}")
+            file_hash = ""
+        manifest[rel_path] = [st.st_size, st.st_mtime_ns, file_hash]
+    return manifest
+
+
+def manifest_digest(manifest: Manifest, hasher: FileHasher) -> str:
+    """Compute a single digest summarizing a manifest.
+
+    The digest covers the relative paths and hashes of all files, so it changes
+    whenever the output content changes. It is computed without any file I/O.
+
+    Args:
+        manifest: Manifest to summarize
+        hasher: FileHasher used to compute the digest
+
+    Returns:
+        str: Hex digest, or empty string for an empty manifest
+    """
+    if not manifest:
+        return ""
+    summary = [[rel_path, record[2]] for rel_path, record in sorted(manifest.items())]
+    return hasher.hash_bytes(json.dumps(summary).encode())
+
+
+def manifest_matches(directory: Path, manifest: Manifest) -> bool:
+    """Check an output directory against its manifest using only lstat.
+
+    Args:
+        directory: Output directory of an entry
+        manifest: Manifest recorded when the entry was converted
+
+    Returns:
+        bool: True if the same files exist with the same sizes and mtimes
+    """
+    if not directory.exists():
+        return not manifest
+
+    files = _scan_directory(directory)
+    if files.keys() != manifest.keys():
+        return False
+    return all(
+        [st.st_size, st.st_mtime_ns] == manifest[rel_path][:2]
+        for rel_path, st in files.items()
+    )
+
+
+def verify_manifest(directory: Path, manifest: Manifest, hasher: FileHasher) -> List[str]:
+    """Verify the content of an output directory against its manifest.
+
+    Unlike manifest_matches, this reads and hashes every output file.
+
+    Args:
+        directory: Output directory of an entry
+        manifest: Manifest recorded when the entry was converted
+        hasher: FileHasher the manifest was built with
+
+    Returns:
+        List[str]: Human-readable descriptions of all mismatches (empty if the output is intact)
+    """
+    problems = []
+    files = _scan_directory(directory) if directory.exists() else {}
+
+    for rel_path in sorted(manifest.keys() - files.keys()):
+        problems.append(f"missing: {rel_path}")
+    for rel_path in sorted(files.keys() - manifest.keys()):
+        problems.append(f"unexpected: {rel_path}")
+    for rel_path in sorted(files.keys() & manifest.keys()):
+        file_hash = _hash_output_file(directory / rel_path, files[rel_path], hasher)
+        if file_hash != manifest[rel_path][2]:
+            problems.append(f"modified: {rel_path}")
+    return problems
@@ -1,39 +1,101 @@
 import logging
-import json
 import traceback
-import multiprocessing
+import itertools
 import os
 import mimetypes
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
 from pathlib import Path
-import hashlib
 import sqlite3
-import bibtexparser
-import pymupdf4llm
-import pymupdf
 import platform
-from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple, Union
-from tqdm.contrib.concurrent import process_map
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from tqdm import tqdm
+from .bibscan import ScannedEntry, scan_bibtex
+from .convert import empty_mupdf_store
+from .fingerprint import FileHasher
+from .store import ConversionStore, convert_pdf
+from .manifest import Manifest, build_manifest, manifest_digest, manifest_matches, verify_manifest
+from .state import DB_NAME, ItemState, StateDB
+from .resources import AUTO_PROCESSES, worker_count
+from .schedule import Calibration, estimate, estimate_makespan, plan_batches, windows
+from .workers import WorkerLimits, WorkerPool, peak_memory, reset_peak_memory
 
 # Create logger
 logger = logging.getLogger(__name__)
 
+# Results are written to the state database once this many are pending,
+# or when the oldest pending result is older than RECORD_INTERVAL seconds
+RECORD_BATCH_SIZE = 50
+RECORD_INTERVAL = 2.0
+
 @dataclass
 class ProcessingResult:
     """Result of processing a bibliography entry.
     
     Attributes:
         citation_key: The citation key from the bibliography entry
-        file_hashes: Dictionary mapping file paths to their SHA-256 hashes
-        dir_hash: Hash of the directory contents (excluding linked file contents)
+        file_hashes: Dictionary mapping file paths to their hashes
+        dir_hash: Digest of the output manifest (see manifest_digest)
         success: Whether the processing was successful
         mupdf_warning_count: Number of MuPDF warnings encountered during processing
+        file_stats: Dictionary mapping file paths to their stat signatures
+            (see get_file_stat_signature), taken when the hashes were computed
+        manifest: Manifest of the output directory, recorded after conversion
+        cache_hits: Number of PDFs whose conversion was taken from the conversion cache
+        cache_misses: Number of PDFs that had to be converted
+        error: Reason of the failure if processing failed, e.g. a timeout of the worker process
+        peak_memory: Peak memory of the worker process while processing the entry, in bytes
     """
     citation_key: str
     file_hashes: Dict[str, str]
     dir_hash: str
     success: bool
     mupdf_warning_count: int = 0
+    file_stats: Dict[str, List[int]] = field(default_factory=dict)
+    manifest: Manifest = field(default_factory=dict)
+    cache_hits: int = 0
+    cache_misses: int = 0
+    error: str = ""
+    peak_memory: int = 0
+
+@dataclass
+class ChangeScan:
+    """Statistics collected while determining which entries need processing.
+    
+    Attributes:
+        missing_files: Number of referenced files that could not be found
+        unchanged: Number of items found to be unchanged
+        duration: Wall-clock time spent on change detection, in seconds
+    """
+    missing_files: int = 0
+    unchanged: int = 0
+    duration: float = 0.0
+
+def split_file_field(file_field: str) -> List[str]:
+    """Split the file field of a BibTeX entry into the paths of its attachments.
+    
+    Handles both standard file paths and Zotero-style file fields
+    (description:filepath format).
+    
+    Args:
+        file_field: The file field string from bibtex entry
+        
+    Returns:
+        List[str]: Paths of the attachments, whether they exist or not
+    """
+    file_paths = []
+    for f in (file_field or '').split(';'):
+        if ':' in f:
+            # Handle Zotero-style file fields (description:filepath)
+            _, f = f.split(':', 1)
+        f = f.strip()
+        if f:
+            file_paths.append(f)
+    return file_paths
 
 def convert_to_extended_path(path: Path) -> Path:
     """Convert a path to Windows extended-length format if needed.
@@ -78,19 +140,43 @@ def validate_windows_path(path: Path) -> Optional[str]:
     
     return None
 
+def get_file_stat_signature(filepath: Union[str, Path]) -> Optional[List[int]]:
+    """Get the stat signature of a file used for cheap change detection.
+    
+    The signature consists of (size, mtime_ns, inode, device). If all of these
+    match the values stored when the file was last hashed, the file is assumed
+    to be unchanged and its stored hash is trusted without reading the file.
+    
+    Args:
+        filepath: Path to the file
+        
+    Returns:
+        Optional[List[int]]: [size, mtime_ns, inode, device], or None if the file can't be stat'ed
+    """
+    try:
+        st = os.stat(filepath)
+    except OSError as e:
+        logger.debug(f"Failed to stat {filepath}: {e}")
+        return None
+    return [st.st_size, st.st_mtime_ns, st.st_ino, st.st_dev]
+
 def standalone_process_entry(args):
     """Process a single bibliography entry in a separate process.
     
     Args:
-        args: Tuple of (entry, output_dir)
+        args: Tuple of (entry, output_dir, hasher, store)
             entry: Dictionary containing the bibliography entry data
             output_dir: Path to the output directory
+            hasher: FileHasher used to compute the hashes for change tracking
+            store: ConversionStore holding the PDF conversions
             
     Returns:
         ProcessingResult: Object containing processing results and status
     """
-    entry, output_dir = args
+    entry, output_dir, hasher, store = args
     mupdf_warning_count = 0
+    cache_hits = 0
+    cache_misses = 0
     try:
         citation_key = entry.get('ID')
         if not citation_key:
@@ -108,6 +194,7 @@ def standalone_process_entry(args):
         entry_dir.mkdir(exist_ok=True, parents=True)
         processed_contents = []
         current_hashes = {}
+        current_stats = {}
         
         # Parse and validate files
         file_field = entry.get('file', '')
@@ -120,18 +207,8 @@ def standalone_process_entry(args):
             
             paths = []
             not_found = 0
-            for f in file_field.split(';'):
+            for file_path in split_file_field(file_field):
                 try:
-                    if ':' in f:
-                        # Handle Zotero-style file fields (description:filepath)
-                        _, file_path = f.split(':', 1)
-                    else:
-                        file_path = f
-                        
-                    file_path = file_path.strip()
-                    if not file_path:
-                        continue
-                        
                     path = Path(file_path)
                     if path.exists():
                         logger.debug(f"Found file at: {path}")
@@ -140,109 +217,38 @@ def standalone_process_entry(args):
                         logger.debug(f"Could not find file: {file_path} for citation key: {citation_key}")
                         not_found += 1
                 except Exception as e:
-                    logger.error(f"Failed to parse file field entry '{f}': {e}\n{traceback.format_exc()}")
+                    logger.error(f"Failed to parse file field entry '{file_path}': {e}\n{traceback.format_exc()}")
             
             return paths, not_found
 
-        def compute_file_hash(filepath: str) -> str:
-            try:
-                with open(filepath, 'rb') as f:
-                    return hashlib.sha256(f.read()).hexdigest()
-            except Exception as e:
-                logger.error(f"Failed to compute hash for {filepath}: {e}\n{traceback.format_exc()}")
-                return ""
-
-        def compute_dir_hash(directory: Path) -> str:
-            if not directory.exists():
-                return ""
-            
-            # Get all files in directory, including symlinks
-            files = sorted(f for f in directory.glob('**/*') if f.is_file() or f.is_symlink())
-            hasher = hashlib.sha256()
-            
-            for file_path in files:
-                try:
-                    # Add relative path to hash
-                    rel_path = file_path.relative_to(directory)
-                    hasher.update(str(rel_path).encode())
-                    
-                    if file_path.is_symlink():
-                        # For symlinks, hash only the target path string
-                        target_path = os.readlink(file_path)
-                        hasher.update(str(target_path).encode())
-                    else:
-                        # For regular files, hash the contents
-                        with open(file_path, 'rb') as f:
-                            for chunk in iter(lambda: f.read(4096), b''):
-                                hasher.update(chunk)
-                except Exception as e:
-                    logger.error(f"Failed to hash file {file_path}: {e}\n{traceback.format_exc()}")
-                    
-            return hasher.hexdigest()
-        
         file_paths, not_found = parse_file_field(file_field)
         
         if not file_paths:
             logger.warning(f"No files found for entry {citation_key}")
             return ProcessingResult(citation_key=citation_key, file_hashes={}, dir_hash="", success=False)
         
-        # Reset MuPDF warnings before processing files
-        pymupdf.TOOLS.reset_mupdf_warnings()
+        # Compute hashes for change tracking before converting, so that the
+        # conversion store can be looked up by content. The stat signature is
+        # taken before hashing so that a concurrent modification shows up as a
+        # changed signature on the next run.
+        for path in file_paths:
+            current_stats[str(path)] = get_file_stat_signature(path)
+            current_hashes[str(path)] = hasher.hash_file(path)
         
         # Process files
         for file_path in file_paths:
             mime_type, _ = mimetypes.guess_type(file_path)
             
             if mime_type == 'application/pdf':
-                # Process PDF and capture warnings/errors
-                pymupdf.TOOLS.reset_mupdf_warnings()
-                
-                # Create a simplified link/copy of the PDF with just the citation key
-                simple_pdf = entry_dir / f"{citation_key}.pdf"
-                try:
-                    if simple_pdf.exists() or simple_pdf.is_symlink():
-                        simple_pdf.unlink()
-                    simple_pdf.symlink_to(file_path.resolve())
-                    logger.debug(f"Created symbolic link for processing: {simple_pdf} -> {file_path}")
-                except OSError as e:
-                    # If symlink fails (e.g., on Windows without admin rights), make a copy
-                    logger.debug(f"Symlink failed, creating copy instead: {e}")
-                    import shutil
-                    shutil.copy2(file_path, simple_pdf)
-                    logger.debug(f"Created copy for processing: {simple_pdf}")
-                
-                # Process PDF to markdown with images, using the simplified PDF path
-                md_text = pymupdf4llm.to_markdown(
-                    str(simple_pdf),
-                    write_images=True,
-                    image_path=str(entry_dir),
-                    show_progress=False  # Disable pymupdf4llm progress bar
+                # Convert the PDF, or link the stored conversion of an identical PDF
+                md_text, warning_count, stored = convert_pdf(
+                    file_path, entry_dir, citation_key, store, hasher, current_hashes[str(file_path)]
                 )
-                
-                # Clean up the temporary copy if it was created (but keep symlinks)
-                if simple_pdf.exists() and not simple_pdf.is_symlink():
-                    simple_pdf.unlink()
-                    logger.debug(f"Cleaned up temporary PDF copy: {simple_pdf}")
-                
-                # Check for warnings and write them to log
-                warnings = pymupdf.TOOLS.mupdf_warnings()
-                if warnings:
-                    # Combine characters into complete messages
-                    warning_messages = []
-                    current_message = []
-                    for char in warnings:
-                        if char == '\n':
-                            if current_message:
-                                warning_messages.append(''.join(current_message))
-                                current_message = []
-                        else:
-                            current_message.append(char)
-                    if current_message:
-                        warning_messages.append(''.join(current_message))
-                    
-                    mupdf_warning_count += len(warning_messages)
-                    if warning_messages:
-                        logger.debug(f"MuPDF warnings for '{file_path.name}': {';'.join(warning_messages)}")
+                mupdf_warning_count += warning_count
+                if stored:
+                    cache_hits += 1
+                else:
+                    cache_misses += 1
                 
                 processed_contents.append(md_text)
                 logger.debug(f"Successfully processed PDF {file_path}")
@@ -270,23 +276,25 @@ def standalone_process_entry(args):
                 return ProcessingResult(citation_key=citation_key, file_hashes={}, dir_hash="", success=False)
             
             final_md.write_text(final_content, encoding='utf-8')
-            
-            # Compute hashes for change tracking
-            current_hashes = {
-                str(path): compute_file_hash(str(path))
-                for path in file_paths
-            }
-        
-        # Compute directory hash after all processing is done
-        new_dir_hash = compute_dir_hash(entry_dir)
+        else:
+            # Nothing was converted, so there is nothing to track
+            current_hashes = {}
+            current_stats = {}
+        
+        # Record the output manifest after all processing is done
+        manifest = build_manifest(entry_dir, hasher)
         logger.debug(f"Successfully processed entry {citation_key}")
         
         return ProcessingResult(
             citation_key=citation_key,
             file_hashes=current_hashes,
-            dir_hash=new_dir_hash,
+            dir_hash=manifest_digest(manifest, hasher),
             success=True,
-            mupdf_warning_count=mupdf_warning_count
+            mupdf_warning_count=mupdf_warning_count,
+            file_stats=current_stats,
+            manifest=manifest,
+            cache_hits=cache_hits,
+            cache_misses=cache_misses
         )
     except Exception as e:
         logger.error(f"Failed to process entry {citation_key}: {e}\n{traceback.format_exc()}")
@@ -298,7 +306,763 @@ def standalone_process_entry(args):
             mupdf_warning_count=mupdf_warning_count
         )
 
-class BibliographyProcessor:
+def standalone_process_pdf(args):
+    """Convert a single PDF of a directory in a separate process.
+    
+    Args:
+        args: Tuple of (pdf_path, entry_dir, key, hasher, store)
+            pdf_path: Path to the PDF file
+            entry_dir: Output directory of the PDF
+            key: Key of the PDF in the state database
+            hasher: FileHasher used to compute the hashes for change tracking
+            store: ConversionStore holding the PDF conversions
+            
+    Returns:
+        ProcessingResult: Object containing processing results and status
+    """
+    pdf_path, entry_dir, key, hasher, store = args
+    try:
+        # Validate output directory path
+        error = validate_windows_path(entry_dir)
+        if error:
+            logger.error(f"Invalid output directory path: {error}")
+            return ProcessingResult(citation_key=key, file_hashes={}, dir_hash="", success=False)
+        
+        entry_dir.mkdir(exist_ok=True, parents=True)
+        
+        # Compute hashes for change tracking, taking the stat signature first
+        current_stats = {str(pdf_path): get_file_stat_signature(pdf_path)}
+        current_hashes = {str(pdf_path): hasher.hash_file(pdf_path)}
+        
+        # Convert the PDF, or link the stored conversion of an identical PDF
+        md_text, mupdf_warning_count, stored = convert_pdf(
+            pdf_path, entry_dir, pdf_path.stem, store, hasher, current_hashes[str(pdf_path)]
+        )
+        
+        # Write output markdown file
+        final_content = f"# Citation Key: {pdf_path.stem}\n\n---\n\n{md_text}"
+        final_md = entry_dir / f"{pdf_path.stem}.md"
+        
+        # Validate markdown output path
+        error = validate_windows_path(final_md)
+        if error:
+            logger.error(f"Invalid markdown output path: {error}")
+            return ProcessingResult(citation_key=key, file_hashes={}, dir_hash="", success=False)
+        
+        final_md.write_text(final_content, encoding='utf-8')
+        
+        # Record the output manifest after processing
+        manifest = build_manifest(entry_dir, hasher)
+        logger.debug(f"Successfully processed PDF: {pdf_path}")
+        return ProcessingResult(
+            citation_key=key,
+            file_hashes=current_hashes,
+            dir_hash=manifest_digest(manifest, hasher),
+            success=True,
+            mupdf_warning_count=mupdf_warning_count,
+            file_stats=current_stats,
+            manifest=manifest,
+            cache_hits=int(stored),
+            cache_misses=int(not stored)
+        )
+    except Exception as e:
+        logger.error(f"Failed to process PDF file {pdf_path}: {e}\n{traceback.format_exc()}")
+        return ProcessingResult(citation_key=key, file_hashes={}, dir_hash="", success=False)
+
+def standalone_process_measured(worker: Callable, task) -> ProcessingResult:
+    """Process a task in a worker process, measuring its peak memory.
+    
+    The MuPDF store is emptied afterwards, so that resources cached for one
+    entry don't add to the memory of the next.
+    
+    Args:
+        worker: Function processing a single task, e.g. standalone_process_entry
+        task: Arguments of the worker
+        
+    Returns:
+        ProcessingResult: Result of the task, with its peak_memory set
+    """
+    reset_peak_memory()
+    result = worker(task)
+    result.peak_memory = peak_memory()
+    empty_mupdf_store()
+    return result
+
+def standalone_process_batch(args):
+    """Process several small tasks in a single call of a worker process.
+    
+    Args:
+        args: Tuple of (worker, tasks)
+            worker: Function processing a single task, e.g. standalone_process_entry
+            tasks: Arguments of the worker for each task
+            
+    Returns:
+        List[ProcessingResult]: Results of the tasks, in the order of the tasks
+    """
+    worker, tasks = args
+    return [standalone_process_measured(worker, task) for task in tasks]
+
+def submit_batch(pool, worker: Callable, tasks: List, memory: int = 0):
+    """Submit tasks to a pool as a single task.
+    
+    Args:
+        pool: WorkerPool to submit the tasks to
+        worker: Function processing a single task
+        tasks: Arguments of the worker for each task
+        memory: Estimated memory needed by the task, in bytes
+        
+    Returns:
+        Future of the result of the single task, or of the list of results of several tasks
+    """
+    if len(tasks) == 1:
+        return pool.submit(standalone_process_measured, worker, tasks[0], memory=memory)
+    return pool.submit(standalone_process_batch, (worker, tasks), memory=memory)
+
+def standalone_convert_pages(args):
+    """Convert a page range of a PDF, or a whole PDF, into the conversion store in a separate process.
+    
+    Used to spread the conversion of large PDFs and of entries with several
+    PDFs over the worker pool. The task processing the entry picks up the
+    stored conversions, and converts whatever failed here itself.
+    
+    Args:
+        args: Tuple of (pdf_path, pages, hasher, store)
+            pdf_path: Path to the PDF file
+            pages: Tuple of (first page, page after the last page), or None for the whole PDF
+            hasher: FileHasher used for change tracking
+            store: ConversionStore holding the PDF conversions
+            
+    Returns:
+        Tuple of (number of MuPDF warnings emitted by a new conversion, whether
+            the whole PDF was converted here rather than taken from the store)
+    """
+    pdf_path, pages, hasher, store = args
+    try:
+        pdf_hash = ConversionStore.content_hasher(hasher).hash_file(pdf_path)
+        if not pdf_hash:
+            return 0, False
+        if pages is None:
+            _, warning_count, stored = store.convert(pdf_path, hasher.algorithm, pdf_hash)
+            return warning_count, not stored
+        # The part is stitched into the PDF's store entry by the entry task,
+        # which therefore counts the conversion itself
+        return store.prepare_part(pdf_path, hasher.algorithm, pdf_hash, *pages), False
+    except Exception as e:
+        logger.debug(f"Failed to convert {pdf_path} (pages {pages}) in advance: {e}")
+        return 0, False
+    finally:
+        empty_mupdf_store()
+
+def submit_conversions(
+    pool,
+    pdf_paths: List[Path],
+    hasher: FileHasher,
+    store: ConversionStore,
+    memory: int = 0
+) -> List:
+    """Submit the conversion of large PDFs and of entries with several PDFs as separate tasks.
+    
+    PDFs with more than store.split_pages pages are split into page ranges, and
+    the PDFs of an entry with several PDFs are converted separately, so that
+    the work of a single entry is spread over the worker pool. The task
+    processing the entry is submitted once these tasks are done (see
+    submit_batch_after), and then stitches the stored parts together.
+    
+    Args:
+        pool: WorkerPool to submit the tasks to
+        pdf_paths: PDF files of an entry
+        hasher: FileHasher used for change tracking
+        store: ConversionStore holding the PDF conversions
+        memory: Estimated memory needed by each task, in bytes
+        
+    Returns:
+        List: Futures of the submitted tasks
+    """
+    futures = []
+    for pdf_path in pdf_paths:
+        ranges = store.page_ranges(pdf_path)
+        if not ranges and len(pdf_paths) > 1:
+            ranges = [None]
+        for pages in ranges:
+            futures.append(
+                pool.submit(standalone_convert_pages, (pdf_path, pages, hasher, store), memory=memory)
+            )
+    if futures:
+        logger.debug(f"Split the conversion of {', '.join(p.name for p in pdf_paths)} into {len(futures)} tasks")
+    return futures
+
+def submit_batch_after(pool, futures: List, worker: Callable, tasks: List, memory: int = 0) -> Future:
+    """Submit tasks to a pool as a single task once the given futures are done.
+    
+    Used to start the task processing an entry only after the conversions
+    submitted in advance for it (see submit_conversions) are done, so that it
+    doesn't wait for their locks while holding a worker and its memory. The
+    task is submitted from the thread completing the last of the futures,
+    without blocking the caller.
+    
+    Args:
+        pool: WorkerPool to submit the tasks to
+        futures: Futures to wait for
+        worker: Function processing a single task
+        tasks: Arguments of the worker for each task
+        memory: Estimated memory needed by the task, in bytes
+        
+    Returns:
+        Future: Completed like the future returned by submit_batch; cancelling
+            it cancels the task if it is submitted already
+    """
+    if not futures:
+        return submit_batch(pool, worker, tasks, memory=memory)
+    
+    chained = Future()
+    submitted = []
+    remaining = [len(futures)]
+    lock = threading.Lock()
+    
+    def copy_outcome(future):
+        if chained.cancelled():
+            return
+        if future.cancelled():
+            chained.cancel()
+        elif future.exception() is not None:
+            chained.set_exception(future.exception())
+        else:
+            chained.set_result(future.result())
+    
+    def on_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] or chained.done():
+                return
+        try:
+            future = submit_batch(pool, worker, tasks, memory=memory)
+        except Exception as e:
+            # The pool was shut down because the run was interrupted
+            chained.set_exception(e)
+            return
+        submitted.append(future)
+        if chained.cancelled():
+            future.cancel()
+        future.add_done_callback(copy_outcome)
+    
+    def on_chained_done(_):
+        if chained.cancelled():
+            for future in submitted:
+                future.cancel()
+    
+    chained.add_done_callback(on_chained_done)
+    for future in futures:
+        future.add_done_callback(on_done)
+    return chained
+
+def add_conversions(result: ProcessingResult, futures: List):
+    """Add the conversions done in advance by submit_conversions to the result of their entry.
+    
+    A PDF converted in advance is already stored when the entry task gets to
+    it, so the entry task counts it as a cache hit. It was converted in this
+    run though, so it is counted as a cache miss instead, and the MuPDF
+    warnings of its conversion are added to the result.
+    
+    Args:
+        result: Result of the task processing the entry
+        futures: Futures returned by submit_conversions for the entry, which
+            are done before the entry task is submitted (see submit_batch_after)
+    """
+    for future in futures:
+        if future.cancelled() or future.exception() is not None:
+            continue
+        warning_count, converted = future.result()
+        result.mupdf_warning_count += warning_count
+        if converted and result.cache_hits:
+            result.cache_hits -= 1
+            result.cache_misses += 1
+
+class ResultRecorder:
+    """Writes results to the state database in small batches as they complete.
+    
+    A run that is killed loses at most the results of the last RECORD_INTERVAL
+    seconds; the next run skips everything recorded before. Used as a context
+    manager, the pending results are written on exit, even if the run is
+    interrupted or a worker process crashes.
+    """
+    def __init__(self, record: Callable[[List[ProcessingResult]], None]):
+        """Initialize the recorder.
+        
+        Args:
+            record: Function writing a batch of results in one transaction
+        """
+        self._record = record
+        self._pending: List[ProcessingResult] = []
+        self._oldest = 0.0
+        self._futures: Dict = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            # Keep the results of tasks that completed before the run was interrupted
+            for future in list(self._futures):
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    self._futures.pop(future)
+                    result = future.result()
+                    for result in result if isinstance(result, list) else [result]:
+                        self.add(result)
+        self.flush()
+
+    def track(self, futures: Dict):
+        """Track the futures of submitted tasks, whose results are recorded if the run is interrupted.
+        
+        Args:
+            futures: Futures of the tasks that were not handled yet
+        """
+        self._futures = futures
+
+    def add(self, result: ProcessingResult):
+        """Add a result, writing the pending results if a batch is due.
+        
+        Args:
+            result: Result of processing an entry; failed results are only
+                recorded if they have a citation key and a reason
+        """
+        if result.success or (result.citation_key and result.error):
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append(result)
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        """Write the pending results if there are enough of them or they are old enough."""
+        if len(self._pending) >= RECORD_BATCH_SIZE or (
+            self._pending and time.monotonic() - self._oldest >= RECORD_INTERVAL
+        ):
+            self.flush()
+
+    def flush(self):
+        """Write all pending results."""
+        if self._pending:
+            self._record(self._pending)
+            logger.debug(f"Recorded {len(self._pending)} results")
+            self._pending = []
+
+def handle_done(pending: Dict, handle_result: Callable):
+    """Handle the results of the submitted tasks that are already completed.
+    
+    Args:
+        pending: Futures of the submitted tasks, mapped to the keys of their entries
+        handle_result: Function called with the key and the result of every entry
+    """
+    for future in [future for future in pending if future.done()]:
+        keys = pending.pop(future)
+        for key, result in zip(keys, future_results(future, keys)):
+            handle_result(key, result)
+
+def wait_for_results(pending: Dict, handle_result: Callable, recorder: ResultRecorder):
+    """Handle the results of submitted tasks as they complete.
+    
+    Args:
+        pending: Futures of the submitted tasks, mapped to the keys of their entries
+        handle_result: Function called with the key and the result of every entry
+        recorder: ResultRecorder, which is given the chance to write pending
+            results while waiting for long-running tasks
+    """
+    while pending:
+        wait(pending, timeout=RECORD_INTERVAL, return_when=FIRST_COMPLETED)
+        handle_done(pending, handle_result)
+        recorder.flush_if_due()
+
+def future_results(future, keys: List[str]) -> List[ProcessingResult]:
+    """Get the results of a task, turning errors of the worker process into failed results.
+    
+    Args:
+        future: Completed future of a task returning a ProcessingResult, or a
+            list of them for a batch (see submit_batch)
+        keys: Keys of the entries processed by the task
+        
+    Returns:
+        List[ProcessingResult]: The results, or failed results with the reason as error
+            if the worker raised, timed out or died (see workers.WorkerPool)
+    """
+    try:
+        result = future.result()
+    except Exception as e:
+        logger.error(f"Worker process failed on {', '.join(map(str, keys))}: {e!r}")
+        return [
+            ProcessingResult(citation_key="", file_hashes={}, dir_hash="", success=False, error=str(e) or repr(e))
+            for _ in keys
+        ]
+    return result if isinstance(result, list) else [result]
+
+class StateTrackingProcessor:
+    """Base class of processors that skip entries which are unchanged since their last conversion.
+    
+    The state database (processed_files.db in the output directory) records,
+    for every converted entry, the hashes and stat signatures of its source
+    files and the manifest of its output directory (output_dir / key).
+    Subclasses set output_dir, db_path, hasher, limits, pool and dry_run. The database is
+    opened with open_state() or by using the processor as a context manager.
+    """
+    state: Optional[StateDB] = None
+
+    def __enter__(self):
+        """Context manager entry point - opens the state database."""
+        self.open_state()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit point - closes the state database."""
+        self.close_state()
+        if exc_type:
+            raise
+
+    def open_state(self):
+        """Open the state database and load it into memory, unless it is already open."""
+        if self.state is None and not self.dry_run:
+            self.output_dir.mkdir(exist_ok=True, parents=True)
+            self.state = StateDB(self.db_path)
+
+    def close_state(self):
+        """Close the state database."""
+        if self.state is not None:
+            self.state.close()
+            self.state = None
+
+    @property
+    def db_conn(self) -> sqlite3.Connection:
+        """Connection to the open state database."""
+        if self.state is None:
+            raise AttributeError("The state database is not open")
+        return self.state.conn
+
+    def verify(self, invalidate: bool = True) -> Dict[str, List[str]]:
+        """Verify the content of all output directories against their manifests.
+        
+        Unlike the checks done when converting, this reads and hashes every output
+        file. This works on an existing database, independently of dry-run mode.
+        Attachments with identical content at different paths are reported as
+        well, since each of them is tracked separately.
+        
+        Args:
+            invalidate: Whether to remove entries whose output doesn't match from
+                the database, so that the next run converts them again
+        
+        Returns:
+            Dict[str, List[str]]: Mismatches found, keyed by the key of the entry
+        """
+        if not self.db_path.exists():
+            logger.info(f"No conversion state found in {self.output_dir}")
+            return {}
+        
+        with StateDB(self.db_path) as state:
+            problems = {}
+            unverified = 0
+            for key, item in state.items.items():
+                if item.manifest is None:
+                    unverified += 1
+                    continue
+                hasher = FileHasher.from_name(item.hash_algorithm or 'sha256')
+                entry_problems = verify_manifest(self.output_dir / key, item.manifest, hasher)
+                if entry_problems:
+                    problems[key] = entry_problems
+                    logger.warning(f"Output of {key} doesn't match its manifest: {', '.join(entry_problems)}")
+            total = len(state.items)
+            
+            duplicates = state.duplicate_attachments()
+            for file_hash, paths in duplicates.items():
+                logger.info(
+                    f"Identical attachments of {', '.join(state.citation_keys_for_hash(file_hash))}: "
+                    f"{', '.join(paths)}"
+                )
+            
+            if problems and invalidate:
+                state.remove(problems)
+        
+        summary = f"Verified {total - unverified} entries, {len(problems)} with modified output"
+        if unverified:
+            summary += f", {unverified} without a recorded manifest"
+        if duplicates:
+            summary += f", {len(duplicates)} attachments stored at several paths"
+        logger.info(summary)
+        if problems:
+            if invalidate:
+                logger.info("Affected entries will be converted again on the next run")
+            else:
+                logger.info("DRY RUN - affected entries were not invalidated")
+        return problems
+
+    def _get_current_hashes(
+        self,
+        file_paths: List[Path],
+        saved_hashes: Dict[str, str],
+        saved_stats: Dict[str, List[int]],
+        paranoid: bool = False
+    ) -> Tuple[Dict[str, str], Dict[str, List[int]]]:
+        """Get the current hashes of a list of files, skipping unchanged files.
+        
+        A file whose stat signature (size, mtime_ns, inode, device) matches the
+        one stored alongside its hash is not read; the stored hash is trusted.
+        
+        Args:
+            file_paths: Paths of the files to hash
+            saved_hashes: Hashes stored in the database, keyed by file path
+            saved_stats: Stat signatures stored in the database, keyed by file path
+            paranoid: If True, always hash the file contents
+            
+        Returns:
+            Tuple of (hashes, stat signatures), both keyed by file path
+        """
+        hashes = {}
+        stats = {}
+        for path in file_paths:
+            key = str(path)
+            signature = get_file_stat_signature(path)
+            if signature is None:
+                continue
+            stats[key] = signature
+            if not paranoid and key in saved_hashes and saved_stats.get(key) == signature:
+                hashes[key] = saved_hashes[key]
+            else:
+                hashes[key] = self.hasher.hash_file(path)
+        return hashes, stats
+
+    def _outputs_unchanged(self, citation_key: str, item: ItemState) -> bool:
+        """Check whether the output directory of an entry is unchanged since it was converted.
+        
+        The check only uses lstat calls against the recorded output manifest.
+        Entries converted by older versions have no manifest; for those, the
+        directory hash is compared once and a manifest is recorded if it matches.
+        
+        Args:
+            citation_key: Citation key of the entry
+            item: Recorded state of the entry
+            
+        Returns:
+            bool: True if the output directory matches what was recorded
+        """
+        entry_dir = self.output_dir / citation_key
+        manifest = item.manifest
+        if manifest is None and item.dir_hash == manifest_digest({}, self.hasher):
+            # The entry produced no output files
+            manifest = {}
+        if manifest is not None:
+            return manifest_matches(entry_dir, manifest)
+        
+        if self.hasher.hash_directory(entry_dir) != item.dir_hash:
+            return False
+        logger.debug(f"Recording output manifest for {citation_key}")
+        self.state.record_manifest(citation_key, build_manifest(entry_dir, self.hasher))
+        return True
+
+    def _needs_processing(self, citation_key: str, file_paths: List[Path], paranoid: bool = False) -> bool:
+        """Check whether an entry changed since it was last converted.
+        
+        This is called from several threads at once. The recorded state is
+        read from memory, while hashing and stat calls run concurrently.
+        
+        Args:
+            citation_key: Key of the entry in the state database
+            file_paths: Source files of the entry
+            paranoid: Whether to hash all files, even those whose stat signature is unchanged
+            
+        Returns:
+            bool: True if the source files or the output directory changed
+        """
+        item = self.state.get(citation_key)
+        if item is None or not self._matches_hasher(item.hash_algorithm):
+            # Hashes recorded with another algorithm can't be compared
+            return True
+        
+        # Get current file hashes, trusting stored hashes of files
+        # whose stat signature is unchanged
+        current_hashes, _ = self._get_current_hashes(
+            file_paths, item.file_hashes, item.file_stats, paranoid=paranoid
+        )
+        
+        # Compare the hashes and check the output directory against its manifest
+        return item.file_hashes != current_hashes or not self._outputs_unchanged(citation_key, item)
+
+    def _record_results(self, results: Iterable[ProcessingResult]):
+        """Store the change tracking state of processed entries.
+        
+        Successfully processed entries are stored in one transaction, entries
+        that failed are recorded with the reason of the failure.
+        
+        Args:
+            results: Results of processing the entries
+        """
+        results = list(results)
+        self.state.record({
+            result.citation_key: ItemState(
+                file_hashes=result.file_hashes,
+                dir_hash=result.dir_hash,
+                file_stats=result.file_stats,
+                hash_algorithm=self.hasher.name,
+                manifest=result.manifest,
+                peak_memory=result.peak_memory or None
+            )
+            for result in results if result.success
+        })
+        self.state.record_failures({
+            result.citation_key: result.error for result in results if not result.success
+        })
+
+    @contextmanager
+    def _worker_pool(self, num_processes: int) -> Iterator[WorkerPool]:
+        """Get a pool of worker processes for a run.
+        
+        Args:
+            num_processes: Number of worker processes of a new pool
+            
+        Yields:
+            WorkerPool: The shared pool of the processor if it has one (e.g. in
+                watch mode), otherwise a new pool that is shut down after the run
+        """
+        if self.pool is not None:
+            yield self.pool
+        else:
+            with WorkerPool(num_processes, self.limits) as pool:
+                yield pool
+
+    def _run_scheduled(
+        self,
+        tasks: Iterable[Tuple[str, List[Path], Tuple]],
+        worker: Callable,
+        handle_result: Callable,
+        num_processes: Union[int, str, None],
+        desc: str,
+        unit: str
+    ):
+        """Convert entries in a process pool, longest first within windows of entries.
+        
+        Tasks are consumed as they are produced, so conversion starts while the
+        change detection is still running. They are collected into windows
+        that grow from the number of workers up to schedule.SCHEDULE_WINDOW
+        entries (see schedule.windows). For each window, the cost and memory of
+        each entry are estimated from the page counts and sizes of its
+        attachments, and from the peak memory measured when it was last
+        converted (see schedule.estimate). The entries of a window are then
+        submitted in order of decreasing cost, with cheap entries batched into
+        a single task. Large PDFs are additionally split into page ranges (see
+        submit_conversions), and their entry is submitted once the ranges are
+        converted (see submit_batch_after). Workers are supervised with the limits of the
+        processor (see workers.WorkerPool): tasks are only started within the
+        memory budget, and an entry whose conversion hangs or crashes fails
+        with the reason while the run continues. Results are recorded as they
+        complete, so an interrupted run resumes with the entries that were
+        not finished. With AUTO_PROCESSES, the number of workers is
+        calibrated on the first entries (see schedule.Calibration), unless
+        the processor has a shared pool.
+        
+        Args:
+            tasks: Tuples of (key, attachments, worker arguments) of the entries, in the order they are found
+            worker: Function converting an entry in a worker process
+            handle_result: Function called with the key and the result of every entry
+            num_processes: Number of worker processes, AUTO_PROCESSES or None for the default
+            desc: Description shown in the progress bar
+            unit: Unit shown in the progress bar
+        """
+        if self.pool is not None:
+            # A shared pool keeps its size
+            num_processes = self.pool.max_workers
+        calibration = Calibration(worker_count(num_processes)) if num_processes == AUTO_PROCESSES else None
+        num_processes = worker_count(num_processes)
+        # PyMuPDF doesn't support multithreading, so page counts are read in
+        # this thread; opening a PDF for its page count only reads its
+        # cross-reference table
+        def preflight(task):
+            key, paths, _ = task
+            item = self.state.get(key)
+            return estimate(paths, past_peak=item.peak_memory if item else None)
+        
+        entry_costs = {}
+        costs = []
+        submitted_costs = []
+        preflight_duration = 0.0
+        
+        def on_result(key, result):
+            if key in conversions:
+                add_conversions(result, conversions.pop(key))
+            if not result.success and result.error:
+                logger.warning(f"Failed to process {key}: {result.error}")
+                result.citation_key = result.citation_key or key
+            recorder.add(result)
+            handle_result(key, result)
+            progress.update()
+            if calibration is not None and not calibration.done:
+                pool.resize(calibration.observe(entry_costs.get(key, 0.0)))
+        
+        def scanned(tasks):
+            for task in tasks:
+                # Record results that complete while the scan is still running
+                handle_done(pending, on_result)
+                recorder.flush_if_due()
+                yield task
+        
+        start = time.perf_counter()
+        with ResultRecorder(self._record_results) as recorder, \
+                self._worker_pool(calibration.workers if calibration else num_processes) as pool, \
+                tqdm(total=0, desc=desc, unit=unit) as progress:
+            pending = {}
+            conversions = {}
+            recorder.track(pending)
+            try:
+                for window in windows(scanned(tasks), num_processes):
+                    preflight_start = time.perf_counter()
+                    estimates = [preflight(task) for task in window]
+                    preflight_duration += time.perf_counter() - preflight_start
+                    for (key, _, _), e in zip(window, estimates):
+                        entry_costs[key] = e.cost
+                        costs.append(e.cost)
+                    batches = plan_batches(window, [e.cost for e in estimates], num_processes,
+                                           [e.memory for e in estimates])
+                    progress.total += len(window)
+                    progress.refresh()
+                    
+                    for batch in batches:
+                        parts = []
+                        if len(batch.items) == 1:
+                            key, paths, _ = batch.items[0]
+                            parts = conversions[key] = submit_conversions(
+                                pool, [path for path in paths if BibliographyProcessor.is_pdf_file(path)],
+                                self.hasher, self.store, memory=batch.memory
+                            )
+                        future = submit_batch_after(
+                            pool, parts, worker, [args for _, _, args in batch.items], memory=batch.memory
+                        )
+                        pending[future] = [key for key, _, _ in batch.items]
+                        submitted_costs.append(batch.cost)
+                        
+                        # Record results that are already available while submitting
+                        handle_done(pending, on_result)
+                        recorder.flush_if_due()
+                logger.debug(
+                    f"Preflight of {len(costs)} entries took {preflight_duration:.2f}s, "
+                    f"submitted {len(submitted_costs)} tasks"
+                )
+                wait_for_results(pending, on_result, recorder)
+            except BaseException:
+                # Don't leave the tasks of an interrupted run queued in a shared pool
+                for future in [*pending, *(f for futures in conversions.values() for f in futures)]:
+                    future.cancel()
+                raise
+        logger.info(
+            f"Makespan: {time.perf_counter() - start:.1f}s for {len(costs)} entries in {len(submitted_costs)} tasks "
+            f"(estimated {estimate_makespan(submitted_costs, num_processes):.1f}s in submission order, "
+            f"{estimate_makespan(costs, num_processes):.1f}s in file order)"
+        )
+
+    def _matches_hasher(self, saved_algorithm: Optional[str]) -> bool:
+        """Check whether hashes stored in the database were computed with the current hasher.
+        
+        Args:
+            saved_algorithm: Value of the hash_algorithm column (None for legacy rows)
+            
+        Returns:
+            bool: True if the stored hashes are comparable with newly computed ones
+        """
+        return (saved_algorithm or 'sha256') == self.hasher.name
+
+class BibliographyProcessor(StateTrackingProcessor):
     @staticmethod
     def get_output_dir(input_file: Path | str) -> Path:
         """Get the output directory path for a bibliography file.
@@ -340,13 +1104,26 @@ class BibliographyProcessor:
         mime_type, _ = mimetypes.guess_type(file_path)
         return mime_type == 'application/pdf'
 
-    def __init__(self, input_path: Union[str, Path], dry_run: bool = False, quiet: bool = False):
+    def __init__(
+        self,
+        input_path: Union[str, Path],
+        dry_run: bool = False,
+        quiet: bool = False,
+        hasher: Optional[FileHasher] = None,
+        store: Optional[ConversionStore] = None,
+        limits: Optional[WorkerLimits] = None,
+        pool: Optional[WorkerPool] = None
+    ):
         """Initialize the bibliography processor.
         
         Args:
             input_path: Path to the bibliography file, PDF file, or directory to process
             dry_run: If True, show what would be processed without actually doing it
             quiet: If True, suppress all output except warnings and errors
+            hasher: FileHasher used for change tracking (default: full SHA-256)
+            store: ConversionStore holding the PDF conversions (default: the user-level cache)
+            limits: Limits of the worker processes converting PDFs (default: WorkerLimits())
+            pool: WorkerPool shared between runs, e.g. in watch mode (default: a new pool for each run)
             
         The processor will create an output directory named '{input_file_stem}-bib4llm'
         and initialize a SQLite database to track processed files.
@@ -363,27 +1140,16 @@ class BibliographyProcessor:
             
         self.dry_run = dry_run
         self.quiet = quiet
+        self.hasher = hasher or FileHasher()
         self.output_dir = self.get_output_dir(self.input_path)
         self.log_file = self.get_log_file(self.input_path)
+        self.store = store or ConversionStore.default()
+        self.limits = limits or WorkerLimits()
+        self.pool = pool
+        self.db_path = self.output_dir / DB_NAME
         
-        if not self.dry_run:
-            self.output_dir.mkdir(exist_ok=True)
-            
-            # Initialize database
-            self.db_path = self.output_dir / "processed_files.db"
-            
-            # Initialize database schema
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS processed_items (
-                        citation_key TEXT PRIMARY KEY,
-                        file_hashes TEXT,
-                        last_processed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        dir_hash TEXT
-                    )
-                """)
-                conn.commit()
+        # Initialize the database, which stays open until the processor is closed
+        self.open_state()
         
         if not quiet:
             logger.info(f"Initialized BibliographyProcessor for {input_path}")
@@ -393,86 +1159,89 @@ class BibliographyProcessor:
             else:
                 logger.debug("Database initialized successfully")
 
-    def __enter__(self):
-        """Context manager entry point - opens database connection."""
-        if not self.dry_run:
-            self.db_conn = sqlite3.connect(self.db_path)
-            cursor = self.db_conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS processed_items (
-                    citation_key TEXT PRIMARY KEY,
-                    file_hashes TEXT,
-                    last_processed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    dir_hash TEXT
-                )
-            """)
-        return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        """Context manager exit point - closes database connection."""
-        if not self.dry_run:
-            if hasattr(self, 'db_conn'):
-                self.db_conn.close()
-        if exc_type:
-            raise
-
-    def _compute_file_hash(self, filepath: str) -> str:
-        """Compute SHA-256 hash of a file.
+    def _find_stale_entries(
+        self,
+        entries: List[Dict],
+        scan: 'ChangeScan',
+        force: bool = False,
+        paranoid: bool = False,
+        num_threads: int = None
+    ) -> Iterator[Dict]:
+        """Yield the entries that need processing, as soon as each check completes.
+        
+        Hashing and stat calls release the GIL, so the checks of different
+        entries run in parallel threads. Entries are yielded in completion order.
         
         Args:
-            filepath: Path to the file to hash
+            entries: Bibliography entries to check
+            scan: ChangeScan collecting statistics about the change detection
+            force: Whether to yield all entries without checking them
+            paranoid: Whether to hash all attachments, even those whose stat signature is unchanged
+            num_threads: Number of threads used for the checks
             
-        Returns:
-            str: Hex digest of the file's SHA-256 hash, or empty string on error
+        Yields:
+            Dict: Entries that need processing
         """
+        start = time.perf_counter()
         try:
-            with open(filepath, 'rb') as f:
-                return hashlib.sha256(f.read()).hexdigest()
-        except Exception as e:
-            logger.error(f"Failed to compute hash for {filepath}: {e}\n{traceback.format_exc()}")
-            return ""
+            if force:
+                yield from entries
+                return
+            
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                futures = {
+                    executor.submit(self._check_entry, entry, paranoid): entry
+                    for entry in entries
+                }
+                for future in as_completed(futures):
+                    needs_processing, missing = future.result()
+                    scan.missing_files += missing
+                    if needs_processing:
+                        yield futures[future]
+        finally:
+            scan.duration = time.perf_counter() - start
 
-    def _compute_dir_hash(self, directory: Path) -> str:
-        """Compute a hash of a directory's contents.
+    def _check_entry(self, entry: Dict, paranoid: bool = False) -> Tuple[bool, int]:
+        """Check whether a bibliography entry needs processing.
         
-        This function hashes:
-        - The relative paths of all files
-        - For regular files: their contents
-        - For symbolic links: their target paths (not the linked content)
+        This is called from several threads at once (see _needs_processing).
         
         Args:
-            directory: Path to the directory to hash
+            entry: Dictionary containing the bibliography entry data
+            paranoid: Whether to hash all attachments, even those whose stat signature is unchanged
             
         Returns:
-            str: Hex digest of the directory's SHA-256 hash, or empty string if directory doesn't exist
+            Tuple of (whether the entry needs processing, number of referenced files not found)
         """
-        if not directory.exists():
-            return ""
+        citation_key = entry.get('ID')
+        if not citation_key:
+            logger.warning("Entry missing citation key, skipping")
+            return False, 0
         
-        # Get all files in directory, including symlinks
-        files = sorted(f for f in directory.glob('**/*') if f.is_file() or f.is_symlink())
-        hasher = hashlib.sha256()
+        file_paths, missing = self._parse_file_field(entry.get('file', ''))
+        return self._needs_processing(citation_key, file_paths, paranoid=paranoid), missing
+
+    def remove_entries(self, citation_keys: List[str]):
+        """Remove the outputs and change tracking state of entries.
         
-        for file_path in files:
-            try:
-                # Add relative path to hash
-                rel_path = file_path.relative_to(directory)
-                hasher.update(str(rel_path).encode())
-                
-                if file_path.is_symlink():
-                    # For symlinks, hash only the target path string
-                    # This ensures the hash only changes if the symlink target changes
-                    target_path = os.readlink(file_path)
-                    hasher.update(str(target_path).encode())
-                else:
-                    # For regular files, hash the contents
-                    with open(file_path, 'rb') as f:
-                        for chunk in iter(lambda: f.read(4096), b''):
-                            hasher.update(chunk)
-            except Exception as e:
-                logger.error(f"Failed to hash file {file_path}: {e}\n{traceback.format_exc()}")
-                
-        return hasher.hexdigest()
+        Args:
+            citation_keys: Citation keys of the entries to remove
+        """
+        for citation_key in citation_keys:
+            entry_dir = self.output_dir / citation_key
+            # Never follow citation keys outside of the output directory
+            if entry_dir.parent != self.output_dir:
+                logger.warning(f"Not removing output of invalid citation key: {citation_key}")
+                continue
+            if self.dry_run:
+                logger.info(f"Would remove output of {citation_key}")
+                continue
+            if entry_dir.is_dir():
+                shutil.rmtree(entry_dir)
+            logger.info(f"Removed output of {citation_key}")
+        
+        if not self.dry_run:
+            self.state.remove(citation_keys)
 
     def _parse_file_field(self, file_field: str) -> tuple[list[Path], int]:
         """Parse the file field from bibtex entry.
@@ -493,18 +1262,8 @@ class BibliographyProcessor:
         
         paths = []
         not_found = 0
-        for f in file_field.split(';'):
+        for file_path in split_file_field(file_field):
             try:
-                if ':' in f:
-                    # Handle Zotero-style file fields (description:filepath)
-                    _, file_path = f.split(':', 1)
-                else:
-                    file_path = f
-                    
-                file_path = file_path.strip()
-                if not file_path:
-                    continue
-                    
                 path = Path(file_path)
                 
                 # Validate path for Windows compatibility
@@ -521,17 +1280,26 @@ class BibliographyProcessor:
                     logger.debug(f"Could not find file: {file_path}")
                     not_found += 1
             except Exception as e:
-                logger.error(f"Failed to parse file field entry '{f}': {e}\n{traceback.format_exc()}")
+                logger.error(f"Failed to parse file field entry '{file_path}': {e}\n{traceback.format_exc()}")
         
         return paths, not_found
 
-    def process_pdf(self, pdf_path: Path, force: bool = False, citation_key: str = None) -> ProcessingResult:
+    def process_pdf(
+        self,
+        pdf_path: Path,
+        force: bool = False,
+        citation_key: str = None,
+        paranoid: bool = False,
+        num_processes: int = 1
+    ) -> ProcessingResult:
         """Process a single PDF file directly (no BibTeX entry).
         
         Args:
             pdf_path: Path to the PDF file
             force: Whether to force reprocessing
             citation_key: Optional citation key to use (default: file stem)
+            paranoid: Whether to hash the PDF even if its stat signature is unchanged
+            num_processes: Number of processes converting the page ranges of a large PDF in parallel
             
         Returns:
             ProcessingResult: Object containing processing results and status
@@ -552,27 +1320,27 @@ class BibliographyProcessor:
             
         # Check if PDF needs processing by comparing hashes
         if not force:
-            cursor = self.db_conn.cursor()
-            current_hash = self._compute_file_hash(str(pdf_path))
-            
-            entry_dir = self.output_dir / citation_key
-            dir_hash = self._compute_dir_hash(entry_dir)
-            
-            cursor.execute(
-                "SELECT file_hashes, dir_hash FROM processed_items WHERE citation_key = ?",
-                (citation_key,)
-            )
-            result = cursor.fetchone()
+            item = self.state.get(citation_key)
             
-            if result:
-                saved_hashes = json.loads(result[0] or '{}')
-                if str(pdf_path) in saved_hashes and saved_hashes[str(pdf_path)] == current_hash and result[1] == dir_hash:
+            if item and self._matches_hasher(item.hash_algorithm):
+                saved_hashes = item.file_hashes
+                current_hashes, current_stats = self._get_current_hashes(
+                    [pdf_path], saved_hashes, item.file_stats, paranoid=paranoid
+                )
+                current_hash = current_hashes.get(str(pdf_path))
+                
+                if (
+                    str(pdf_path) in saved_hashes
+                    and saved_hashes[str(pdf_path)] == current_hash
+                    and self._outputs_unchanged(citation_key, item)
+                ):
                     logger.info(f"PDF {pdf_path} already processed and unchanged")
                     return ProcessingResult(
                         citation_key=citation_key, 
-                        file_hashes={str(pdf_path): current_hash}, 
-                        dir_hash=dir_hash, 
-                        success=True
+                        file_hashes=current_hashes, 
+                        dir_hash=item.dir_hash, 
+                        success=True,
+                        file_stats=current_stats
                     )
         
         # Process the PDF
@@ -584,57 +1352,22 @@ class BibliographyProcessor:
         
         entry_dir.mkdir(exist_ok=True, parents=True)
         
-        # Reset MuPDF warnings before processing
-        pymupdf.TOOLS.reset_mupdf_warnings()
-        mupdf_warning_count = 0
-        
-        # Create a simplified link/copy of the PDF
-        simple_pdf = entry_dir / f"{citation_key}.pdf"
-        try:
-            if simple_pdf.exists() or simple_pdf.is_symlink():
-                simple_pdf.unlink()
-            simple_pdf.symlink_to(pdf_path.resolve())
-            logger.debug(f"Created symbolic link for processing: {simple_pdf} -> {pdf_path}")
-        except OSError as e:
-            # If symlink fails (e.g., on Windows without admin rights), make a copy
-            logger.debug(f"Symlink failed, creating copy instead: {e}")
-            import shutil
-            shutil.copy2(pdf_path, simple_pdf)
-            logger.debug(f"Created copy for processing: {simple_pdf}")
-        
-        # Process PDF to markdown with images
-        md_text = pymupdf4llm.to_markdown(
-            str(simple_pdf),
-            write_images=True,
-            image_path=str(entry_dir),
-            show_progress=False  # Disable pymupdf4llm progress bar
+        # Compute hashes for change tracking
+        current_stats = {str(pdf_path): get_file_stat_signature(pdf_path)}
+        current_hashes = {str(pdf_path): self.hasher.hash_file(pdf_path)}
+        
+        if num_processes > 1:
+            # Convert the page ranges of a large PDF in parallel; convert_pdf stitches them
+            with self._worker_pool(num_processes) as pool:
+                wait(submit_conversions(
+                    pool, [pdf_path], self.hasher, self.store, memory=estimate([pdf_path]).memory
+                ))
+        
+        # Convert the PDF, or link the stored conversion of an identical PDF
+        md_text, mupdf_warning_count, stored = convert_pdf(
+            pdf_path, entry_dir, citation_key, self.store, self.hasher, current_hashes[str(pdf_path)]
         )
         
-        # Clean up the temporary copy if it was created (but keep symlinks)
-        if simple_pdf.exists() and not simple_pdf.is_symlink():
-            simple_pdf.unlink()
-            logger.debug(f"Cleaned up temporary PDF copy: {simple_pdf}")
-        
-        # Check for warnings
-        warnings = pymupdf.TOOLS.mupdf_warnings()
-        if warnings:
-            # Combine characters into complete messages
-            warning_messages = []
-            current_message = []
-            for char in warnings:
-                if char == '\n':
-                    if current_message:
-                        warning_messages.append(''.join(current_message))
-                        current_message = []
-                else:
-                    current_message.append(char)
-            if current_message:
-                warning_messages.append(''.join(current_message))
-            
-            mupdf_warning_count = len(warning_messages)
-            if warning_messages:
-                logger.debug(f"MuPDF warnings for '{pdf_path.name}': {';'.join(warning_messages)}")
-        
         # Write output markdown file
         final_content = f"# Citation Key: {citation_key}\n\n---\n\n{md_text}"
         final_md = entry_dir / f"{citation_key}.md"
@@ -647,41 +1380,41 @@ class BibliographyProcessor:
         
         final_md.write_text(final_content, encoding='utf-8')
         
-        # Compute hashes for change tracking
-        current_hash = self._compute_file_hash(str(pdf_path))
-        current_hashes = {str(pdf_path): current_hash}
-        
-        # Compute directory hash after processing
-        new_dir_hash = self._compute_dir_hash(entry_dir)
+        # Record the output manifest after processing
+        manifest = build_manifest(entry_dir, self.hasher)
+        result = ProcessingResult(
+            citation_key=citation_key,
+            file_hashes=current_hashes,
+            dir_hash=manifest_digest(manifest, self.hasher),
+            success=True,
+            mupdf_warning_count=mupdf_warning_count,
+            file_stats=current_stats,
+            manifest=manifest,
+            cache_hits=int(stored),
+            cache_misses=int(not stored)
+        )
         
         # Update database
         if not self.dry_run:
-            cursor = self.db_conn.cursor()
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO processed_items 
-                (citation_key, file_hashes, dir_hash) 
-                VALUES (?, ?, ?)
-                """,
-                (citation_key, json.dumps(current_hashes), new_dir_hash)
-            )
-            self.db_conn.commit()
+            self._record_results([result])
         
         logger.info(f"Successfully processed PDF: {pdf_path}")
-        return ProcessingResult(
-            citation_key=citation_key,
-            file_hashes=current_hashes,
-            dir_hash=new_dir_hash,
-            success=True,
-            mupdf_warning_count=mupdf_warning_count
-        )
+        return result
 
-    def process_all(self, force: bool = False, num_processes: int = None):
+    def process_all(
+        self,
+        force: bool = False,
+        num_processes: Union[int, str, None] = None,
+        paranoid: bool = False
+    ):
         """Process all entries in the bibliography file or a single PDF.
         
         Args:
             force: Whether to force reprocessing of all entries
-            num_processes: Number of parallel processes to use (default: number of CPU cores)
+            num_processes: Number of parallel processes to use, or AUTO_PROCESSES to
+                calibrate it (default: number of available CPUs, see resources.default_processes)
+            paranoid: Whether to hash all attachments, even those whose stat
+                signature (size, mtime, inode, device) is unchanged
         """
         if self.is_pdf:
             # Process a single PDF file
@@ -689,30 +1422,78 @@ class BibliographyProcessor:
                 logger.info(f"Would process PDF: {self.input_path}")
                 return
                 
-            result = self.process_pdf(self.input_path, force=force)
+            result = self.process_pdf(
+                self.input_path, force=force, paranoid=paranoid,
+                num_processes=worker_count(num_processes)
+            )
             
             if result.success:
                 logger.info(f"Successfully processed PDF: {self.input_path}")
                 if result.mupdf_warning_count > 0:
                     logger.info(f"{result.mupdf_warning_count} MuPDF warnings/errors occurred")
+                if result.cache_hits:
+                    logger.info("Conversion taken from the conversion cache")
             else:
                 logger.error(f"Failed to process PDF: {self.input_path}")
-                
+            self.store.evict()
             return
         
         # Process a BibTeX file
         try:
-            with open(self.input_path, 'r', encoding='utf-8') as bibtex_file:
-                bib_database = bibtexparser.load(bibtex_file)
+            entries = self.load_entries(num_workers=worker_count(num_processes))
+        except Exception as e:
+            logger.error(f"Failed to process bibliography: {e}\n{traceback.format_exc()}")
+            raise
+        self.process_entries(entries, force=force, num_processes=num_processes, paranoid=paranoid)
+
+    def scan_entries(self, num_workers: int = None) -> Iterator[ScannedEntry]:
+        """Lazily scan the entries of the BibTeX file.
+        
+        Only the citation key and file field of each entry are extracted
+        (see bibscan.scan_bibtex).
+        
+        Args:
+            num_workers: Number of processes used to parse large files in parallel
             
-            # Determine which entries need processing
-            entries_to_process = []
-            total = len(bib_database.entries)
+        Returns:
+            Iterator[ScannedEntry]: Entries in the order they appear in the file
+        """
+        return scan_bibtex(self.input_path, num_workers=num_workers, start_method=self.limits.start_method)
+
+    def load_entries(self, num_workers: int = None) -> List[Dict]:
+        """Load the entries of the BibTeX file.
+        
+        Args:
+            num_workers: Number of processes used to parse large files in parallel
+            
+        Returns:
+            List[Dict]: Bibliography entries with their 'ID' and 'file' fields
+        """
+        return [entry.as_entry() for entry in self.scan_entries(num_workers=num_workers)]
+
+    def process_entries(
+        self,
+        entries: List[Dict],
+        force: bool = False,
+        num_processes: Union[int, str, None] = None,
+        paranoid: bool = False
+    ):
+        """Process the given entries of the BibTeX file.
+        
+        Args:
+            entries: Bibliography entries to process (see load_entries)
+            force: Whether to force reprocessing of the entries
+            num_processes: Number of parallel processes to use, or AUTO_PROCESSES to calibrate it
+                (default: number of available CPUs)
+            paranoid: Whether to hash all attachments, even those whose stat
+                signature (size, mtime, inode, device) is unchanged
+        """
+        try:
             total_missing_files = 0
             
             if self.dry_run:
                 # In dry-run mode, show all entries that would be processed
-                for entry in bib_database.entries:
+                for entry in entries:
                     citation_key = entry.get('ID')
                     if not citation_key:
                         logger.warning("Entry missing citation key, skipping")
@@ -734,105 +1515,105 @@ class BibliographyProcessor:
                     logger.warning(f"{total_missing_files} referenced files could not be found")
                 return
             
-            if force:
-                entries_to_process = bib_database.entries
-            else:
-                cursor = self.db_conn.cursor()
-                for entry in bib_database.entries:
-                    citation_key = entry.get('ID')
-                    if not citation_key:
-                        logger.warning("Entry missing citation key, skipping")
-                        continue
-                        
-                    # Get current file hashes
-                    file_paths, missing = self._parse_file_field(entry.get('file', ''))
-                    total_missing_files += missing
-                    current_hashes = {
-                        str(path): self._compute_file_hash(str(path))
-                        for path in file_paths
-                        if path.exists()
-                    }
-                    
-                    entry_dir = self.output_dir / citation_key
-                    dir_hash = self._compute_dir_hash(entry_dir)
-                    
-                    # Check if entry needs processing by comparing hashes
-                    cursor.execute(
-                        "SELECT file_hashes, dir_hash FROM processed_items WHERE citation_key = ?",
-                        (citation_key,)
-                    )
-                    result = cursor.fetchone()
-                    
-                    if not result or (
-                        json.loads(result[0] or '{}') != current_hashes or 
-                        result[1] != dir_hash
-                    ):
-                        entries_to_process.append(entry)
-            
-            total = len(entries_to_process)
-            logger.info(f"Found {total} entries to process")
-            
-            if not entries_to_process:
+            # Entries found to be stale are scheduled right away, while the
+            # change detection of the remaining entries continues
+            start = time.perf_counter()
+            scan = ChangeScan()
+            stale_entries = self._find_stale_entries(
+                entries, scan, force=force, paranoid=paranoid, num_threads=worker_count(num_processes)
+            )
+            first_entry = next(stale_entries, None)
+            if first_entry is None:
+                logger.info(f"Change detection for {len(entries)} entries took {scan.duration:.2f}s")
+                if scan.missing_files > 0:
+                    logger.warning(f"{scan.missing_files} referenced files could not be found")
                 logger.info("No entries need processing")
                 return
+            logger.debug(f"First entry to process found after {time.perf_counter() - start:.2f}s")
             
-            if num_processes is None:
-                num_processes = multiprocessing.cpu_count()
-            
-            # Process entries using process_map with progress bar
-            results = process_map(
-                standalone_process_entry,
-                [(entry, self.output_dir) for entry in entries_to_process],
-                max_workers=num_processes,
-                desc="Processing library",
-                unit="entry"
-            )
-            
-            # Update database with results
+            total = 0
             processed = 0
             failed = 0
             total_mupdf_warnings = 0
-            for result in results:
+            cache_hits = 0
+            cache_misses = 0
+            
+            def handle_result(citation_key, result):
+                nonlocal processed, failed, total_mupdf_warnings, cache_hits, cache_misses
                 if result.success:
-                    cursor = self.db_conn.cursor()
-                    cursor.execute(
-                        """
-                        INSERT OR REPLACE INTO processed_items 
-                        (citation_key, file_hashes, dir_hash) 
-                        VALUES (?, ?, ?)
-                        """,
-                        (result.citation_key, json.dumps(result.file_hashes), result.dir_hash)
-                    )
-                    self.db_conn.commit()
                     processed += 1
                     total_mupdf_warnings += result.mupdf_warning_count
+                    cache_hits += result.cache_hits
+                    cache_misses += result.cache_misses
                 else:
+                    logger.debug(f"Failed to process {citation_key}")
                     failed += 1
             
+            def tasks():
+                nonlocal total
+                for entry in itertools.chain([first_entry], stale_entries):
+                    total += 1
+                    file_paths, _ = self._parse_file_field(entry.get('file', ''))
+                    yield entry.get('ID'), file_paths, (entry, self.output_dir, self.hasher, self.store)
+                logger.info(
+                    f"Change detection for {len(entries)} entries took {scan.duration:.2f}s, "
+                    f"found {total} entries to process"
+                )
+            
+            self._run_scheduled(
+                tasks(), standalone_process_entry, handle_result, num_processes,
+                desc="Processing library", unit="entry"
+            )
+            total_missing_files += scan.missing_files
+            
             # After processing is complete, log summary
             summary_parts = []
-            summary_parts.append(f"Processed {processed}/{total} entries successfully ({failed} failed)")
+            summary_parts.append(
+                f"Processed {processed}/{total} entries successfully ({failed} failed) "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+            if cache_hits or cache_misses:
+                summary_parts.append(f"conversion cache: {cache_hits} hits, {cache_misses} misses")
             if total_mupdf_warnings > 0:
                 summary_parts.append(f"{total_mupdf_warnings} MuPDF warnings/errors occurred")
             if total_missing_files > 0:
                 summary_parts.append(f"{total_missing_files} referenced files could not be found")
             
             logger.info(f"Processing complete: {', '.join(summary_parts)}. Check {self.log_file} for details.")
+            self.store.evict()
             
         except Exception as e:
             logger.error(f"Failed to process bibliography: {e}\n{traceback.format_exc()}")
             raise
 
-class DirectoryProcessor:
-    """Processor for directories containing BibTeX and PDF files."""
+class DirectoryProcessor(StateTrackingProcessor):
+    """Processor for directories containing BibTeX and PDF files.
     
-    def __init__(self, directory_path: Union[str, Path], dry_run: bool = False, quiet: bool = False):
+    PDFs are tracked in a state database in the output directory, keyed by the
+    path of their output directory relative to it (e.g. 'subfolder/paper2').
+    BibTeX files are processed with their own BibliographyProcessor.
+    """
+    
+    def __init__(
+        self,
+        directory_path: Union[str, Path],
+        dry_run: bool = False,
+        quiet: bool = False,
+        hasher: Optional[FileHasher] = None,
+        store: Optional[ConversionStore] = None,
+        limits: Optional[WorkerLimits] = None,
+        pool: Optional[WorkerPool] = None
+    ):
         """Initialize the directory processor.
         
         Args:
             directory_path: Path to the directory to process
             dry_run: If True, show what would be processed without actually doing it
             quiet: If True, suppress all output except warnings and errors
+            hasher: FileHasher used for change tracking (default: full SHA-256)
+            store: ConversionStore holding the PDF conversions (default: the user-level cache)
+            limits: Limits of the worker processes converting PDFs (default: WorkerLimits())
+            pool: WorkerPool shared between runs, e.g. in watch mode (default: a new pool for each run)
         """
         self.directory_path = Path(directory_path).resolve()
         if not self.directory_path.exists() or not self.directory_path.is_dir():
@@ -840,20 +1621,35 @@ class DirectoryProcessor:
             
         self.dry_run = dry_run
         self.quiet = quiet
+        self.hasher = hasher or FileHasher()
         
         # Initialize output directory
         self.output_dir = Path(f"{self.directory_path}-bib4llm").resolve()
         
+        self.store = store or ConversionStore.default()
+        self.limits = limits or WorkerLimits()
+        self.pool = pool
+        
         if not quiet:
             logger.info(f"Initialized DirectoryProcessor for {directory_path}")
             if self.dry_run:
                 logger.info("DRY RUN - no files will be modified")
     
-    def find_files(self, recursive: bool = True) -> Tuple[List[Path], List[Path]]:
+    @property
+    def db_path(self) -> Path:
+        """Path to the state database of the PDFs in the directory."""
+        return self.output_dir / DB_NAME
+    
+    def find_files(
+        self,
+        recursive: bool = True,
+        subdirectory: Optional[Path] = None
+    ) -> Tuple[List[Path], List[Path]]:
         """Find BibTeX and PDF files in the directory.
         
         Args:
             recursive: Whether to search recursively into subdirectories
+            subdirectory: Only search this subdirectory of the directory (default: the whole directory)
             
         Returns:
             Tuple containing two lists:
@@ -868,7 +1664,7 @@ class DirectoryProcessor:
         else:
             glob_pattern = "*"
             
-        for file_path in self.directory_path.glob(glob_pattern):
+        for file_path in (subdirectory or self.directory_path).glob(glob_pattern):
             if file_path.is_file():
                 if file_path.suffix.lower() in ['.bib', '.bibtex']:
                     bibtex_files.append(file_path)
@@ -877,21 +1673,28 @@ class DirectoryProcessor:
         
         return bibtex_files, pdf_files
     
-    def process_directory(self, recursive: bool = True, force: bool = False, num_processes: int = None) -> Dict:
+    def process_directory(
+        self,
+        recursive: bool = True,
+        force: bool = False,
+        num_processes: Union[int, str, None] = None,
+        paranoid: bool = False,
+        subdirectory: Optional[Path] = None
+    ) -> Dict:
         """Process all BibTeX and PDF files in the directory.
         
         Args:
             recursive: Whether to recurse into subdirectories
             force: Whether to force reprocessing of all entries
-            num_processes: Number of parallel processes to use
+            num_processes: Number of parallel processes to use, or AUTO_PROCESSES to calibrate it
+            paranoid: Whether to hash all attachments, even those whose stat signature is unchanged
+            subdirectory: Only process the files in this subdirectory of the directory,
+                e.g. one that was just created (default: the whole directory)
             
         Returns:
             Dict: Summary of processing results
         """
-        if num_processes is None:
-            num_processes = multiprocessing.cpu_count()
-            
-        bibtex_files, pdf_files = self.find_files(recursive=recursive)
+        bibtex_files, pdf_files = self.find_files(recursive=recursive, subdirectory=subdirectory)
         
         if self.dry_run:
             logger.info(f"Would process {len(bibtex_files)} BibTeX files and {len(pdf_files)} PDF files")
@@ -899,7 +1702,7 @@ class DirectoryProcessor:
                 logger.info(f"  BibTeX: {bib_file}")
             for pdf_file in pdf_files:
                 logger.info(f"  PDF: {pdf_file}")
-            return {"bibtex_processed": 0, "bibtex_failed": 0, "pdf_processed": 0, "pdf_failed": 0}
+            return {"bibtex_processed": 0, "bibtex_failed": 0, "pdf_processed": 0, "pdf_failed": 0, "pdf_skipped": 0}
         
         # Create the output directory if it doesn't exist
         self.output_dir.mkdir(exist_ok=True, parents=True)
@@ -909,6 +1712,8 @@ class DirectoryProcessor:
         bibtex_failed = 0
         pdf_processed = 0
         pdf_failed = 0
+        pdf_cache_hits = 0
+        pdf_cache_misses = 0
         
         # Process BibTeX files
         if bibtex_files:
@@ -916,250 +1721,192 @@ class DirectoryProcessor:
             for bib_file in bibtex_files:
                 try:
                     # For BibTeX files, we use the standard BibliographyProcessor
-                    with BibliographyProcessor(bib_file, dry_run=self.dry_run, quiet=self.quiet) as processor:
-                        processor.process_all(force=force, num_processes=num_processes)
+                    with BibliographyProcessor(
+                        bib_file, dry_run=self.dry_run, quiet=self.quiet, hasher=self.hasher, store=self.store,
+                        limits=self.limits, pool=self.pool
+                    ) as processor:
+                        processor.process_all(force=force, num_processes=num_processes, paranoid=paranoid)
                     bibtex_processed += 1
                 except Exception as e:
                     logger.error(f"Failed to process BibTeX file {bib_file}: {e}\n{traceback.format_exc()}")
                     bibtex_failed += 1
         
-        # Process PDF files with process_map
+        # Process PDF files, skipping the ones that are unchanged
+        pdf_skipped = 0
         if pdf_files:
             logger.info(f"Processing {len(pdf_files)} PDF files")
-            
-            # Prepare PDF processing arguments
-            pdf_args = []
-            for pdf_file in pdf_files:
-                try:
-                    # Calculate the relative path from the input directory
-                    rel_path = pdf_file.relative_to(self.directory_path)
-                    
-                    # Create the output subdirectory
-                    output_subdir = self.output_dir / rel_path.parent
-                    output_subdir.mkdir(exist_ok=True, parents=True)
-                    
-                    # Create a custom output directory for this PDF
-                    pdf_output_dir = output_subdir / pdf_file.stem
-                    pdf_output_dir.mkdir(exist_ok=True, parents=True)
-                    
-                    # Add to processing arguments
-                    pdf_args.append((pdf_file, pdf_output_dir, force))
-                except Exception as e:
-                    logger.error(f"Failed to prepare PDF file {pdf_file}: {e}\n{traceback.format_exc()}")
-                    pdf_failed += 1
-            
-            # Process PDFs in parallel with progress bar
-            if pdf_args:
-                results = process_map(
-                    self._process_pdf_wrapper,
-                    pdf_args,
-                    max_workers=num_processes,
-                    desc="Processing PDFs",
-                    unit="file"
+            with self:
+                results, pdf_skipped = self.process_pdfs(
+                    pdf_files, force=force, num_processes=num_processes, paranoid=paranoid
                 )
-                
-                # Count successes and failures
-                for result in results:
-                    if result.success:
-                        pdf_processed += 1
-                    else:
-                        pdf_failed += 1
+            for result in results:
+                if result.success:
+                    pdf_processed += 1
+                    pdf_cache_hits += result.cache_hits
+                    pdf_cache_misses += result.cache_misses
+                else:
+                    pdf_failed += 1
         
         # Log summary
         logger.info(f"Directory processing complete:")
         logger.info(f"  BibTeX files: {bibtex_processed} processed successfully, {bibtex_failed} failed")
-        logger.info(f"  PDF files: {pdf_processed} processed successfully, {pdf_failed} failed")
+        logger.info(
+            f"  PDF files: {pdf_processed} processed successfully, {pdf_failed} failed, {pdf_skipped} unchanged"
+        )
+        if pdf_cache_hits or pdf_cache_misses:
+            logger.info(f"  Conversion cache: {pdf_cache_hits} hits, {pdf_cache_misses} misses")
+        self.store.evict()
         
         return {
             "bibtex_processed": bibtex_processed,
             "bibtex_failed": bibtex_failed,
             "pdf_processed": pdf_processed,
-            "pdf_failed": pdf_failed
+            "pdf_failed": pdf_failed,
+            "pdf_skipped": pdf_skipped
         }
     
-    def _process_pdf_wrapper(self, args):
-        """Wrapper for _process_pdf to use with process_map.
+    def verify(self, invalidate: bool = True, recursive: bool = True) -> Dict[str, List[str]]:
+        """Verify the output of the PDFs and BibTeX files in the directory against their manifests.
+        
+        The PDFs are verified against the state database of the directory, the
+        BibTeX files against their own (see StateTrackingProcessor.verify).
         
         Args:
-            args: Tuple of (pdf_path, output_dir, force)
-            
+            invalidate: Whether to remove entries whose output doesn't match from
+                the database, so that the next run converts them again
+            recursive: Whether to verify the BibTeX files in subdirectories
+        
         Returns:
-            ProcessingResult: Object containing processing results and status
+            Dict[str, List[str]]: Mismatches found, keyed by the key of the PDF, or by
+                the path of the BibTeX file and the citation key (e.g. 'refs.bib:Smith2020')
         """
-        pdf_path, output_dir, force = args
-        try:
-            return self._process_pdf(pdf_path, output_dir, force)
-        except Exception as e:
-            logger.error(f"Failed to process PDF file {pdf_path}: {e}\n{traceback.format_exc()}")
-            return ProcessingResult(
-                citation_key=pdf_path.stem,
-                file_hashes={},
-                dir_hash="",
-                success=False
-            )
+        problems = super().verify(invalidate=invalidate)
+        bibtex_files, _ = self.find_files(recursive=recursive)
+        for bib_file in bibtex_files:
+            processor = BibliographyProcessor(bib_file, dry_run=True, quiet=True, store=self.store)
+            name = bib_file.relative_to(self.directory_path).as_posix()
+            for citation_key, entry_problems in processor.verify(invalidate=invalidate).items():
+                problems[f"{name}:{citation_key}"] = entry_problems
+        return problems
 
-    def _process_pdf(self, pdf_path: Path, output_dir: Path, force: bool = False) -> ProcessingResult:
-        """Process a single PDF file.
+    def get_pdf_key(self, pdf_path: Path) -> str:
+        """Get the key of a PDF in the state database.
         
         Args:
-            pdf_path: Path to the PDF file
-            output_dir: Directory to store the output
-            force: Whether to force reprocessing
+            pdf_path: Path to a PDF file in the directory
             
         Returns:
-            ProcessingResult: Object containing processing results and status
+            str: Path of the PDF's output directory relative to the output directory
         """
-        if not BibliographyProcessor.is_pdf_file(pdf_path):
-            logger.error(f"Not a PDF file: {pdf_path}")
-            return ProcessingResult(citation_key="", file_hashes={}, dir_hash="", success=False)
-        
-        citation_key = pdf_path.stem
-        logger.info(f"Processing PDF: {pdf_path} with key: {citation_key}")
-        
-        if self.dry_run:
-            logger.info(f"Would process PDF: {pdf_path}")
-            return ProcessingResult(citation_key=citation_key, file_hashes={}, dir_hash="", success=True)
-        
-        # Process the PDF
-        error = validate_windows_path(output_dir)
-        if error:
-            logger.error(f"Invalid output directory path: {error}")
-            return ProcessingResult(citation_key=citation_key, file_hashes={}, dir_hash="", success=False)
-        
-        output_dir.mkdir(exist_ok=True, parents=True)
-        
-        # Reset MuPDF warnings before processing
-        pymupdf.TOOLS.reset_mupdf_warnings()
-        mupdf_warning_count = 0
-        
-        # Create a simplified link/copy of the PDF
-        simple_pdf = output_dir / f"{citation_key}.pdf"
-        try:
-            if simple_pdf.exists() or simple_pdf.is_symlink():
-                simple_pdf.unlink()
-            simple_pdf.symlink_to(pdf_path.resolve())
-            logger.debug(f"Created symbolic link for processing: {simple_pdf} -> {pdf_path}")
-        except OSError as e:
-            # If symlink fails (e.g., on Windows without admin rights), make a copy
-            logger.debug(f"Symlink failed, creating copy instead: {e}")
-            import shutil
-            shutil.copy2(pdf_path, simple_pdf)
-            logger.debug(f"Created copy for processing: {simple_pdf}")
-        
-        # Process PDF to markdown with images
-        md_text = pymupdf4llm.to_markdown(
-            str(simple_pdf),
-            write_images=True,
-            image_path=str(output_dir),
-            show_progress=False  # Disable pymupdf4llm progress bar
-        )
-        
-        # Clean up the temporary copy if it was created (but keep symlinks)
-        if simple_pdf.exists() and not simple_pdf.is_symlink():
-            simple_pdf.unlink()
-            logger.debug(f"Cleaned up temporary PDF copy: {simple_pdf}")
-        
-        # Check for warnings
-        warnings = pymupdf.TOOLS.mupdf_warnings()
-        if warnings:
-            # Combine characters into complete messages
-            warning_messages = []
-            current_message = []
-            for char in warnings:
-                if char == '\n':
-                    if current_message:
-                        warning_messages.append(''.join(current_message))
-                        current_message = []
-                else:
-                    current_message.append(char)
-            if current_message:
-                warning_messages.append(''.join(current_message))
-            
-            mupdf_warning_count = len(warning_messages)
-            if warning_messages:
-                logger.debug(f"MuPDF warnings for '{pdf_path.name}': {';'.join(warning_messages)}")
-        
-        # Write output markdown file
-        final_content = f"# Citation Key: {citation_key}\n\n---\n\n{md_text}"
-        final_md = output_dir / f"{citation_key}.md"
-        
-        # Validate markdown output path
-        error = validate_windows_path(final_md)
-        if error:
-            logger.error(f"Invalid markdown output path: {error}")
-            return ProcessingResult(citation_key=citation_key, file_hashes={}, dir_hash="", success=False)
-        
-        final_md.write_text(final_content, encoding='utf-8')
-        
-        # Compute hashes for change tracking
-        current_hash = self._compute_file_hash(str(pdf_path))
-        current_hashes = {str(pdf_path): current_hash}
-        
-        # Compute directory hash after processing
-        new_dir_hash = self._compute_dir_hash(output_dir)
-        
-        logger.info(f"Successfully processed PDF: {pdf_path}")
-        return ProcessingResult(
-            citation_key=citation_key,
-            file_hashes=current_hashes,
-            dir_hash=new_dir_hash,
-            success=True,
-            mupdf_warning_count=mupdf_warning_count
-        )
+        if not pdf_path.is_relative_to(self.directory_path):
+            # Paths of watched files are not necessarily resolved
+            pdf_path = pdf_path.parent.resolve() / pdf_path.name
+        rel_path = pdf_path.relative_to(self.directory_path)
+        return (rel_path.parent / pdf_path.stem).as_posix()
 
-    def _compute_file_hash(self, filepath: str) -> str:
-        """Compute SHA-256 hash of a file.
+    def process_pdfs(
+        self,
+        pdf_files: List[Path],
+        force: bool = False,
+        num_processes: Union[int, str, None] = None,
+        paranoid: bool = False
+    ) -> Tuple[List[ProcessingResult], int]:
+        """Convert the PDFs that changed since they were last converted.
+        
+        The processor must be used as a context manager, so that the state
+        database is open.
         
         Args:
-            filepath: Path to the file to hash
+            pdf_files: PDF files in the directory
+            force: Whether to convert all PDFs without checking them
+            num_processes: Number of parallel processes to use, or AUTO_PROCESSES to calibrate it
+                (default: number of available CPUs)
+            paranoid: Whether to hash all PDFs, even those whose stat signature is unchanged
             
         Returns:
-            str: Hex digest of the file's SHA-256 hash, or empty string on error
+            Tuple of (results of the PDFs that were converted or failed, number of unchanged PDFs)
         """
-        try:
-            with open(filepath, 'rb') as f:
-                return hashlib.sha256(f.read()).hexdigest()
-        except Exception as e:
-            logger.error(f"Failed to compute hash for {filepath}: {e}\n{traceback.format_exc()}")
-            return ""
-
-    def _compute_dir_hash(self, directory: Path) -> str:
-        """Compute a hash of a directory's contents.
+        tasks = []
+        results = []
+        for pdf_file in pdf_files:
+            try:
+                key = self.get_pdf_key(pdf_file)
+                tasks.append((pdf_file, self.output_dir / key, key, self.hasher, self.store))
+            except Exception as e:
+                logger.error(f"Failed to prepare PDF file {pdf_file}: {e}\n{traceback.format_exc()}")
+                results.append(ProcessingResult(citation_key=pdf_file.stem, file_hashes={}, dir_hash="", success=False))
+        
+        # Stale PDFs are scheduled right away, while the change detection of
+        # the remaining PDFs continues
+        scan = ChangeScan()
+        stale_tasks = self._find_stale_pdfs(
+            tasks, scan, force=force, paranoid=paranoid, num_threads=worker_count(num_processes)
+        )
+        first_task = next(stale_tasks, None)
+        
+        def scheduled():
+            found = 0
+            for task in itertools.chain([first_task], stale_tasks):
+                found += 1
+                yield task[2], [task[0]], task
+            logger.info(
+                f"Change detection for {len(tasks)} PDFs took {scan.duration:.2f}s, found {found} PDFs to process"
+            )
         
-        This function hashes:
-        - The relative paths of all files
-        - For regular files: their contents
-        - For symbolic links: their target paths (not the linked content)
+        def handle_result(key, result):
+            if not result.success:
+                result.citation_key = key
+            results.append(result)
+        
+        if first_task is None:
+            logger.info(f"Change detection for {len(tasks)} PDFs took {scan.duration:.2f}s, found 0 PDFs to process")
+        else:
+            self._run_scheduled(
+                scheduled(), standalone_process_pdf, handle_result,
+                num_processes, desc="Processing PDFs", unit="file"
+            )
+        return results, scan.unchanged
+
+    def _find_stale_pdfs(
+        self,
+        tasks: List[Tuple],
+        scan: ChangeScan,
+        force: bool = False,
+        paranoid: bool = False,
+        num_threads: int = None
+    ) -> Iterator[Tuple]:
+        """Yield the conversion tasks of the PDFs that need processing, as soon as each check completes.
+        
+        Unchanged PDFs are recognized by their stat signature and output
+        manifest. The checks run in parallel threads, like those of
+        BibliographyProcessor._find_stale_entries, and tasks are yielded in
+        completion order.
         
         Args:
-            directory: Path to the directory to hash
+            tasks: Conversion tasks of the PDFs (see standalone_process_pdf)
+            scan: ChangeScan collecting statistics about the change detection
+            force: Whether to yield all tasks without checking them
+            paranoid: Whether to hash all PDFs, even those whose stat signature is unchanged
+            num_threads: Number of threads used for the checks
             
-        Returns:
-            str: Hex digest of the directory's SHA-256 hash, or empty string if directory doesn't exist
+        Yields:
+            Tuple: Conversion tasks of the PDFs that need processing
         """
-        if not directory.exists():
-            return ""
-        
-        # Get all files in directory, including symlinks
-        files = sorted(f for f in directory.glob('**/*') if f.is_file() or f.is_symlink())
-        hasher = hashlib.sha256()
-        
-        for file_path in files:
-            try:
-                # Add relative path to hash
-                rel_path = file_path.relative_to(directory)
-                hasher.update(str(rel_path).encode())
-                
-                if file_path.is_symlink():
-                    # For symlinks, hash only the target path string
-                    target_path = os.readlink(file_path)
-                    hasher.update(str(target_path).encode())
-                else:
-                    # For regular files, hash the contents
-                    with open(file_path, 'rb') as f:
-                        for chunk in iter(lambda: f.read(4096), b''):
-                            hasher.update(chunk)
-            except Exception as e:
-                logger.error(f"Failed to hash file {file_path}: {e}\n{traceback.format_exc()}")
-                
-        return hasher.hexdigest()
\ No newline at end of file
+        start = time.perf_counter()
+        try:
+            if force:
+                yield from tasks
+                return
+            
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                futures = {
+                    executor.submit(self._needs_processing, task[2], [task[0]], paranoid): task
+                    for task in tasks
+                }
+                for future in as_completed(futures):
+                    if future.result():
+                        yield futures[future]
+                    else:
+                        scan.unchanged += 1
+        finally:
+            scan.duration = time.perf_counter() - start
@@ -0,0 +1,259 @@
+"""CPUs and memory available to the worker processes.
+
+multiprocessing.cpu_count() reports all CPUs of the machine, even if the
+process may only run on some of them (taskset, os.sched_setaffinity) or its
+container is limited to a CPU quota (cgroup cpu.max, or cpu.cfs_quota_us with
+cgroup v1, as set by Kubernetes CPU limits). Starting a worker per CPU of a
+64-core node in a pod limited to 4 CPUs only causes the workers to be
+throttled. The default number of workers is therefore the number of CPUs the
+process may use, bounded by its CPU quota and by the available memory.
+"""
+
+import logging
+import math
+import os
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+# Create logger
+logger = logging.getLogger(__name__)
+
+# Value of --processes choosing the number of workers by calibration
+AUTO_PROCESSES = "auto"
+# Memory assumed for each worker when choosing the default number of workers
+MEMORY_PER_WORKER = 512 * 1024**2
+# Share of the total memory used as default memory budget of the worker pool
+DEFAULT_MEMORY_SHARE = 0.8
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+PROC_CGROUP = Path("/proc/self/cgroup")
+PROC_MEMINFO = Path("/proc/meminfo")
+
+# cgroup v1 reports an unlimited memory limit as a huge number
+_UNLIMITED = 2**60
+
+
+def _read(path: Path) -> Optional[str]:
+    try:
+        return path.read_text().strip()
+    except (OSError, ValueError):
+        return None
+
+
+def _cgroup_dirs(controller: str) -> List[Path]:
+    """Get the cgroup directories of the current process and their parents.
+
+    Args:
+        controller: Name of the cgroup v1 controller, e.g. 'cpu' or 'memory'
+
+    Returns:
+        List[Path]: Existing cgroup directories, the cgroup of the process first
+    """
+    dirs = []
+    for line in (_read(PROC_CGROUP) or "").splitlines():
+        try:
+            _, controllers, path = line.split(":", 2)
+        except ValueError:
+            continue
+        if controllers == "":
+            # cgroup v2
+            directory = CGROUP_ROOT / path.lstrip("/")
+        elif controller in controllers.split(","):
+            directory = CGROUP_ROOT / controllers / path.lstrip("/")
+        else:
+            continue
+        # Limits of parent cgroups apply as well
+        dirs.extend([directory, *directory.parents])
+    dirs.extend([CGROUP_ROOT, CGROUP_ROOT / controller])
+    unique = []
+    for directory in dirs:
+        if directory not in unique and directory.is_relative_to(CGROUP_ROOT) and directory.is_dir():
+            unique.append(directory)
+    return unique
+
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """Get the CPU quota of the cgroup of the current process.
+
+    Returns:
+        Optional[float]: Number of CPUs the quota allows, or None if there is no quota
+    """
+    limits = []
+    for directory in _cgroup_dirs("cpu"):
+        cpu_max = _read(directory / "cpu.max")
+        if cpu_max:
+            quota, _, period = cpu_max.partition(" ")
+            if quota != "max" and period:
+                limits.append(int(quota) / int(period))
+            continue
+        quota, period = _read(directory / "cpu.cfs_quota_us"), _read(directory / "cpu.cfs_period_us")
+        if quota and period and int(quota) > 0:
+            limits.append(int(quota) / int(period))
+    return min(limits) if limits else None
+
+
+def _cgroup_memory() -> List[Tuple[int, int]]:
+    """Get the memory limits and usages of the cgroup of the current process and its parents.
+
+    Returns:
+        List[Tuple[int, int]]: (limit, usage) in bytes of each cgroup with a memory limit
+    """
+    limits = []
+    for directory in _cgroup_dirs("memory"):
+        for limit_file, usage_file in (
+            ("memory.max", "memory.current"),  # cgroup v2
+            ("memory.limit_in_bytes", "memory.usage_in_bytes")  # cgroup v1
+        ):
+            limit = _read(directory / limit_file)
+            if limit and limit != "max" and int(limit) < _UNLIMITED:
+                limits.append((int(limit), int(_read(directory / usage_file) or 0)))
+    return limits
+
+
+def cgroup_memory_limit() -> Optional[int]:
+    """Get the memory available to the cgroup of the current process.
+
+    Returns:
+        Optional[int]: Memory limit minus current usage in bytes, or None if there is no limit
+    """
+    available = [max(0, limit - usage) for limit, usage in _cgroup_memory()]
+    return min(available) if available else None
+
+
+def cgroup_memory_max() -> Optional[int]:
+    """Get the memory limit of the cgroup of the current process.
+
+    Returns:
+        Optional[int]: Memory limit in bytes, or None if there is no limit
+    """
+    limits = [limit for limit, _ in _cgroup_memory()]
+    return min(limits) if limits else None
+
+
+def available_cpus() -> int:
+    """Get the number of CPUs the current process may use.
+
+    Returns:
+        int: CPUs in the affinity mask of the process, bounded by its cgroup CPU quota
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not available on macOS and Windows
+        cpus = os.cpu_count() or 1
+    quota = cgroup_cpu_limit()
+    if quota:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+
+def available_memory() -> Optional[int]:
+    """Get the memory available to the current process.
+
+    Returns:
+        Optional[int]: Available memory of the machine (MemAvailable), bounded by
+            the cgroup memory limit, in bytes, or None if it can't be determined
+    """
+    memory = None
+    for line in (_read(PROC_MEMINFO) or "").splitlines():
+        if line.startswith("MemAvailable:"):
+            memory = int(line.split()[1]) * 1024
+            break
+    if memory is None:
+        try:
+            memory = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        except (AttributeError, ValueError, OSError):
+            pass
+    limit = cgroup_memory_limit()
+    if limit is not None:
+        memory = limit if memory is None else min(memory, limit)
+    return memory
+
+
+def total_memory() -> Optional[int]:
+    """Get the total memory the current process may use.
+
+    Unlike available_memory, this doesn't depend on the memory used by other
+    processes at the time of the call.
+
+    Returns:
+        Optional[int]: Physical memory of the machine (MemTotal), bounded by
+            the cgroup memory limit, in bytes, or None if it can't be determined
+    """
+    memory = None
+    for line in (_read(PROC_MEMINFO) or "").splitlines():
+        if line.startswith("MemTotal:"):
+            memory = int(line.split()[1]) * 1024
+            break
+    if memory is None:
+        try:
+            memory = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        except (AttributeError, ValueError, OSError):
+            pass
+    limit = cgroup_memory_max()
+    if limit is not None:
+        memory = limit if memory is None else min(memory, limit)
+    return memory
+
+
+def default_processes() -> int:
+    """Get the default number of worker processes.
+
+    Returns:
+        int: Number of available CPUs, bounded by the available memory
+            (MEMORY_PER_WORKER per worker)
+    """
+    processes = available_cpus()
+    memory = available_memory()
+    if memory is not None:
+        processes = min(processes, max(1, memory // MEMORY_PER_WORKER))
+    return processes
+
+
+def default_memory_budget() -> Optional[int]:
+    """Get the default memory budget of the worker pool.
+
+    The budget is based on the total rather than the currently available
+    memory, so that it stays valid for the lifetime of a long-running watch.
+
+    Returns:
+        Optional[int]: DEFAULT_MEMORY_SHARE of the total memory (see
+            total_memory) in bytes, or None if it can't be determined
+    """
+    memory = total_memory()
+    return int(memory * DEFAULT_MEMORY_SHARE) if memory else None
+
+
+def worker_count(num_processes: Union[int, str, None]) -> int:
+    """Get the number of worker processes to start.
+
+    Args:
+        num_processes: Number of processes, AUTO_PROCESSES or None
+
+    Returns:
+        int: The number of processes, or default_processes() for None and
+            AUTO_PROCESSES (the maximum explored by the calibration)
+    """
+    if num_processes is None or num_processes == AUTO_PROCESSES:
+        return default_processes()
+    return num_processes
+
+
+def parse_processes(value: str) -> Union[int, str]:
+    """Parse the value of --processes.
+
+    Args:
+        value: A positive number, or 'auto'
+
+    Returns:
+        Union[int, str]: The number of processes, or AUTO_PROCESSES
+    """
+    if value.strip().lower() == AUTO_PROCESSES:
+        return AUTO_PROCESSES
+    try:
+        processes = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid number of processes: {value}") from None
+    if processes < 1:
+        raise ValueError(f"Invalid number of processes: {value}")
+    return processes
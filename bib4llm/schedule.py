@@ -0,0 +1,266 @@
+"""Cost-aware scheduling of conversion tasks.
+
+The time needed to convert an entry is dominated by the number of pages of its
+PDFs. Before converting, a cheap preflight step reads the size and page count
+of each attachment (opening a PDF only reads its cross-reference table, not
+its pages) and estimates the cost of each entry from them.
+
+Tasks are submitted longest first, so that a large book is started right away
+instead of deciding the total time when it happens to come last in the BibTeX
+file. The order is applied within windows of entries (see windows), so that
+conversion starts while the change detection is still finding entries. Entries
+estimated to be cheap are grouped into batches processed by a single task, so
+that the overhead of submitting a task doesn't dominate libraries with many
+small entries, while expensive entries get a task of their own.
+
+The same preflight estimates the memory each entry needs, from the size and
+page count of its attachments, or from the peak memory measured when the
+entry was last converted. The worker pool only starts tasks while their
+estimates stay within the memory budget (see workers.WorkerPool).
+
+With --processes auto, the number of workers is calibrated on the first
+entries of the run: the throughput, in estimated conversion time completed
+per second, is measured for a growing number of workers, and the run settles
+on the number of workers with the best throughput.
+"""
+
+import heapq
+import itertools
+import logging
+import mimetypes
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+from .convert import page_count
+
+# Create logger
+logger = logging.getLogger(__name__)
+
+# Rough conversion time per PDF page and per MiB of attachments, in seconds
+SECONDS_PER_PAGE = 0.1
+SECONDS_PER_MIB = 0.01
+# Time needed to submit a task and write its output, in seconds
+TASK_OVERHEAD = 0.05
+# Entries estimated to take less are batched, into batches of up to BATCH_COST seconds
+SMALL_TASK_COST = 0.5
+BATCH_COST = 2.0
+MAX_BATCH_SIZE = 32
+# Largest number of entries ordered longest first at a time
+SCHEDULE_WINDOW = 256
+# Rough memory needed by a worker converting a PDF, in bytes: a base for the
+# interpreter and MuPDF, plus the decoded content of the file and its pages
+BASE_MEMORY = 100 * 1024**2
+MEMORY_PER_MIB = 4 * 1024**2
+MEMORY_PER_PAGE = 1024**2
+# Minimum time and relative throughput gain of each calibration step
+CALIBRATION_WINDOW = 3.0
+CALIBRATION_MIN_GAIN = 0.1
+
+
+@dataclass
+class Batch:
+    """Items processed by a single task.
+
+    Attributes:
+        items: Items of the batch, in the order they were given
+        cost: Estimated time to process all items, in seconds
+        memory: Estimated memory needed by the task, in bytes (the largest of its items)
+    """
+    items: List
+    cost: float
+    memory: int = 0
+
+
+@dataclass
+class Estimate:
+    """Estimated resources needed to convert the attachments of an entry.
+
+    Attributes:
+        cost: Estimated time in seconds
+        memory: Estimated peak memory of the worker process in bytes
+    """
+    cost: float
+    memory: int
+
+
+def estimate(paths: Iterable[Path], past_peak: Optional[int] = None) -> Estimate:
+    """Estimate the time and memory needed to convert the attachments of an entry.
+
+    Args:
+        paths: Attachments of the entry
+        past_peak: Peak memory measured when the entry was last converted, in
+            bytes, which replaces the memory estimate if known
+
+    Returns:
+        Estimate: The estimated time and memory
+    """
+    cost = TASK_OVERHEAD
+    memory = 0
+    for path in paths:
+        try:
+            size = path.stat().st_size / 1024**2
+            cost += size * SECONDS_PER_MIB
+            pages = 0
+            mime_type, _ = mimetypes.guess_type(path)
+            if mime_type == 'application/pdf':
+                pages = page_count(path)
+                cost += pages * SECONDS_PER_PAGE
+            # Attachments are converted one after another
+            memory = max(memory, int(size * MEMORY_PER_MIB + pages * MEMORY_PER_PAGE))
+        except Exception as e:
+            # The conversion reports unreadable files
+            logger.debug(f"Failed to estimate the conversion of {path}: {e}")
+    return Estimate(cost, past_peak or BASE_MEMORY + memory)
+
+
+def plan_batches(
+    items: Sequence,
+    costs: Sequence[float],
+    num_workers: int,
+    memories: Optional[Sequence[int]] = None
+) -> List[Batch]:
+    """Group items into tasks, ordered longest first.
+
+    Cheap items are batched, but never into batches so large that there are
+    fewer than a few batches per worker.
+
+    Args:
+        items: Items to process
+        costs: Estimated cost of each item (see estimate)
+        num_workers: Number of worker processes
+        memories: Estimated memory of each item in bytes (default: 0)
+
+    Returns:
+        List[Batch]: Tasks in the order they should be submitted
+    """
+    if memories is None:
+        memories = [0] * len(items)
+    total = sum(costs)
+    batch_cost = min(BATCH_COST, total / (4 * max(num_workers, 1)))
+    batches = []
+    current = Batch([], 0.0)
+    for item, cost, memory in zip(items, costs, memories):
+        if cost >= SMALL_TASK_COST or cost >= batch_cost:
+            batches.append(Batch([item], cost, memory))
+            continue
+        current.items.append(item)
+        current.cost += cost
+        current.memory = max(current.memory, memory)
+        if current.cost >= batch_cost or len(current.items) >= MAX_BATCH_SIZE:
+            batches.append(current)
+            current = Batch([], 0.0)
+    if current.items:
+        batches.append(current)
+    return sorted(batches, key=lambda batch: batch.cost, reverse=True)
+
+
+def windows(items: Iterable, first: int, size: int = SCHEDULE_WINDOW) -> Iterator[List]:
+    """Split items into consecutive windows, which are scheduled one after another.
+
+    The first window has `first` items, so that work starts as soon as there
+    is enough of it for every worker. Each further window doubles in size up
+    to `size` items, so that the pool is kept busy with the previous window
+    while the next one is collected. Items are only consumed from the iterable
+    when their window is collected.
+
+    Args:
+        items: Items to schedule
+        first: Number of items in the first window
+        size: Largest number of items in a window
+
+    Yields:
+        List: The items of each window, in the given order
+    """
+    items = iter(items)
+    count = max(first, 1)
+    while True:
+        window = list(itertools.islice(items, count))
+        if not window:
+            return
+        yield window
+        count = min(count * 2, max(size, first))
+
+
+def estimate_makespan(costs: Iterable[float], num_workers: int) -> float:
+    """Estimate the time needed to process tasks submitted in the given order.
+
+    Each task is started by the first worker that becomes free.
+
+    Args:
+        costs: Estimated cost of each task, in submission order
+        num_workers: Number of worker processes
+
+    Returns:
+        float: Estimated time until the last task is finished, in seconds
+    """
+    finish_times = [0.0] * max(num_workers, 1)
+    for cost in costs:
+        heapq.heappush(finish_times, heapq.heappop(finish_times) + cost)
+    return max(finish_times)
+
+
+class Calibration:
+    """Finds the number of workers with the best throughput while converting.
+
+    Starting with one worker, the number of workers is doubled up to the
+    maximum for as long as the throughput improves by at least
+    CALIBRATION_MIN_GAIN. Each step lasts at least CALIBRATION_WINDOW
+    seconds and until as many tasks as workers have completed. The
+    calibration then settles on the best number of workers.
+    """
+
+    def __init__(self, max_workers: int):
+        """Start the calibration.
+
+        Args:
+            max_workers: Largest number of workers to try
+        """
+        self.candidates = []
+        workers = 1
+        while workers < max_workers:
+            self.candidates.append(workers)
+            workers *= 2
+        self.candidates.append(max(max_workers, 1))
+        self.workers = self.candidates[0]
+        self.done = len(self.candidates) == 1
+        self.best = (0.0, self.workers)
+        self._start_step()
+
+    def _start_step(self):
+        self._start = time.monotonic()
+        self._work = 0.0
+        self._tasks = 0
+
+    def observe(self, cost: float) -> int:
+        """Record a completed task.
+
+        Args:
+            cost: Estimated cost of the task (see estimate)
+
+        Returns:
+            int: Number of workers to use from now on
+        """
+        if self.done:
+            return self.workers
+        self._work += cost
+        self._tasks += 1
+        elapsed = time.monotonic() - self._start
+        if elapsed < CALIBRATION_WINDOW or self._tasks < self.workers:
+            return self.workers
+
+        throughput = self._work / elapsed
+        logger.debug(f"Calibration: {throughput:.2f} estimated seconds per second with {self.workers} workers")
+        best_throughput, best_workers = self.best
+        if throughput >= best_throughput * (1 + CALIBRATION_MIN_GAIN):
+            self.best = (throughput, self.workers)
+            index = self.candidates.index(self.workers) + 1
+            if index < len(self.candidates):
+                self.workers = self.candidates[index]
+                self._start_step()
+                return self.workers
+        self.workers = self.best[1]
+        self.done = True
+        logger.info(f"Calibrated the number of worker processes: {self.workers}")
+        return self.workers
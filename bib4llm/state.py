@@ -0,0 +1,405 @@
+"""State database of converted entries.
+
+Every output directory contains a SQLite database (processed_files.db) that
+records, for each converted entry, the hashes and stat signatures of its source
+files and the manifest of its output directory. Entries whose conversion
+failed, e.g. because the worker process timed out or crashed, are recorded
+with the reason of the failure until they are converted successfully.
+
+The source files are recorded in the attachments table, one row per entry and
+file with its stat signature and binary digest, indexed by path and by hash,
+so that the entries using a file, or attachments with the same content, are
+found without decoding the state of every entry. Databases of older versions,
+which stored them as JSON in processed_items, are migrated when opened.
+
+The whole state is loaded into memory with one query per table when the
+database is opened, so change detection never queries the database per entry.
+Results are written in batched transactions using executemany. The database
+runs in WAL mode with synchronous=NORMAL, so a commit doesn't wait for the
+whole database to be synced to disk.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from .manifest import Manifest
+
+# Create logger
+logger = logging.getLogger(__name__)
+
+DB_NAME = "processed_files.db"
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    # Durable at checkpoints; a crash may only lose the last transactions
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    # Page cache of 16 MiB
+    "PRAGMA cache_size=-16384",
+    # Wait for concurrent writers, e.g. a convert run next to a watch
+    "PRAGMA busy_timeout=10000",
+)
+
+
+@dataclass
+class ItemState:
+    """Change tracking state of a converted entry.
+
+    Attributes:
+        file_hashes: Hashes of the source files, keyed by file path
+        dir_hash: Digest of the output manifest (see manifest_digest)
+        file_stats: Stat signatures of the source files, keyed by file path
+        hash_algorithm: Name of the FileHasher used for the hashes (None for legacy rows)
+        manifest: Manifest of the output directory, or None if none was recorded
+        peak_memory: Peak memory of the worker process converting the entry, in bytes (None if unknown)
+    """
+    file_hashes: Dict[str, str] = field(default_factory=dict)
+    dir_hash: Optional[str] = None
+    file_stats: Dict[str, List[int]] = field(default_factory=dict)
+    hash_algorithm: Optional[str] = None
+    manifest: Optional[Manifest] = None
+    peak_memory: Optional[int] = None
+
+
+def _digest_to_blob(file_hash: str) -> Union[bytes, str]:
+    """Convert a hex digest to the binary digest stored in the database.
+
+    Hashes that aren't hex digests are stored as they are.
+    """
+    try:
+        return bytes.fromhex(file_hash)
+    except ValueError:
+        return file_hash
+
+
+def _blob_to_digest(file_hash: Union[bytes, str]) -> str:
+    """Convert a digest stored in the database back to a hex digest."""
+    return file_hash.hex() if isinstance(file_hash, bytes) else file_hash
+
+
+def _attachment_rows(
+    citation_key: str,
+    file_hashes: Dict[str, str],
+    file_stats: Dict[str, List[int]]
+) -> List[Tuple]:
+    """Get the rows of the attachments table of an entry.
+
+    Args:
+        citation_key: Citation key of the entry
+        file_hashes: Hashes of the source files, keyed by file path
+        file_stats: Stat signatures of the source files, keyed by file path
+
+    Returns:
+        List[Tuple]: Rows of (citation_key, path, size, mtime_ns, inode, device, hash)
+    """
+    rows = []
+    for path in {**file_stats, **file_hashes}:
+        signature = file_stats.get(path) or [None] * 4
+        file_hash = file_hashes.get(path)
+        rows.append((
+            citation_key, path, *signature,
+            _digest_to_blob(file_hash) if file_hash is not None else None
+        ))
+    return rows
+
+
+def init_schema(conn: sqlite3.Connection):
+    """Create the state database schema, migrating older databases if needed.
+
+    Args:
+        conn: Open connection to the state database
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS processed_items (
+            citation_key TEXT PRIMARY KEY,
+            file_hashes TEXT,
+            last_processed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            dir_hash TEXT,
+            file_stats TEXT,
+            hash_algorithm TEXT,
+            peak_memory INTEGER
+        )
+    """)
+    # Databases created by older versions lack some of the columns.
+    # Rows without hash_algorithm were hashed with full SHA-256.
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(processed_items)")]
+    for column in ('file_stats', 'hash_algorithm'):
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE processed_items ADD COLUMN {column} TEXT")
+    if 'peak_memory' not in columns:
+        cursor.execute("ALTER TABLE processed_items ADD COLUMN peak_memory INTEGER")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS output_manifest (
+            citation_key TEXT NOT NULL,
+            rel_path TEXT NOT NULL,
+            size INTEGER,
+            mtime_ns INTEGER,
+            hash TEXT,
+            PRIMARY KEY (citation_key, rel_path)
+        )
+    """)
+    migrate = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'attachments'"
+    ).fetchone() is None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS attachments (
+            citation_key TEXT NOT NULL,
+            path TEXT NOT NULL,
+            size INTEGER,
+            mtime_ns INTEGER,
+            inode INTEGER,
+            device INTEGER,
+            hash BLOB,
+            PRIMARY KEY (citation_key, path)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS attachments_path ON attachments (path)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS attachments_hash ON attachments (hash)")
+    if migrate:
+        # Move the JSON columns of older versions into the attachments table
+        rows = cursor.execute(
+            "SELECT citation_key, file_hashes, file_stats FROM processed_items "
+            "WHERE file_hashes IS NOT NULL OR file_stats IS NOT NULL"
+        ).fetchall()
+        cursor.executemany(
+            "INSERT INTO attachments (citation_key, path, size, mtime_ns, inode, device, hash) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                row
+                for citation_key, file_hashes, file_stats in rows
+                for row in _attachment_rows(
+                    citation_key, json.loads(file_hashes or '{}'), json.loads(file_stats or '{}')
+                )
+            ]
+        )
+        cursor.execute("UPDATE processed_items SET file_hashes = NULL, file_stats = NULL")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS failed_items (
+            citation_key TEXT PRIMARY KEY,
+            reason TEXT,
+            failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+
+
+class StateDB:
+    """In-memory view of a state database, written back in batches.
+
+    The database may be used from several threads; writes are serialized
+    with a lock, while reads only access the in-memory state.
+    """
+
+    def __init__(self, path: Path):
+        """Open the state database and load its content.
+
+        Args:
+            path: Path to the database file, which is created if needed
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        for pragma in PRAGMAS:
+            self.conn.execute(pragma)
+        init_schema(self.conn)
+        self.items: Dict[str, ItemState] = self._load()
+        # Reasons of the last failures of entries that were not converted since
+        self.failures: Dict[str, str] = dict(
+            self.conn.execute("SELECT citation_key, reason FROM failed_items")
+        )
+
+    def _load(self) -> Dict[str, ItemState]:
+        """Load all entries, their attachments and their manifests."""
+        items = {
+            citation_key: ItemState(dir_hash=dir_hash, hash_algorithm=hash_algorithm, peak_memory=peak_memory)
+            for citation_key, dir_hash, hash_algorithm, peak_memory in self.conn.execute(
+                "SELECT citation_key, dir_hash, hash_algorithm, peak_memory FROM processed_items"
+            )
+        }
+        for citation_key, path, size, mtime_ns, inode, device, file_hash in self.conn.execute(
+            "SELECT citation_key, path, size, mtime_ns, inode, device, hash FROM attachments"
+        ):
+            item = items.get(citation_key)
+            if item is not None:
+                if file_hash is not None:
+                    item.file_hashes[path] = _blob_to_digest(file_hash)
+                if size is not None:
+                    item.file_stats[path] = [size, mtime_ns, inode, device]
+        for citation_key, rel_path, size, mtime_ns, file_hash in self.conn.execute(
+            "SELECT citation_key, rel_path, size, mtime_ns, hash FROM output_manifest"
+        ):
+            item = items.get(citation_key)
+            if item is not None:
+                if item.manifest is None:
+                    item.manifest = {}
+                item.manifest[rel_path] = [size, mtime_ns, file_hash]
+        return items
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Close the database connection."""
+        self.conn.close()
+
+    def get(self, citation_key: str) -> Optional[ItemState]:
+        """Get the state of an entry.
+
+        Args:
+            citation_key: Citation key of the entry
+
+        Returns:
+            Optional[ItemState]: The state, or None if the entry was never converted
+        """
+        return self.items.get(citation_key)
+
+    def citation_keys_for_path(self, path: str) -> List[str]:
+        """Get the entries that were converted from a file.
+
+        Args:
+            path: Path of the file, as referenced by the entries
+
+        Returns:
+            List[str]: Citation keys of the entries, sorted
+        """
+        with self._lock:
+            return [row[0] for row in self.conn.execute(
+                "SELECT DISTINCT citation_key FROM attachments WHERE path = ? ORDER BY citation_key", (path,)
+            )]
+
+    def citation_keys_for_hash(self, file_hash: str) -> List[str]:
+        """Get the entries that were converted from a file with the given content.
+
+        Args:
+            file_hash: Hex digest of the file (see FileHasher.hash_file)
+
+        Returns:
+            List[str]: Citation keys of the entries, sorted
+        """
+        with self._lock:
+            return [row[0] for row in self.conn.execute(
+                "SELECT DISTINCT citation_key FROM attachments WHERE hash = ? ORDER BY citation_key",
+                (_digest_to_blob(file_hash),)
+            )]
+
+    def duplicate_attachments(self) -> Dict[str, List[str]]:
+        """Find attachments with the same content at different paths.
+
+        Returns:
+            Dict[str, List[str]]: Sorted paths of the attachments, keyed by the
+                hex digest of their content
+        """
+        duplicates: Dict[str, List[str]] = {}
+        with self._lock:
+            for file_hash, path in self.conn.execute(
+                """
+                SELECT DISTINCT hash, path FROM attachments WHERE hash IN (
+                    SELECT hash FROM attachments WHERE length(hash) > 0
+                    GROUP BY hash HAVING COUNT(DISTINCT path) > 1
+                )
+                ORDER BY hash, path
+                """
+            ):
+                duplicates.setdefault(_blob_to_digest(file_hash), []).append(path)
+        return duplicates
+
+    def record(self, items: Dict[str, ItemState]):
+        """Store the state of entries in a single transaction.
+
+        Args:
+            items: States of the entries, keyed by citation key
+        """
+        if not items:
+            return
+        keys = [(citation_key,) for citation_key in items]
+        with self._lock, self.conn:
+            self.conn.executemany(
+                """
+                INSERT OR REPLACE INTO processed_items
+                (citation_key, dir_hash, hash_algorithm, peak_memory)
+                VALUES (?, ?, ?, ?)
+                """,
+                [
+                    (citation_key, item.dir_hash, item.hash_algorithm, item.peak_memory)
+                    for citation_key, item in items.items()
+                ]
+            )
+            self.conn.executemany("DELETE FROM attachments WHERE citation_key = ?", keys)
+            self.conn.executemany(
+                "INSERT INTO attachments (citation_key, path, size, mtime_ns, inode, device, hash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    row
+                    for citation_key, item in items.items()
+                    for row in _attachment_rows(citation_key, item.file_hashes, item.file_stats)
+                ]
+            )
+            self.conn.executemany("DELETE FROM output_manifest WHERE citation_key = ?", keys)
+            self.conn.executemany("DELETE FROM failed_items WHERE citation_key = ?", keys)
+            self.conn.executemany(
+                "INSERT INTO output_manifest (citation_key, rel_path, size, mtime_ns, hash) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (citation_key, rel_path, *record)
+                    for citation_key, item in items.items()
+                    for rel_path, record in (item.manifest or {}).items()
+                ]
+            )
+            self.items.update(items)
+            for citation_key in items:
+                self.failures.pop(citation_key, None)
+
+    def record_failures(self, failures: Dict[str, str]):
+        """Record entries whose conversion failed in a single transaction.
+
+        Failed entries keep their previous state, so they are retried by the next run.
+
+        Args:
+            failures: Reasons of the failures, keyed by citation key
+        """
+        if not failures:
+            return
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO failed_items (citation_key, reason) VALUES (?, ?)",
+                list(failures.items())
+            )
+            self.failures.update(failures)
+
+    def record_manifest(self, citation_key: str, manifest: Manifest):
+        """Store the manifest of an already recorded entry.
+
+        Args:
+            citation_key: Citation key of the entry
+            manifest: Manifest of its output directory
+        """
+        item = self.items[citation_key]
+        self.record({citation_key: ItemState(
+            item.file_hashes, item.dir_hash, item.file_stats, item.hash_algorithm, manifest, item.peak_memory
+        )})
+
+    def remove(self, citation_keys: Iterable[str]):
+        """Remove the state of entries.
+
+        Args:
+            citation_keys: Citation keys of the entries to remove
+        """
+        keys = [(citation_key,) for citation_key in citation_keys]
+        if not keys:
+            return
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM processed_items WHERE citation_key = ?", keys)
+            self.conn.executemany("DELETE FROM attachments WHERE citation_key = ?", keys)
+            self.conn.executemany("DELETE FROM output_manifest WHERE citation_key = ?", keys)
+            self.conn.executemany("DELETE FROM failed_items WHERE citation_key = ?", keys)
+            for (citation_key,) in keys:
+                self.items.pop(citation_key, None)
+                self.failures.pop(citation_key, None)
@@ -0,0 +1,761 @@
+"""Content-addressed store of PDF conversions.
+
+Each PDF is converted once per distinct content. The markdown and extracted
+images are kept in the store under the content hash of the PDF, and the output
+directory of every entry attaching that PDF is materialized from the store by
+hard-linking the images (or copying them where hard links are not supported)
+and rewriting the image references in the markdown. A duplicate attachment
+therefore costs a few links instead of a full conversion.
+
+By default the store is a user-level cache in ``~/.cache/bib4llm`` shared by
+all projects. Conversions are keyed by the converter versions and options in
+addition to the content hash, and the least recently used conversions are
+evicted when the cache grows beyond its maximum size. Evicting a conversion
+doesn't affect output directories materialized from it.
+
+PDFs with more than ``split_pages`` pages are converted in ranges of that many
+pages. Each range is stored as a part of the entry and may be converted by a
+different worker process (see convert_part); once all parts exist, they are
+stitched together in page order into the entry and removed. A conversion that
+is interrupted keeps its finished parts for the next attempt.
+
+Every conversion records a fingerprint of each page (see
+convert.page_fingerprints) and the store remembers which content was last
+converted for each PDF path. When a PDF changes, e.g. because highlights were
+added to it, only the pages whose fingerprints differ from the last conversion
+of the same path are converted again and spliced into the earlier conversion.
+Adding annotations changes no fingerprints and thus converts nothing.
+
+Store layout::
+
+    <root>/<converter signature>/<algorithm>/<digest[:2]>/<digest>/
+        document.md     markdown as produced by the converter
+        meta.json       image reference prefix used in document.md, length of the
+                        markdown of each page, header levels and page fingerprints
+        document.pdf-<page>-<index>.png ...
+    <root>/<converter signature>/<algorithm>/<digest[:2]>/<digest>.parts/<start>-<stop>/
+        (same files for the pages start to stop - 1, without fingerprints)
+    <root>/<converter signature>/<algorithm>/paths/<path hash[:2]>/<path hash>
+        digest of the last conversion of the PDF at a path
+
+The modification time of meta.json records when a conversion was last used.
+"""
+
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+from .convert import (
+    Conversion, converter_signature, header_levels, identify_headers, page_count, page_fingerprints, pdf_to_markdown
+)
+from .fingerprint import FileHasher
+
+# Create logger
+logger = logging.getLogger(__name__)
+
+# Default maximum size of the conversion cache
+DEFAULT_MAX_SIZE = 10 * 1024**3
+
+# PDFs with more pages are converted in page ranges of this size
+DEFAULT_SPLIT_PAGES = 100
+
+# Units accepted by parse_size
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+# Neutral name under which PDFs are converted, so that the stored images don't
+# depend on the name of the attachment
+PDF_NAME = "document.pdf"
+MARKDOWN_FILE = "document.md"
+META_FILE = "meta.json"
+
+
+def default_cache_dir() -> Path:
+    """Get the location of the user-level conversion cache.
+
+    Returns:
+        Path: $BIB4LLM_CACHE_DIR if set, else $XDG_CACHE_HOME/bib4llm or ~/.cache/bib4llm
+    """
+    if os.environ.get("BIB4LLM_CACHE_DIR"):
+        return Path(os.environ["BIB4LLM_CACHE_DIR"]).expanduser()
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "bib4llm"
+
+
+def parse_size(size: str) -> int:
+    """Parse a size such as '500M' or '10G' into bytes.
+
+    Args:
+        size: Number of bytes, optionally followed by K, M, G or T (powers of 1024)
+
+    Returns:
+        int: Size in bytes
+    """
+    text = size.strip().upper().removesuffix("B")
+    unit = text[-1:] if text[-1:] in _SIZE_UNITS else ""
+    try:
+        value = float(text[:len(text) - len(unit)])
+    except ValueError:
+        raise ValueError(f"Invalid size: {size}") from None
+    if value < 0:
+        raise ValueError(f"Invalid size: {size}")
+    return int(value * _SIZE_UNITS[unit])
+
+
+def _touch(path: Path):
+    """Record a use of a store entry for LRU eviction."""
+    try:
+        os.utime(path)
+    except OSError as e:
+        logger.debug(f"Failed to update access time of {path}: {e}")
+
+
+def _image_prefix(image_dir: Path, pdf_name: str) -> str:
+    """Get the prefix of image references written by the converter.
+
+    The converter names images after the PDF file with spaces replaced by dashes
+    and references them by their full path, using forward slashes.
+
+    Args:
+        image_dir: Directory the images are written to
+        pdf_name: File name of the converted PDF
+
+    Returns:
+        str: Prefix shared by all image references in the markdown
+    """
+    return os.path.join(str(image_dir), pdf_name.replace(" ", "-")).replace("\\", "/")
+
+
+def _link(source: Path, target: Path):
+    """Hard-link a file, or copy it where hard links are not supported."""
+    if target.exists() or target.is_symlink():
+        target.unlink()
+    try:
+        os.link(source, target)
+    except OSError as e:
+        # Hard links don't work across file systems and on some platforms
+        logger.debug(f"Hard link failed, creating copy instead: {e}")
+        shutil.copy2(source, target)
+
+
+@contextmanager
+def _exclusive_lock(lock_path: Path):
+    """Hold an exclusive lock on a file while converting a store entry.
+
+    Concurrent workers converting the same content wait for each other instead
+    of converting it twice. The lock is released by the OS if the holder dies.
+    Without fcntl (Windows), no lock is taken; concurrent conversions of the
+    same content are then harmless but redundant.
+
+    Args:
+        lock_path: Path of the lock file
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@dataclass(frozen=True)
+class ConversionStore:
+    """Content-addressed store of PDF conversions.
+
+    Instances only hold the configuration, so they can be passed to worker processes.
+
+    Attributes:
+        root: Directory containing the store
+        max_size: Size in bytes the store is reduced to by evict() (None for no limit)
+        split_pages: PDFs with more pages are converted in ranges of this many pages (None or 0 to never split)
+    """
+    root: Path
+    max_size: Optional[int] = DEFAULT_MAX_SIZE
+    split_pages: Optional[int] = DEFAULT_SPLIT_PAGES
+
+    @classmethod
+    def default(cls) -> 'ConversionStore':
+        """Get the user-level conversion cache with the default maximum size.
+
+        Returns:
+            ConversionStore: Store in default_cache_dir()
+        """
+        return cls(default_cache_dir())
+
+    @staticmethod
+    def content_hasher(hasher: FileHasher) -> FileHasher:
+        """Get the hasher used for store keys.
+
+        Store keys must identify the content exactly, so sampled hashes are
+        never used for them.
+
+        Args:
+            hasher: Hasher used for change tracking
+
+        Returns:
+            FileHasher: Hasher hashing full file contents with the same algorithm
+        """
+        return FileHasher(hasher.algorithm) if hasher.sampled else hasher
+
+    def entry_path(self, algorithm: str, digest: str) -> Path:
+        """Get the directory of the store entry for a content hash.
+
+        Args:
+            algorithm: Name of the hash algorithm
+            digest: Hex digest of the PDF content
+
+        Returns:
+            Path: Directory of the store entry (which may not exist)
+        """
+        return self.root / converter_signature() / algorithm / digest[:2] / digest
+
+    def page_ranges(self, pdf_path: Path) -> List[Tuple[int, int]]:
+        """Get the page ranges a PDF is converted in.
+
+        Args:
+            pdf_path: Path to the PDF file
+
+        Returns:
+            List of (first page, page after the last page) in page order, or an
+            empty list if the PDF is converted at once
+        """
+        if not self.split_pages:
+            return []
+        try:
+            num_pages = page_count(pdf_path)
+        except Exception as e:
+            # Let the conversion report the problem
+            logger.debug(f"Failed to count the pages of {pdf_path}: {e}")
+            return []
+        if num_pages <= self.split_pages:
+            return []
+        return [
+            (start, min(start + self.split_pages, num_pages))
+            for start in range(0, num_pages, self.split_pages)
+        ]
+
+    @staticmethod
+    def _run_converter(pdf_path: Path, tmp_dir: Path, pages: Optional[List[int]] = None, headers=None) -> Conversion:
+        """Convert a PDF into a temporary directory under the neutral name PDF_NAME.
+
+        Args:
+            pdf_path: Path to the PDF file
+            tmp_dir: Directory to write the images to
+            pages: Pages to convert (default: all pages)
+            headers: Header levels of the document, if already known
+
+        Returns:
+            Conversion: Markdown of the converted pages
+        """
+        source = tmp_dir / PDF_NAME
+        try:
+            source.symlink_to(pdf_path.resolve())
+        except OSError as e:
+            # If symlink fails (e.g., on Windows without admin rights), make a copy
+            logger.debug(f"Symlink failed, creating copy instead: {e}")
+            shutil.copy2(pdf_path, source)
+        try:
+            return pdf_to_markdown(source, tmp_dir, pages, headers)
+        finally:
+            source.unlink()
+
+    def _convert_into(self, pdf_path: Path, target: Path, algorithm: str, pages: Optional[range] = None) -> int:
+        """Convert a PDF into a new store directory, replacing it atomically.
+
+        Must be called with the lock of the target held.
+
+        Args:
+            pdf_path: Path to the PDF file
+            target: Store entry or part directory to create
+            algorithm: Name of the hash algorithm of the store entry
+            pages: Pages to convert (default: all pages, creating a store entry)
+
+        Returns:
+            int: Number of MuPDF warnings
+        """
+        tmp_dir = Path(tempfile.mkdtemp(prefix=f".{target.name}-", dir=target.parent))
+        try:
+            conversion = self._run_converter(pdf_path, tmp_dir, pages)
+            meta = {
+                "warnings": conversion.warning_count,
+                "headers": conversion.headers,
+                "page_lengths": [len(page) for page in conversion.pages],
+            }
+            if pages is None:
+                meta["fingerprints"] = page_fingerprints(pdf_path, FileHasher(algorithm))
+            (tmp_dir / MARKDOWN_FILE).write_text(conversion.markdown, encoding='utf-8')
+            self._finish(tmp_dir, target, meta)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return conversion.warning_count
+
+    @staticmethod
+    def _finish(tmp_dir: Path, target: Path, meta: Dict):
+        """Write the metadata of a converted directory and move it into place.
+
+        Args:
+            tmp_dir: Directory containing the markdown and images
+            target: Store entry or part directory to create
+            meta: Metadata of the conversion; the image reference prefix is added
+        """
+        # The metadata file is written last; its presence marks a complete entry
+        (tmp_dir / META_FILE).write_text(
+            json.dumps({"image_prefix": _image_prefix(tmp_dir, PDF_NAME), **meta}), encoding='utf-8'
+        )
+        if target.exists() and not (target / META_FILE).exists():
+            # Left over from an interrupted run without the lock
+            shutil.rmtree(target)
+        try:
+            tmp_dir.rename(target)
+        except OSError:
+            if not (target / META_FILE).exists():
+                raise
+            # Converted concurrently by a process that didn't share our lock
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @staticmethod
+    def _split_pages(md_text: str, meta: Dict) -> List[str]:
+        """Split the markdown of a store directory into the markdown of its pages."""
+        pages = []
+        offset = 0
+        for length in meta["page_lengths"]:
+            pages.append(md_text[offset:offset + length])
+            offset += length
+        return pages
+
+    def _path_index(self, pdf_path: Path, algorithm: str) -> Path:
+        """Get the file recording the digest of the last conversion of a PDF path."""
+        key = FileHasher(algorithm).hash_bytes(str(pdf_path.resolve()).encode())
+        return self.root / converter_signature() / algorithm / "paths" / key[:2] / key
+
+    def _remember(self, pdf_path: Path, algorithm: str, digest: str):
+        """Record the content hash of the last conversion of a PDF path."""
+        index = self._path_index(pdf_path, algorithm)
+        try:
+            index.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(prefix=f".{index.name}-", dir=index.parent)
+            with os.fdopen(fd, 'w') as f:
+                f.write(digest)
+            os.replace(tmp_name, index)
+        except OSError as e:
+            logger.debug(f"Failed to record the conversion of {pdf_path}: {e}")
+
+    def _previous_version(self, pdf_path: Path, algorithm: str, digest: str) -> Optional[Tuple[Path, Dict]]:
+        """Find the stored conversion of an earlier version of a PDF at the same path.
+
+        Args:
+            pdf_path: Path to the PDF file
+            algorithm: Name of the hash algorithm
+            digest: Hex digest of the current PDF content
+
+        Returns:
+            Tuple of (store entry, its metadata), or None if there is no earlier
+            version with page fingerprints in the store
+        """
+        try:
+            previous = self._path_index(pdf_path, algorithm).read_text().strip()
+            if previous == digest:
+                return None
+            entry = self.entry_path(algorithm, previous)
+            meta = json.loads((entry / META_FILE).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+        if "fingerprints" not in meta or "page_lengths" not in meta:
+            # Converted by an older version
+            return None
+        return entry, meta
+
+    def _changed_pages(self, previous_meta: Dict, fingerprints: List[str]) -> Optional[List[int]]:
+        """Get the pages that differ from an earlier version of a PDF.
+
+        Args:
+            previous_meta: Metadata of the stored conversion of the earlier version
+            fingerprints: Page fingerprints of the current version
+
+        Returns:
+            List[int]: Pages to reconvert, or None if converting the whole PDF
+                is preferable because few pages are unchanged
+        """
+        previous = previous_meta["fingerprints"]
+        changed = [
+            page for page, fingerprint in enumerate(fingerprints)
+            if page >= len(previous) or previous[page] != fingerprint
+        ]
+        if len(changed) == len(fingerprints) or (self.split_pages and len(changed) > self.split_pages):
+            return None
+        return changed
+
+    def _update(self, pdf_path: Path, algorithm: str, digest: str) -> Optional[int]:
+        """Create the store entry of a PDF from the conversion of an earlier version.
+
+        Pages whose fingerprints are unchanged are taken from the earlier
+        conversion and only the other pages are converted. If all pages are
+        unchanged, e.g. because only annotations were added, nothing is
+        converted. Must be called with the lock of the entry held.
+
+        Args:
+            pdf_path: Path to the PDF file
+            algorithm: Name of the hash algorithm
+            digest: Hex digest of the full PDF content
+
+        Returns:
+            Optional[int]: Number of MuPDF warnings, or None if the PDF must be converted completely
+        """
+        found = self._previous_version(pdf_path, algorithm, digest)
+        if found is None:
+            return None
+        previous, previous_meta = found
+        try:
+            fingerprints = page_fingerprints(pdf_path, FileHasher(algorithm))
+        except Exception as e:
+            logger.debug(f"Failed to fingerprint the pages of {pdf_path}: {e}")
+            return None
+        changed = self._changed_pages(previous_meta, fingerprints)
+        if changed is None:
+            return None
+
+        headers = None
+        if changed:
+            # Header levels depend on the font sizes of all pages
+            headers = identify_headers(pdf_path)
+            if header_levels(headers) != previous_meta["headers"]:
+                return None
+
+        entry = self.entry_path(algorithm, digest)
+        tmp_dir = Path(tempfile.mkdtemp(prefix=f".{digest}-", dir=entry.parent))
+        try:
+            warning_count = 0
+            converted = {}
+            if changed:
+                conversion = self._run_converter(pdf_path, tmp_dir, changed, headers)
+                warning_count = conversion.warning_count
+                converted = dict(zip(changed, conversion.pages))
+
+            image_prefix = _image_prefix(tmp_dir, PDF_NAME)
+            previous_pages = self._split_pages(
+                (previous / MARKDOWN_FILE).read_text(encoding='utf-8'), previous_meta
+            )
+            pages = []
+            for page in range(len(fingerprints)):
+                if page in converted:
+                    pages.append(converted[page])
+                    continue
+                pages.append(previous_pages[page].replace(previous_meta["image_prefix"], image_prefix))
+                for image in previous.glob(f"{PDF_NAME}-{page}-*"):
+                    _link(image, tmp_dir / image.name)
+
+            (tmp_dir / MARKDOWN_FILE).write_text(''.join(pages), encoding='utf-8')
+            self._finish(tmp_dir, entry, {
+                "warnings": warning_count,
+                "headers": previous_meta["headers"],
+                "page_lengths": [len(page) for page in pages],
+                "fingerprints": fingerprints,
+            })
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        if changed:
+            logger.debug(f"Reconverted {len(changed)} changed pages of {pdf_path}")
+        else:
+            logger.debug(f"Only annotations or metadata of {pdf_path} changed, reusing its conversion")
+        return warning_count
+
+    def part_path(self, algorithm: str, digest: str, start: int, stop: int) -> Path:
+        """Get the directory of a part of a store entry.
+
+        Args:
+            algorithm: Name of the hash algorithm
+            digest: Hex digest of the PDF content
+            start: First page of the part (0-based)
+            stop: Page after the last page of the part
+
+        Returns:
+            Path: Directory of the part (which may not exist)
+        """
+        entry = self.entry_path(algorithm, digest)
+        return entry.with_name(f"{entry.name}.parts") / f"{start}-{stop}"
+
+    def convert_part(self, pdf_path: Path, algorithm: str, digest: str, start: int, stop: int) -> Tuple[Path, int]:
+        """Convert a page range of a PDF unless it or the whole PDF is stored already.
+
+        Different parts of a PDF can be converted concurrently by several
+        processes. Parts are not converted in advance if an earlier version
+        of the PDF was converted and few of its pages changed; convert then
+        only reconverts the changed pages.
+
+        Args:
+            pdf_path: Path to the PDF file
+            algorithm: Name of the hash algorithm
+            digest: Hex digest of the full PDF content
+            start: First page of the part (0-based)
+            stop: Page after the last page of the part
+
+        Returns:
+            Tuple of (part directory, number of MuPDF warnings of a new conversion)
+        """
+        part = self.part_path(algorithm, digest, start, stop)
+        if (part / META_FILE).exists() or (self.entry_path(algorithm, digest) / META_FILE).exists():
+            return part, 0
+
+        part.parent.mkdir(parents=True, exist_ok=True)
+        with _exclusive_lock(part.with_name(f"{part.name}.lock")):
+            if (part / META_FILE).exists() or (self.entry_path(algorithm, digest) / META_FILE).exists():
+                return part, 0
+            warning_count = self._convert_into(pdf_path, part, algorithm, range(start, stop))
+        logger.debug(f"Converted pages {start + 1}-{stop} of {pdf_path}")
+        return part, warning_count
+
+    def prepare_part(self, pdf_path: Path, algorithm: str, digest: str, start: int, stop: int) -> int:
+        """Convert a page range of a PDF in advance, unless convert can update an earlier version.
+
+        Args:
+            pdf_path: Path to the PDF file
+            algorithm: Name of the hash algorithm
+            digest: Hex digest of the full PDF content
+            start: First page of the part (0-based)
+            stop: Page after the last page of the part
+
+        Returns:
+            int: Number of MuPDF warnings of a new conversion
+        """
+        if (self.entry_path(algorithm, digest) / META_FILE).exists():
+            return 0
+        found = self._previous_version(pdf_path, algorithm, digest)
+        if found is not None:
+            try:
+                fingerprints = page_fingerprints(pdf_path, FileHasher(algorithm))
+            except Exception:
+                fingerprints = None
+            if fingerprints is not None and self._changed_pages(found[1], fingerprints) is not None:
+                return 0
+        return self.convert_part(pdf_path, algorithm, digest, start, stop)[1]
+
+    def _stitch(self, pdf_path: Path, algorithm: str, digest: str, ranges: List[Tuple[int, int]]) -> int:
+        """Convert all parts of a PDF and join them into its store entry.
+
+        Parts converted by other processes are reused; the others are converted here.
+        Must be called with the lock of the entry held.
+
+        Args:
+            pdf_path: Path to the PDF file
+            algorithm: Name of the hash algorithm
+            digest: Hex digest of the full PDF content
+            ranges: Page ranges of the parts (see page_ranges)
+
+        Returns:
+            int: Number of MuPDF warnings of all parts
+        """
+        entry = self.entry_path(algorithm, digest)
+        parts = [self.convert_part(pdf_path, algorithm, digest, start, stop)[0] for start, stop in ranges]
+
+        tmp_dir = Path(tempfile.mkdtemp(prefix=f".{digest}-", dir=entry.parent))
+        try:
+            pages = []
+            warning_count = 0
+            for part in parts:
+                meta = json.loads((part / META_FILE).read_text(encoding='utf-8'))
+                warning_count += meta.get("warnings", 0)
+                pages.extend(
+                    page.replace(meta["image_prefix"], _image_prefix(tmp_dir, PDF_NAME))
+                    for page in self._split_pages((part / MARKDOWN_FILE).read_text(encoding='utf-8'), meta)
+                )
+                # Image names contain the page number, so the parts don't collide
+                for image in part.iterdir():
+                    if image.name not in (MARKDOWN_FILE, META_FILE):
+                        os.replace(image, tmp_dir / image.name)
+            (tmp_dir / MARKDOWN_FILE).write_text(''.join(pages), encoding='utf-8')
+            self._finish(tmp_dir, entry, {
+                "warnings": warning_count,
+                "headers": meta["headers"],
+                "page_lengths": [len(page) for page in pages],
+                "fingerprints": page_fingerprints(pdf_path, FileHasher(algorithm)),
+            })
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        shutil.rmtree(parts[0].parent, ignore_errors=True)
+        return warning_count
+
+    def convert(self, pdf_path: Path, algorithm: str, digest: str) -> Tuple[Path, int, bool]:
+        """Get the store entry for a PDF, converting the PDF if it is not stored yet.
+
+        If an earlier version of the PDF at the same path is stored, only its
+        changed pages are converted (see _update).
+
+        Args:
+            pdf_path: Path to the PDF file
+            algorithm: Name of the hash algorithm
+            digest: Hex digest of the full PDF content
+
+        Returns:
+            Tuple of (store entry directory, number of MuPDF warnings, whether the entry was already stored)
+        """
+        entry = self.entry_path(algorithm, digest)
+        if (entry / META_FILE).exists():
+            _touch(entry / META_FILE)
+            self._remember(pdf_path, algorithm, digest)
+            return entry, 0, True
+
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        with _exclusive_lock(entry.parent / f"{digest}.lock"):
+            # Another worker may have converted the same content meanwhile
+            if (entry / META_FILE).exists():
+                _touch(entry / META_FILE)
+                self._remember(pdf_path, algorithm, digest)
+                return entry, 0, True
+
+            warning_count = self._update(pdf_path, algorithm, digest)
+            if warning_count is None:
+                ranges = self.page_ranges(pdf_path)
+                if ranges:
+                    warning_count = self._stitch(pdf_path, algorithm, digest, ranges)
+                else:
+                    warning_count = self._convert_into(pdf_path, entry, algorithm)
+        self._remember(pdf_path, algorithm, digest)
+        logger.debug(f"Stored conversion of {pdf_path} as {algorithm}/{digest}")
+        return entry, warning_count, False
+
+    def evict(self) -> Tuple[int, int]:
+        """Remove the least recently used conversions until the store fits into max_size.
+
+        Returns:
+            Tuple of (number of conversions removed, number of bytes freed)
+        """
+        if self.max_size is None or not self.root.exists():
+            return 0, 0
+
+        entries = []
+        total_size = 0
+        # Parts are left behind by interrupted conversions and evicted like entries
+        metas = itertools.chain(
+            self.root.glob(f"*/*/*/*/{META_FILE}"), self.root.glob(f"*/*/*/*.parts/*/{META_FILE}")
+        )
+        for meta in metas:
+            entry = meta.parent
+            try:
+                last_used = meta.stat().st_mtime_ns
+                size = sum(f.lstat().st_size for f in entry.iterdir())
+            except OSError:
+                # Removed concurrently
+                continue
+            entries.append((last_used, size, entry))
+            total_size += size
+
+        removed = 0
+        freed = 0
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total_size <= self.max_size:
+                break
+            # Rename first so that readers never see a partially removed entry
+            doomed = entry.with_name(f".{entry.name}-evicted")
+            try:
+                entry.rename(doomed)
+            except OSError as e:
+                logger.debug(f"Failed to evict {entry}: {e}")
+                continue
+            shutil.rmtree(doomed, ignore_errors=True)
+            try:
+                entry.with_name(f"{entry.name}.lock").unlink()
+            except OSError:
+                pass
+            total_size -= size
+            removed += 1
+            freed += size
+        if removed:
+            logger.info(f"Evicted {removed} conversions ({freed / 1024**2:.1f} MiB) from the conversion cache {self.root}")
+        return removed, freed
+
+    @staticmethod
+    def materialize(entry: Path, target_dir: Path, pdf_name: str) -> str:
+        """Link the images of a store entry into an output directory.
+
+        Images are named and referenced as if the PDF had been converted from
+        target_dir/pdf_name directly.
+
+        Args:
+            entry: Directory of the store entry
+            target_dir: Output directory to link the images into
+            pdf_name: File name under which the PDF appears in target_dir
+
+        Returns:
+            str: Markdown text with the image references pointing into target_dir
+        """
+        meta = json.loads((entry / META_FILE).read_text(encoding='utf-8'))
+        md_text = (entry / MARKDOWN_FILE).read_text(encoding='utf-8')
+
+        image_name_prefix = pdf_name.replace(" ", "-")
+        for image in sorted(entry.iterdir()):
+            if image.name in (MARKDOWN_FILE, META_FILE):
+                continue
+            name = image.name
+            if name.startswith(PDF_NAME):
+                name = image_name_prefix + name[len(PDF_NAME):]
+            _link(image, target_dir / name)
+
+        return md_text.replace(meta["image_prefix"], _image_prefix(target_dir, pdf_name))
+
+
+def convert_pdf(
+    pdf_path: Path,
+    output_dir: Path,
+    name: str,
+    store: ConversionStore,
+    hasher: FileHasher,
+    pdf_hash: str = None
+) -> Tuple[str, int, bool]:
+    """Convert a PDF for an output directory, reusing stored conversions of identical content.
+
+    A symlink to the PDF named '{name}.pdf' is created in output_dir and the
+    extracted images are named after it.
+
+    Args:
+        pdf_path: Path to the PDF file
+        output_dir: Output directory to write the images and PDF link to
+        name: Name under which the PDF appears in output_dir (without suffix)
+        store: ConversionStore holding the conversions
+        hasher: FileHasher used for change tracking
+        pdf_hash: Hash of the PDF computed with hasher, if already known
+
+    Returns:
+        Tuple of (markdown text, number of MuPDF warnings, whether the conversion was taken from the store)
+    """
+    simple_pdf = output_dir / f"{name}.pdf"
+    try:
+        if simple_pdf.exists() or simple_pdf.is_symlink():
+            simple_pdf.unlink()
+        simple_pdf.symlink_to(pdf_path.resolve())
+        logger.debug(f"Created symbolic link: {simple_pdf} -> {pdf_path}")
+    except OSError as e:
+        # Without symlinks (e.g., on Windows without admin rights) the output
+        # just doesn't contain a link to the PDF
+        logger.debug(f"Symlink failed, skipping PDF link: {e}")
+
+    if not pdf_hash or hasher.sampled:
+        pdf_hash = ConversionStore.content_hasher(hasher).hash_file(pdf_path)
+    if not pdf_hash:
+        raise OSError(f"Failed to hash {pdf_path}")
+
+    try:
+        entry, warning_count, stored = store.convert(pdf_path, hasher.algorithm, pdf_hash)
+        md_text = store.materialize(entry, output_dir, simple_pdf.name)
+    except FileNotFoundError:
+        # The conversion was evicted by another process while it was being linked
+        logger.debug(f"Conversion of {pdf_path} was evicted, converting again")
+        entry, warning_count, stored = store.convert(pdf_path, hasher.algorithm, pdf_hash)
+        md_text = store.materialize(entry, output_dir, simple_pdf.name)
+    return md_text, warning_count, stored
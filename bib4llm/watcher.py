@@ -1,36 +1,424 @@
+import os
+import threading
 import time
+from dataclasses import dataclass, field
 from pathlib import Path
 from watchdog.observers import Observer
+from watchdog.observers.api import BaseObserver, ObservedWatch
 from watchdog.events import FileSystemEventHandler
 import logging
 import traceback
-from .process_bibliography import BibliographyProcessor, DirectoryProcessor
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+from .bibscan import ScannedEntry
+from .convert import warm_up_converter
+from .fingerprint import FileHasher
+from .process_bibliography import BibliographyProcessor, DirectoryProcessor, split_file_field
+from .resources import worker_count
+from .state import StateDB
+from .store import ConversionStore
+from .workers import WorkerLimits, WorkerPool
 
 # Create logger
 logger = logging.getLogger(__name__)
 
+# Seconds without new events after which a changed file is processed
+DEFAULT_QUIET_PERIOD = 1.0
+# Seconds without new events after which a file that wasn't closed is processed anyway
+OPEN_TIMEOUT = 30.0
+# Whether the observer reports when a file opened for writing is closed (inotify on Linux)
+REPORTS_CLOSE_WRITE = Observer.__name__ == "InotifyObserver"
+
+def stat_signature(path: Path) -> Optional[Tuple[int, int]]:
+    """Get the size and modification time of a file, or None if it doesn't exist."""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+@dataclass
+class PendingChange:
+    """Events of a path that wasn't processed yet.
+    
+    Attributes:
+        last_event: Time of the last event (time.monotonic())
+        signature: Size and modification time of the path at the last event
+        writing: Whether the path was written to and not closed since
+    """
+    last_event: float
+    signature: Optional[Tuple[int, int]]
+    writing: bool = False
+
+class ChangeQueue:
+    """Coalesces file system events per path and processes them in the background.
+    
+    Saving a file or copying it into a watched directory produces a burst of
+    events. The events of each path are collected until none arrived for the
+    quiet period, and all paths that became quiet are then processed together
+    by a dispatcher thread. put() only records the event, so the observer
+    thread never waits for a conversion, and events of a path that arrive
+    while it is being processed cause it to be processed again afterwards.
+    
+    A path is only processed once it stopped changing: its size and
+    modification time must not have changed since its last event, and with
+    wait_for_close, a file that was written to must have been closed (e.g.
+    a BibTeX export written in several chunks). Paths that were removed
+    before they became quiet are dropped.
+    """
+    def __init__(
+        self,
+        process: Callable[[List[Path]], None],
+        quiet_period: float = DEFAULT_QUIET_PERIOD,
+        wait_for_close: bool = False
+    ):
+        """Start the dispatcher thread.
+        
+        Args:
+            process: Function called with the paths that became quiet
+            quiet_period: Seconds without new events after which a path is processed
+            wait_for_close: Whether files that were written to are only processed
+                once they were closed, or after OPEN_TIMEOUT seconds without events.
+                Requires events of closed files (see REPORTS_CLOSE_WRITE).
+        """
+        self.process = process
+        self.quiet_period = quiet_period
+        self.wait_for_close = wait_for_close
+        self._pending: Dict[Path, PendingChange] = {}
+        self._busy = False
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._dispatch, name="ChangeQueue dispatcher", daemon=True)
+        self._thread.start()
+
+    def put(self, path: Path, closed: bool = False):
+        """Record an event of a path.
+        
+        Args:
+            path: Path of the file or directory
+            closed: Whether the event completes writing the file, i.e. it was
+                closed after writing or moved to the path
+        """
+        signature = stat_signature(path)
+        with self._condition:
+            # Re-inserting moves the path behind paths that have been quiet for longer
+            self._pending.pop(path, None)
+            writing = self.wait_for_close and not closed and not path.is_dir()
+            self._pending[path] = PendingChange(time.monotonic(), signature, writing)
+            self._condition.notify_all()
+
+    def _is_ready(self, path: Path, pending: PendingChange, now: float) -> bool:
+        """Check whether a pending path stopped changing, restarting its quiet period if it didn't."""
+        quiet = now - pending.last_event
+        if quiet < self.quiet_period or (pending.writing and quiet < OPEN_TIMEOUT):
+            return False
+        signature = stat_signature(path)
+        if signature != pending.signature:
+            # Changed without an event, e.g. by a writer on another machine
+            pending.last_event = now
+            pending.signature = signature
+            return False
+        return True
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Wait until all recorded events were processed.
+        
+        Args:
+            timeout: Maximum time to wait, in seconds (default: no limit)
+            
+        Returns:
+            bool: Whether the queue became idle before the timeout
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def stop(self):
+        """Stop the dispatcher after the paths being processed, discarding pending events."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _next_paths(self) -> Optional[List[Path]]:
+        """Wait for paths that became quiet, or return None once stopped."""
+        with self._condition:
+            while not self._stopped:
+                now = time.monotonic()
+                ready = [path for path, pending in self._pending.items() if self._is_ready(path, pending, now)]
+                for path in ready:
+                    del self._pending[path]
+                ready = [path for path in ready if path.exists()]
+                if ready:
+                    self._busy = True
+                    return ready
+                timeout = None
+                if self._pending:
+                    timeout = min(
+                        pending.last_event + (OPEN_TIMEOUT if pending.writing else self.quiet_period)
+                        for pending in self._pending.values()
+                    ) - now
+                self._condition.wait(max(timeout, 0.01) if timeout is not None else None)
+            return None
+
+    def _dispatch(self):
+        while True:
+            paths = self._next_paths()
+            if paths is None:
+                break
+            try:
+                self.process(paths)
+            except Exception as e:
+                logger.error(f"Error processing changes of {len(paths)} files: {e}\n{traceback.format_exc()}")
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+
+@dataclass
+class EntryChanges:
+    """Changes of a BibTeX file since it was last processed.
+    
+    Attributes:
+        changed: Entries that were added or modified
+        removed: Citation keys of entries that were removed
+        digests: Digests of all current entries, keyed by citation key
+        entries: All current entries, keyed by citation key
+    """
+    changed: List[Dict] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    digests: Dict[str, str] = field(default_factory=dict)
+    entries: Dict[str, Dict] = field(default_factory=dict)
+
+class EntryTracker:
+    """Keeps track of the entries of a BibTeX file between changes.
+    
+    Reference managers rewrite the whole file on every change, so the entries
+    are compared by a digest of their raw text to find the few that actually changed.
+    """
+    def __init__(self):
+        # None until the file was processed for the first time
+        self.digests: Optional[Dict[str, str]] = None
+        self.entries: Dict[str, Dict] = {}
+
+    def diff(self, entries: Iterable[ScannedEntry]) -> EntryChanges:
+        """Compare entries against the ones seen when the file was last processed.
+        
+        Args:
+            entries: Current entries of the BibTeX file (see BibliographyProcessor.scan_entries)
+            
+        Returns:
+            EntryChanges: Added or modified entries and removed citation keys.
+                All entries count as changed before the first call to apply().
+        """
+        changes = EntryChanges()
+        for entry in entries:
+            if not entry.citation_key:
+                continue
+            changes.digests[entry.citation_key] = entry.digest
+            changes.entries[entry.citation_key] = entry.as_entry()
+            if self.digests is None or self.digests.get(entry.citation_key) != entry.digest:
+                changes.changed.append(changes.entries[entry.citation_key])
+        if self.digests is not None:
+            changes.removed = sorted(self.digests.keys() - changes.digests.keys())
+        return changes
+
+    def apply(self, changes: EntryChanges):
+        """Record that the changes were processed."""
+        self.digests = changes.digests
+        self.entries = changes.entries
+
+    def attachments(self) -> Dict[Path, Set[str]]:
+        """Get the attachments of the entries seen when the file was last processed.
+        
+        Returns:
+            Dict[Path, Set[str]]: Citation keys of the entries referencing each
+                attachment, keyed by its absolute path
+        """
+        attachments: Dict[Path, Set[str]] = {}
+        for citation_key, entry in self.entries.items():
+            for file_path in split_file_field(entry.get('file', '')):
+                attachments.setdefault(Path(file_path).absolute(), set()).add(citation_key)
+        return attachments
+
+def process_bibtex_changes(
+    processor: BibliographyProcessor,
+    tracker: EntryTracker,
+    num_processes: Union[int, str, None] = None,
+    paranoid: bool = False
+):
+    """Process only the entries of a BibTeX file that changed since it was last processed.
+    
+    Args:
+        processor: BibliographyProcessor of the BibTeX file (with an open database)
+        tracker: EntryTracker holding the entries seen when the file was last processed
+        num_processes: Number of parallel processes to use, or 'auto' (default: number of available CPUs)
+        paranoid: Whether to hash all attachments, even those whose stat signature is unchanged
+    """
+    start = time.perf_counter()
+    changes = tracker.diff(processor.scan_entries(num_workers=worker_count(num_processes)))
+    if tracker.digests is not None:
+        logger.info(
+            f"{len(changes.changed)} entries added or modified, {len(changes.removed)} removed "
+            f"(diffed in {time.perf_counter() - start:.3f}s)"
+        )
+    if changes.removed:
+        processor.remove_entries(changes.removed)
+    if changes.changed:
+        processor.process_entries(changes.changed, num_processes=num_processes, paranoid=paranoid)
+    tracker.apply(changes)
+
+def recorded_citation_keys(state: StateDB, path: Path) -> List[str]:
+    """Get the entries that were converted from an attachment, according to the state database.
+    
+    The database records attachment paths as written in the file field, which
+    may be relative to the working directory, while events report absolute
+    paths. Both forms are looked up.
+    
+    Args:
+        state: State database of the BibTeX file
+        path: Absolute path of the attachment
+        
+    Returns:
+        List[str]: Citation keys of the entries, sorted
+    """
+    candidates = {str(path)}
+    try:
+        candidates.add(os.path.relpath(path))
+    except ValueError:
+        # On Windows, paths on different drives have no relative path
+        pass
+    return sorted({key for candidate in candidates for key in state.citation_keys_for_path(candidate)})
+
 class BibTexHandler(FileSystemEventHandler):
-    def __init__(self, bib_file: Path, num_processes: int = None):
+    """Processes a BibTeX file and the attachments of its entries when they change.
+    
+    Given the observer, the parent directories of all attachments are
+    watched as well, so that an attachment replaced or annotated by the
+    reference manager is converted again without a change of the BibTeX
+    file. The watches follow the entries as they are added or removed.
+    """
+    def __init__(
+        self,
+        bib_file: Path,
+        num_processes: Union[int, str, None] = None,
+        paranoid: bool = False,
+        hasher: Optional[FileHasher] = None,
+        store: Optional[ConversionStore] = None,
+        limits: Optional[WorkerLimits] = None,
+        pool: Optional[WorkerPool] = None,
+        quiet_period: float = DEFAULT_QUIET_PERIOD,
+        observer: Optional[BaseObserver] = None
+    ):
         self.bib_file = bib_file
         self.num_processes = num_processes
-        self.last_processed = 0
+        self.paranoid = paranoid
+        self.hasher = hasher
+        self.store = store
+        self.limits = limits
+        self.pool = pool
+        self.observer = observer
+        self.entries = EntryTracker()
+        # Citation keys of the entries referencing each attachment
+        self.attachments: Dict[Path, Set[str]] = {}
+        # Watches of the directories containing attachments
+        self.attachment_watches: Dict[Path, ObservedWatch] = {}
         # Initial processing
         self._process()
+        self.changes = ChangeQueue(self._process_changes, quiet_period, REPORTS_CLOSE_WRITE)
+
+    def _watched_path(self, path: str) -> Optional[Path]:
+        """Get the watched file an event refers to, or None if it refers to another file."""
+        path = Path(path)
+        if path == self.bib_file:
+            return self.bib_file
+        path = path.absolute()
+        return path if path in self.attachments else None
 
     def on_modified(self, event):
-        if not event.is_directory and Path(event.src_path) == self.bib_file:
-            # Debounce to avoid multiple rapid processing
-            current_time = time.time()
-            if current_time - self.last_processed > 1:  # 1 second debounce
-                self._process()
-                self.last_processed = current_time
+        path = self._watched_path(event.src_path)
+        if not event.is_directory and path:
+            self.changes.put(path)
+
+    def on_created(self, event):
+        path = self._watched_path(event.src_path)
+        if not event.is_directory and path:
+            self.changes.put(path)
+
+    def on_closed(self, event):
+        path = self._watched_path(event.src_path)
+        if path:
+            self.changes.put(path, closed=True)
+
+    def on_moved(self, event):
+        # Saving by writing a temporary file and renaming it only produces a move event
+        path = self._watched_path(event.dest_path)
+        if not event.is_directory and path:
+            self.changes.put(path, closed=True)
+
+    def _process_changes(self, paths: List[Path]):
+        """Process the BibTeX file and the attachments whose events became quiet."""
+        if self.bib_file in paths:
+            self._process()
+        attachments = [path for path in paths if path != self.bib_file]
+        if attachments:
+            self._process_attachments(attachments)
+
+    def _process_attachments(self, paths: List[Path]):
+        """Convert the entries referencing changed attachments again.
+        
+        The entries are looked up in the attachments table of the state
+        database (see recorded_citation_keys). An attachment no entry was
+        converted from yet, e.g. because it was missing, is looked up in the
+        entries of the BibTeX file instead.
+        """
+        citation_keys = []
+        try:
+            with BibliographyProcessor(
+                self.bib_file, hasher=self.hasher, store=self.store, limits=self.limits, pool=self.pool
+            ) as processor:
+                citation_keys = sorted({
+                    key
+                    for path in paths
+                    for key in recorded_citation_keys(processor.state, path) or self.attachments.get(path, ())
+                })
+                entries = [self.entries.entries[key] for key in citation_keys if key in self.entries.entries]
+                if not entries:
+                    return
+                logger.info(f"Attachments of {len(entries)} entries changed: {', '.join(citation_keys)}")
+                processor.process_entries(entries, num_processes=self.num_processes, paranoid=self.paranoid)
+        except Exception as e:
+            logger.error(
+                f"Error processing attachments of {', '.join(citation_keys)}: {e}\n{traceback.format_exc()}"
+            )
+
+    def _sync_attachment_watches(self):
+        """Watch the directories of the current attachments and stop watching the others."""
+        self.attachments = self.entries.attachments()
+        if self.observer is None:
+            return
+        # The directory of the BibTeX file is already watched
+        directories = {path.parent for path in self.attachments} - {self.bib_file.parent.absolute()}
+        for directory in self.attachment_watches.keys() - directories:
+            self.observer.unschedule(self.attachment_watches.pop(directory))
+        for directory in sorted(directories - self.attachment_watches.keys()):
+            if not directory.is_dir():
+                continue
+            try:
+                self.attachment_watches[directory] = self.observer.schedule(self, str(directory), recursive=False)
+            except OSError as e:
+                # e.g. the inotify watch limit (fs.inotify.max_user_watches) was reached
+                logger.warning(f"Failed to watch attachments in {directory}: {e}")
+                break
+        logger.debug(f"Watching {len(self.attachment_watches)} attachment directories")
 
     def _process(self):
         """Process the bibliography file."""
         try:
             logger.debug(f"Processing {self.bib_file}")
-            with BibliographyProcessor(self.bib_file) as processor:
-                processor.process_all(num_processes=self.num_processes)
+            with BibliographyProcessor(
+                self.bib_file, hasher=self.hasher, store=self.store, limits=self.limits, pool=self.pool
+            ) as processor:
+                process_bibtex_changes(processor, self.entries, self.num_processes, self.paranoid)
+            self._sync_attachment_watches()
             logger.debug("Processing complete")
             logger.info(f"\nWatching BibTeX file: {self.bib_file.resolve()}\n")
         except FileNotFoundError as e:
@@ -42,27 +430,56 @@ class BibTexHandler(FileSystemEventHandler):
             logger.info(f"\nWatching BibTeX file: {self.bib_file.resolve()}\n")
 
 class PDFHandler(FileSystemEventHandler):
-    def __init__(self, pdf_file: Path, num_processes: int = None):
+    def __init__(
+        self,
+        pdf_file: Path,
+        num_processes: Union[int, str, None] = None,
+        paranoid: bool = False,
+        hasher: Optional[FileHasher] = None,
+        store: Optional[ConversionStore] = None,
+        limits: Optional[WorkerLimits] = None,
+        pool: Optional[WorkerPool] = None,
+        quiet_period: float = DEFAULT_QUIET_PERIOD
+    ):
         self.pdf_file = pdf_file
         self.num_processes = num_processes
-        self.last_processed = 0
+        self.paranoid = paranoid
+        self.hasher = hasher
+        self.store = store
+        self.limits = limits
+        self.pool = pool
         # Initial processing
         self._process()
+        self.changes = ChangeQueue(lambda paths: self._process(), quiet_period, REPORTS_CLOSE_WRITE)
 
     def on_modified(self, event):
         if not event.is_directory and Path(event.src_path) == self.pdf_file:
-            # Debounce to avoid multiple rapid processing
-            current_time = time.time()
-            if current_time - self.last_processed > 1:  # 1 second debounce
-                self._process()
-                self.last_processed = current_time
+            self.changes.put(self.pdf_file)
+
+    def on_created(self, event):
+        if not event.is_directory and Path(event.src_path) == self.pdf_file:
+            self.changes.put(self.pdf_file)
+
+    def on_closed(self, event):
+        if Path(event.src_path) == self.pdf_file:
+            self.changes.put(self.pdf_file, closed=True)
+
+    def on_moved(self, event):
+        # Saving by writing a temporary file and renaming it only produces a move event
+        if not event.is_directory and Path(event.dest_path) == self.pdf_file:
+            self.changes.put(self.pdf_file, closed=True)
 
     def _process(self):
         """Process the PDF file."""
         try:
             logger.debug(f"Processing PDF {self.pdf_file}")
-            with BibliographyProcessor(self.pdf_file) as processor:
-                result = processor.process_pdf(self.pdf_file)
+            with BibliographyProcessor(
+                self.pdf_file, hasher=self.hasher, store=self.store, limits=self.limits, pool=self.pool
+            ) as processor:
+                result = processor.process_pdf(
+                    self.pdf_file, paranoid=self.paranoid,
+                    num_processes=worker_count(self.num_processes)
+                )
             if result.success:
                 logger.debug("Processing complete")
             else:
@@ -77,16 +494,36 @@ class PDFHandler(FileSystemEventHandler):
             logger.info(f"\nWatching PDF file: {self.pdf_file.resolve()}\n")
 
 class DirectoryHandler(FileSystemEventHandler):
-    def __init__(self, directory_path: Path, recursive: bool = True, num_processes: int = None):
+    def __init__(
+        self,
+        directory_path: Path,
+        recursive: bool = True,
+        num_processes: Union[int, str, None] = None,
+        paranoid: bool = False,
+        hasher: Optional[FileHasher] = None,
+        store: Optional[ConversionStore] = None,
+        limits: Optional[WorkerLimits] = None,
+        pool: Optional[WorkerPool] = None,
+        quiet_period: float = DEFAULT_QUIET_PERIOD
+    ):
         self.directory_path = directory_path
         self.recursive = recursive
         self.num_processes = num_processes
-        self.last_processed = 0
+        self.paranoid = paranoid
+        self.hasher = hasher
+        self.store = store
+        self.limits = limits
+        self.pool = pool
         self.bibtex_extensions = ['.bib', '.bibtex']
-        self.processor = DirectoryProcessor(directory_path)
+        # Entries of the BibTeX files processed since watching started
+        self.bib_entries: Dict[Path, EntryTracker] = {}
+        self.processor = DirectoryProcessor(
+            directory_path, hasher=hasher, store=store, limits=limits, pool=pool
+        )
         self.output_dir = BibliographyProcessor.get_output_dir(directory_path)
         # Initial processing
         self._process_directory()
+        self.changes = ChangeQueue(self._process_changes, quiet_period, REPORTS_CLOSE_WRITE)
 
     def on_created(self, event):
         """Handle file creation events."""
@@ -95,166 +532,276 @@ class DirectoryHandler(FileSystemEventHandler):
         if event.is_directory:
             # If a directory is created and we're in recursive mode, we need to process it
             if self.recursive and file_path.is_relative_to(self.directory_path):
-                self._process_directory()
+                self.changes.put(file_path)
         else:
-            # Process new files based on their type
-            self._process_file(file_path)
+            self.changes.put(file_path)
 
     def on_modified(self, event):
         """Handle file modification events."""
         if not event.is_directory:
-            file_path = Path(event.src_path)
-            # Process modified files based on their type
-            self._process_file(file_path)
-            
-    def _process_file(self, file_path: Path):
-        """Process a single file if it's a PDF or BibTeX file."""
-        if not file_path.exists() or not file_path.is_file():
-            return
-            
-        # Debounce to avoid multiple rapid processing
-        current_time = time.time()
-        if current_time - self.last_processed < 1:  # 1 second debounce
+            self.changes.put(Path(event.src_path))
+
+    def on_closed(self, event):
+        """Handle events of files closed after writing."""
+        self.changes.put(Path(event.src_path), closed=True)
+
+    def on_moved(self, event):
+        """Handle files and directories moved into or within the directory, e.g. by atomic saves."""
+        dest_path = Path(event.dest_path)
+        if not dest_path.is_relative_to(self.directory_path):
             return
-            
-        self.last_processed = current_time
+        if event.is_directory:
+            if self.recursive:
+                self.changes.put(dest_path)
+        else:
+            self.changes.put(dest_path, closed=True)
+
+    def _process_changes(self, paths: List[Path]):
+        """Process files and directories whose events became quiet.
+        
+        New PDFs in the watched directory are converted together, so that
+        PDFs copied into it at once are spread over the worker processes.
         
+        Args:
+            paths: Paths of the files and directories
+        """
+        # New directories are scanned on their own, without the rest of the tree
+        directories = [path for path in paths if path.is_dir()]
+        subtrees = [
+            directory for directory in directories
+            if not any(directory != other and directory.is_relative_to(other) for other in directories)
+        ]
+        for directory in subtrees:
+            self._process_directory(subdirectory=directory)
+        pdf_files = []
+        for file_path in paths:
+            if not file_path.is_file() or any(file_path.is_relative_to(directory) for directory in subtrees):
+                continue
+            if file_path.suffix.lower() in self.bibtex_extensions:
+                self._process_file(file_path)
+            elif BibliographyProcessor.is_pdf_file(file_path):
+                if file_path.is_relative_to(self.directory_path):
+                    pdf_files.append(file_path)
+                else:
+                    self._process_file(file_path)
+        if pdf_files:
+            self._process_pdfs(pdf_files)
+
+    def _process_pdfs(self, pdf_files: List[Path]):
+        """Convert PDFs of the watched directory unless they are unchanged since they were last converted."""
+        try:
+            logger.debug(f"Processing {len(pdf_files)} PDF files")
+            with DirectoryProcessor(
+                self.directory_path, hasher=self.hasher, store=self.store, limits=self.limits, pool=self.pool
+            ) as processor:
+                results, _ = processor.process_pdfs(
+                    pdf_files, num_processes=self.num_processes, paranoid=self.paranoid
+                )
+            for result in results:
+                if result.success:
+                    logger.debug(f"Finished processing PDF file: {result.citation_key}")
+                else:
+                    logger.error(f"Failed to process PDF file: {result.citation_key}")
+        except Exception as e:
+            logger.error(f"Error processing {len(pdf_files)} PDF files: {e}\n{traceback.format_exc()}")
+
+    def _process_file(self, file_path: Path):
+        """Process a BibTeX file, or a PDF file outside of the watched directory."""
         try:
             # Check if the file is a BibTeX file
             if file_path.suffix.lower() in self.bibtex_extensions:
                 logger.debug(f"Processing BibTeX file: {file_path}")
-                with BibliographyProcessor(file_path) as processor:
-                    processor.process_all(num_processes=self.num_processes)
+                tracker = self.bib_entries.setdefault(file_path, EntryTracker())
+                with BibliographyProcessor(
+                    file_path, hasher=self.hasher, store=self.store, limits=self.limits, pool=self.pool
+                ) as processor:
+                    process_bibtex_changes(processor, tracker, self.num_processes, self.paranoid)
                 logger.debug(f"Finished processing BibTeX file: {file_path}")
             
             # Check if the file is a PDF
             elif BibliographyProcessor.is_pdf_file(file_path):
                 logger.debug(f"Processing PDF file: {file_path}")
-                
-                # Calculate the relative path from the directory being watched
-                if file_path.is_relative_to(self.directory_path):
-                    rel_path = file_path.relative_to(self.directory_path)
-                    
-                    # Create a DirectoryProcessor to handle the PDF with proper directory structure
-                    processor = DirectoryProcessor(self.directory_path)
-                    
-                    # Create the output subdirectory
-                    output_dir = Path(f"{self.directory_path}-bib4llm")
-                    output_subdir = output_dir / rel_path.parent
-                    output_subdir.mkdir(exist_ok=True, parents=True)
-                    
-                    # Create a custom output directory for this PDF
-                    pdf_output_dir = output_subdir / file_path.stem
-                    pdf_output_dir.mkdir(exist_ok=True, parents=True)
-                    
-                    # Process the PDF with the custom output directory
-                    result = processor._process_pdf(file_path, pdf_output_dir)
-                    
-                    if result.success:
-                        logger.debug(f"Finished processing PDF file: {file_path}")
-                    else:
-                        logger.error(f"Failed to process PDF file: {file_path}")
+                with BibliographyProcessor(
+                    file_path, hasher=self.hasher, store=self.store, limits=self.limits, pool=self.pool
+                ) as processor:
+                    result = processor.process_pdf(file_path, paranoid=self.paranoid)
+                if result.success:
+                    logger.debug(f"Finished processing PDF file: {file_path}")
                 else:
-                    # If the file is not relative to the watched directory, process it directly
-                    with BibliographyProcessor(file_path) as processor:
-                        result = processor.process_pdf(file_path)
-                    if result.success:
-                        logger.debug(f"Finished processing PDF file: {file_path}")
-                    else:
-                        logger.error(f"Failed to process PDF file: {file_path}")
+                    logger.error(f"Failed to process PDF file: {file_path}")
         except Exception as e:
             logger.error(f"Error processing file {file_path}: {e}\n{traceback.format_exc()}")
     
-    def _process_directory(self):
-        """Process the entire directory."""
+    def _process_directory(self, subdirectory: Optional[Path] = None):
+        """Process the entire directory, or only the files of one of its subdirectories.
+        
+        Args:
+            subdirectory: Subdirectory to scan, e.g. one that was just created
+                (default: the whole directory)
+        """
+        scanned = subdirectory or self.directory_path
         try:
-            logger.debug(f"Processing directory {self.directory_path}")
-            processor = DirectoryProcessor(self.directory_path)
-            processor.process_directory(recursive=self.recursive, num_processes=self.num_processes)
+            logger.debug(f"Processing directory {scanned}")
+            processor = DirectoryProcessor(
+                self.directory_path, hasher=self.hasher, store=self.store, limits=self.limits, pool=self.pool
+            )
+            processor.process_directory(
+                recursive=self.recursive,
+                num_processes=self.num_processes,
+                paranoid=self.paranoid,
+                subdirectory=subdirectory
+            )
             logger.debug("Directory processing complete")
             logger.info(f"\nWatching directory: {self.directory_path.resolve()}\n")
         except Exception as e:
-            logger.error(f"Error processing directory {self.directory_path}: {e}\n{traceback.format_exc()}")
+            logger.error(f"Error processing directory {scanned}: {e}\n{traceback.format_exc()}")
             logger.info(f"\nWatching directory: {self.directory_path.resolve()}\n")
 
-def watch_bibtex(bib_file: Path, num_processes: int = None):
+def start_worker_pool(num_processes: Union[int, str, None], limits: Optional[WorkerLimits]) -> WorkerPool:
+    """Start the warm worker pool shared by all changes processed while watching.
+    
+    Its workers are started and have the conversion libraries initialized
+    before the first change, and stay alive between changes, so that a small
+    change doesn't wait for worker processes to start.
+    
+    Args:
+        num_processes: Number of worker processes; 'auto' uses the default
+            number, since a watch rarely converts enough documents to calibrate it
+        limits: Limits of the worker processes (default: WorkerLimits())
+        
+    Returns:
+        WorkerPool: The pool, which is shut down when used as a context manager
+    """
+    return WorkerPool(worker_count(num_processes), limits, warm=True, initializer=warm_up_converter)
+
+def watch_bibtex(
+    bib_file: Path,
+    num_processes: Union[int, str, None] = None,
+    paranoid: bool = False,
+    hasher: Optional[FileHasher] = None,
+    store: Optional[ConversionStore] = None,
+    limits: Optional[WorkerLimits] = None,
+    quiet_period: float = DEFAULT_QUIET_PERIOD
+):
     """Watch a BibTeX file for changes and process it automatically.
     
     Args:
         bib_file: Path to the BibTeX file to watch
-        num_processes: Number of parallel processes to use (default: number of CPU cores)
+        num_processes: Number of parallel processes to use, or 'auto' (default: number of available CPUs)
+        paranoid: Whether to hash all attachments, even those whose stat signature is unchanged
+        hasher: FileHasher used for change tracking (default: full SHA-256)
+        store: ConversionStore holding the PDF conversions (default: the user-level cache)
+        limits: Limits of the worker processes converting PDFs (default: WorkerLimits())
+        quiet_period: Seconds without new events after which a changed file is processed
     """
     try:
         logger.info(f"\nWatching BibTeX file: {bib_file.resolve()}\n")
-        event_handler = BibTexHandler(bib_file, num_processes)
-        observer = Observer()
-        observer.schedule(event_handler, str(bib_file.parent), recursive=False)
-        observer.start()
+        with start_worker_pool(num_processes, limits) as pool:
+            observer = Observer()
+            event_handler = BibTexHandler(
+                bib_file, num_processes, paranoid, hasher, store, limits, pool, quiet_period, observer
+            )
+            observer.schedule(event_handler, str(bib_file.parent), recursive=False)
+            observer.start()
 
-        try:
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            observer.stop()
-            logger.debug("Stopping file watcher")
-            logger.info("\nStopped watching BibTeX file\n")
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                observer.stop()
+                logger.debug("Stopping file watcher")
+                logger.info("\nStopped watching BibTeX file\n")
         
-        observer.join()
+            observer.join()
+            event_handler.changes.stop()
     except Exception as e:
         logger.error(f"Error in watch_bibtex: {e}\n{traceback.format_exc()}")
         raise
 
-def watch_pdf(pdf_file: Path, num_processes: int = None):
+def watch_pdf(
+    pdf_file: Path,
+    num_processes: Union[int, str, None] = None,
+    paranoid: bool = False,
+    hasher: Optional[FileHasher] = None,
+    store: Optional[ConversionStore] = None,
+    limits: Optional[WorkerLimits] = None,
+    quiet_period: float = DEFAULT_QUIET_PERIOD
+):
     """Watch a PDF file for changes and process it automatically.
     
     Args:
         pdf_file: Path to the PDF file to watch
-        num_processes: Number of parallel processes to use (default: number of CPU cores)
+        num_processes: Number of parallel processes to use, or 'auto' (default: number of available CPUs)
+        paranoid: Whether to hash the PDF even if its stat signature is unchanged
+        hasher: FileHasher used for change tracking (default: full SHA-256)
+        store: ConversionStore holding the PDF conversions (default: the user-level cache)
+        limits: Limits of the worker processes converting PDFs (default: WorkerLimits())
+        quiet_period: Seconds without new events after which a changed file is processed
     """
     try:
         logger.info(f"\nWatching PDF file: {pdf_file.resolve()}\n")
-        event_handler = PDFHandler(pdf_file, num_processes)
-        observer = Observer()
-        observer.schedule(event_handler, str(pdf_file.parent), recursive=False)
-        observer.start()
+        with start_worker_pool(num_processes, limits) as pool:
+            event_handler = PDFHandler(pdf_file, num_processes, paranoid, hasher, store, limits, pool, quiet_period)
+            observer = Observer()
+            observer.schedule(event_handler, str(pdf_file.parent), recursive=False)
+            observer.start()
 
-        try:
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            observer.stop()
-            logger.debug("Stopping file watcher")
-            logger.info("\nStopped watching PDF file\n")
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                observer.stop()
+                logger.debug("Stopping file watcher")
+                logger.info("\nStopped watching PDF file\n")
         
-        observer.join()
+            observer.join()
+            event_handler.changes.stop()
     except Exception as e:
         logger.error(f"Error in watch_pdf: {e}\n{traceback.format_exc()}")
         raise
 
-def watch_directory(directory_path: Path, recursive: bool = True, num_processes: int = None):
+def watch_directory(
+    directory_path: Path,
+    recursive: bool = True,
+    num_processes: Union[int, str, None] = None,
+    paranoid: bool = False,
+    hasher: Optional[FileHasher] = None,
+    store: Optional[ConversionStore] = None,
+    limits: Optional[WorkerLimits] = None,
+    quiet_period: float = DEFAULT_QUIET_PERIOD
+):
     """Watch a directory for changes and process files automatically.
     
     Args:
         directory_path: Path to the directory to watch
         recursive: Whether to watch subdirectories recursively (default: True)
-        num_processes: Number of parallel processes to use (default: number of CPU cores)
+        num_processes: Number of parallel processes to use, or 'auto' (default: number of available CPUs)
+        paranoid: Whether to hash all attachments, even those whose stat signature is unchanged
+        hasher: FileHasher used for change tracking (default: full SHA-256)
+        store: ConversionStore holding the PDF conversions (default: the user-level cache)
+        limits: Limits of the worker processes converting PDFs (default: WorkerLimits())
+        quiet_period: Seconds without new events after which a changed file is processed
     """
     try:
         logger.info(f"\nWatching directory: {directory_path.resolve()}\n")
-        event_handler = DirectoryHandler(directory_path, recursive, num_processes)
-        observer = Observer()
-        observer.schedule(event_handler, str(directory_path), recursive=recursive)
-        observer.start()
+        with start_worker_pool(num_processes, limits) as pool:
+            event_handler = DirectoryHandler(
+                directory_path, recursive, num_processes, paranoid, hasher, store, limits, pool, quiet_period
+            )
+            observer = Observer()
+            observer.schedule(event_handler, str(directory_path), recursive=recursive)
+            observer.start()
 
-        try:
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            observer.stop()
-            logger.debug("Stopping directory watcher")
-            logger.info("\nStopped watching directory\n")
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                observer.stop()
+                logger.debug("Stopping directory watcher")
+                logger.info("\nStopped watching directory\n")
         
-        observer.join()
+            observer.join()
+            event_handler.changes.stop()
     except Exception as e:
         logger.error(f"Error in watch_directory: {e}\n{traceback.format_exc()}")
         raise 
\ No newline at end of file
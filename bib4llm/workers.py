@@ -0,0 +1,490 @@
+"""Supervised pool of worker processes for PDF conversions.
+
+A malformed PDF can make MuPDF hang, allocate memory without bound or crash
+the process. With a ProcessPoolExecutor, a hanging conversion stalls the run
+and a crashed worker breaks the whole pool. WorkerPool instead supervises every
+worker individually:
+
+- each task has a wall-clock timeout, after which its worker is killed;
+- each worker may be given an address-space limit (RLIMIT_AS), so that a
+  runaway allocation fails in the worker instead of exhausting the machine;
+- workers are replaced after a number of tasks, returning memory fragmented
+  or leaked by MuPDF to the system;
+- workers that die are replaced, and only the task they were running fails.
+
+Failed tasks raise a WorkerError describing the reason from Future.result().
+
+Tasks can be submitted with an estimate of the memory they need. With a
+memory budget, a task is only started while the estimates of the running
+tasks and its own stay within the budget, so that several large scanned
+PDFs converted at once don't exhaust the memory of the machine. A task that
+exceeds the budget on its own is run when no other task is running. Smaller
+tasks queued behind a large one may start first while they fit, but only
+for MAX_OVERTAKE_TIME: after that, no further task is started until the
+large task fits, so that a steady stream of small tasks can't starve it.
+
+A warm pool starts all its workers right away, prepares each of them with an
+initializer (e.g. convert.warm_up_converter) and immediately replaces workers
+that are retired, so that a task submitted to an idle pool starts without
+waiting for a process to start and import the conversion libraries. Watch
+mode keeps a warm pool for its whole lifetime.
+
+Where available, workers are started by a fork server (see get_context): a
+process started once that imports bib4llm, and with it pymupdf, pymupdf4llm
+and bibtexparser, and forks each worker from itself. Workers then start with
+the conversion libraries imported and initialized, without forking the main
+process, which runs threads (the supervisor of the pool, the watchdog
+observers) that make forking it unsafe.
+"""
+
+import logging
+import multiprocessing
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from .resources import default_processes
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Create logger
+logger = logging.getLogger(__name__)
+
+# Default wall-clock time a task may take, in seconds
+DEFAULT_TASK_TIMEOUT = 1800
+# Default number of tasks after which a worker is replaced
+DEFAULT_MAX_TASKS = 50
+# Start methods of worker processes available on this platform
+START_METHODS = multiprocessing.get_all_start_methods()
+# Default start method, or None for the default of the platform
+DEFAULT_START_METHOD = "forkserver" if "forkserver" in START_METHODS else None
+# Modules the fork server imports before forking workers
+PRELOAD_MODULES = ["bib4llm"]
+# Time after which a queued task that doesn't fit into the memory budget
+# stops later tasks from overtaking it, in seconds
+MAX_OVERTAKE_TIME = 10.0
+
+
+class WorkerError(Exception):
+    """A task failed because its worker process was killed or died."""
+
+
+class TaskTimeout(WorkerError):
+    """A task took longer than the task timeout."""
+
+
+class WorkerDied(WorkerError):
+    """The worker process running a task exited unexpectedly."""
+
+
+@dataclass(frozen=True)
+class WorkerLimits:
+    """Limits of the worker processes converting PDFs.
+
+    Attributes:
+        task_timeout: Wall-clock time a task may take, in seconds (None for no limit)
+        memory_limit: Address-space limit of each worker, in bytes (None for no limit)
+        max_tasks: Number of tasks after which a worker is replaced (None to keep workers)
+        max_memory: Budget for the estimated memory of all running tasks, in bytes (None for no budget)
+        start_method: How worker processes are started, one of START_METHODS
+            (None for DEFAULT_START_METHOD)
+    """
+    task_timeout: Optional[float] = DEFAULT_TASK_TIMEOUT
+    memory_limit: Optional[int] = None
+    max_tasks: Optional[int] = DEFAULT_MAX_TASKS
+    max_memory: Optional[int] = None
+    start_method: Optional[str] = None
+
+
+def get_context(start_method: Optional[str] = None):
+    """Get the multiprocessing context starting worker processes.
+
+    With the 'forkserver' start method, the fork server imports
+    PRELOAD_MODULES once when it is started, so that workers forked from it
+    don't import the conversion libraries on their own like with 'spawn'.
+
+    Args:
+        start_method: One of START_METHODS (default: DEFAULT_START_METHOD)
+
+    Returns:
+        multiprocessing.context.BaseContext: The context
+    """
+    context = multiprocessing.get_context(start_method or DEFAULT_START_METHOD)
+    if context.get_start_method() == "forkserver":
+        # Only takes effect if the fork server isn't running yet
+        context.set_forkserver_preload(PRELOAD_MODULES)
+    return context
+
+
+def reset_peak_memory():
+    """Reset the peak resident set size of the current process, where supported (Linux)."""
+    try:
+        Path('/proc/self/clear_refs').write_text('5')
+    except OSError:
+        pass
+
+
+def peak_memory() -> int:
+    """Get the peak resident set size of the current process.
+
+    Returns:
+        int: Peak RSS in bytes since the process started or reset_peak_memory()
+            was called, or 0 if it can't be determined
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in KiB elsewhere
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+    return 0
+
+
+def _describe_exit(exitcode: Optional[int]) -> str:
+    """Describe the exit code of a worker process."""
+    if exitcode is not None and exitcode < 0:
+        try:
+            name = signal.Signals(-exitcode).name
+        except ValueError:
+            name = f"signal {-exitcode}"
+        hint = " (out of memory?)" if exitcode == -signal.SIGKILL else ""
+        return f"was killed by {name}{hint}"
+    return f"exited with code {exitcode}"
+
+
+def _worker_main(conn, memory_limit: Optional[int], initializer: Optional[Callable]):
+    """Run tasks received over a connection until it is closed.
+
+    Args:
+        conn: Connection receiving (function, args) tuples, or None to exit,
+            and sending (success, result or exception) tuples
+        memory_limit: Address-space limit of the process in bytes, or None
+        initializer: Function called before the first task, or None
+    """
+    if memory_limit and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    if initializer is not None:
+        try:
+            initializer()
+        except Exception as e:
+            logger.debug(f"Failed to initialize worker process: {e!r}")
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError, KeyboardInterrupt):
+            break
+        if task is None:
+            break
+        fn, args = task
+        try:
+            reply = (True, fn(*args))
+        except BaseException as e:
+            reply = (False, e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # The result or exception can't be pickled
+            conn.send((False, WorkerError(f"Failed to return the result: {e!r}")))
+
+
+class _Worker:
+    """A worker process and the task it is running."""
+
+    def __init__(self, context, memory_limit: Optional[int], initializer: Optional[Callable] = None):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, memory_limit, initializer), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.future: Optional[Future] = None
+        self.deadline: Optional[float] = None
+        self.memory = 0
+        self.tasks_done = 0
+
+    def stop(self, timeout: float = 1.0):
+        """Ask the worker to exit, killing it if it doesn't."""
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+
+    def kill(self):
+        """Kill the worker process."""
+        self.process.kill()
+        self.process.join()
+
+
+class WorkerPool:
+    """Executor running tasks in supervised worker processes.
+
+    Supports the parts of the concurrent.futures.Executor interface used by
+    the processors: submit() and use as a context manager. Leaving the context
+    waits for all submitted tasks, or cancels the tasks that haven't started
+    if it is left because of an exception.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        limits: Optional[WorkerLimits] = None,
+        warm: bool = False,
+        initializer: Optional[Callable] = None
+    ):
+        """Start the supervisor of the pool.
+
+        Args:
+            max_workers: Maximum number of worker processes (default: resources.default_processes())
+            limits: Limits of the worker processes (default: WorkerLimits())
+            warm: Whether to keep max_workers workers running at all times,
+                instead of starting workers when tasks are submitted
+            initializer: Picklable function called in each worker before its first task
+        """
+        self.max_workers = max_workers or default_processes()
+        self.limits = limits or WorkerLimits()
+        self.warm = warm
+        self.initializer = initializer
+        self._context = get_context(self.limits.start_method)
+        self._tasks = deque()
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()
+        self._shutdown = False
+        self._wakeup_reader, self._wakeup_writer = self._context.Pipe(duplex=False)
+        self._supervisor = threading.Thread(target=self._supervise, name="WorkerPool supervisor", daemon=True)
+        self._supervisor.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown(wait=True, cancel_futures=exc_type is not None)
+
+    def submit(self, fn: Callable, *args, memory: int = 0) -> Future:
+        """Submit a task.
+
+        Args:
+            fn: Function to run in a worker process (must be picklable)
+            *args: Arguments of the function
+            memory: Estimated memory needed by the task in bytes, counted against
+                the memory budget while it runs
+
+        Returns:
+            Future: Future of the result of the task
+        """
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Cannot submit tasks after shutdown")
+            self._tasks.append((future, fn, args, memory, time.monotonic()))
+        self._wakeup()
+        return future
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False):
+        """Stop the pool once all submitted tasks are done.
+
+        Args:
+            wait: Whether to wait until all tasks are done and the workers have exited
+            cancel_futures: Whether to cancel the tasks that haven't started yet
+        """
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                while self._tasks:
+                    self._tasks.popleft()[0].cancel()
+        self._wakeup()
+        if wait:
+            self._supervisor.join()
+
+    def resize(self, max_workers: int):
+        """Change the number of tasks run at the same time.
+
+        Surplus workers exit when they finish their current task.
+
+        Args:
+            max_workers: New maximum number of worker processes
+        """
+        with self._lock:
+            self.max_workers = max(1, max_workers)
+        self._wakeup()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_writer.send_bytes(b"")
+        except OSError:
+            # The supervisor has exited
+            pass
+
+    def _next_task(self) -> Optional[int]:
+        """Get the index of the first queued task that fits into the memory budget.
+
+        Later tasks may overtake a task that doesn't fit, unless it has been
+        queued for MAX_OVERTAKE_TIME already; the memory of finishing tasks
+        is then reserved for it.
+
+        Returns:
+            Optional[int]: Index into the queue, or None if no task may be started
+        """
+        budget = self.limits.max_memory
+        if not budget:
+            return 0
+        running = [worker.memory for worker in self._workers if worker.future is not None]
+        if not running:
+            # Run a task exceeding the budget on its own rather than never
+            return 0
+        reserved = sum(running)
+        now = time.monotonic()
+        for index, (_, _, _, memory, queued) in enumerate(self._tasks):
+            if reserved + memory <= budget:
+                return index
+            if now - queued >= MAX_OVERTAKE_TIME:
+                return None
+        return None
+
+    def _start_tasks(self):
+        """Hand queued tasks to idle workers within the memory budget, starting workers as needed."""
+        while True:
+            with self._lock:
+                if not self._tasks:
+                    return
+                busy = sum(1 for worker in self._workers if worker.future is not None)
+                if busy >= self.max_workers:
+                    return
+                worker = next((worker for worker in self._workers if worker.future is None), None)
+                index = self._next_task()
+                if index is None:
+                    return
+                if worker is None:
+                    worker = self._start_worker()
+                future, fn, args, memory, _ = self._tasks[index]
+                del self._tasks[index]
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                worker.conn.send((fn, args))
+            except OSError:
+                # The idle worker died, e.g. because it was killed from outside
+                worker.process.join()
+                future.set_exception(WorkerDied(f"Worker process {_describe_exit(worker.process.exitcode)}"))
+                self._replace(worker)
+                continue
+            except Exception as e:
+                # The task can't be pickled
+                future.set_exception(e)
+                continue
+            worker.future = future
+            worker.memory = memory
+            worker.deadline = (
+                time.monotonic() + self.limits.task_timeout if self.limits.task_timeout else None
+            )
+
+    def _start_worker(self) -> _Worker:
+        """Start a worker and add it to the pool (with the lock held)."""
+        worker = _Worker(self._context, self.limits.memory_limit, self.initializer)
+        self._workers.append(worker)
+        return worker
+
+    def _keep_warm(self):
+        """Start workers until the pool has max_workers of them."""
+        with self._lock:
+            if not self.warm or self._shutdown:
+                return
+            while len(self._workers) < self.max_workers:
+                self._start_worker()
+
+    def _replace(self, worker: _Worker):
+        """Remove a worker; a new one is started when there are tasks for it, or right away in a warm pool."""
+        with self._lock:
+            self._workers.remove(worker)
+        if worker.process.is_alive():
+            worker.stop()
+        else:
+            worker.process.join()
+            worker.conn.close()
+
+    def _finish_task(self, worker: _Worker, error: Optional[WorkerError] = None):
+        """Complete the future of the task of a worker, with its result or an error."""
+        if error is None:
+            success, value = worker.conn.recv()
+        future, worker.future, worker.deadline, worker.memory = worker.future, None, None, 0
+        if error is not None:
+            future.set_exception(error)
+            return
+        if success:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+        worker.tasks_done += 1
+        if self.limits.max_tasks and worker.tasks_done >= self.limits.max_tasks:
+            logger.debug(f"Replacing worker {worker.process.pid} after {worker.tasks_done} tasks")
+            self._replace(worker)
+        elif len(self._workers) > self.max_workers:
+            # The pool was resized
+            self._replace(worker)
+
+    def _supervise(self):
+        """Start tasks and supervise the workers until the pool is shut down."""
+        try:
+            while True:
+                self._keep_warm()
+                self._start_tasks()
+                busy = [worker for worker in self._workers if worker.future is not None]
+                with self._lock:
+                    if self._shutdown and not self._tasks and not busy:
+                        break
+                deadlines = [worker.deadline for worker in busy if worker.deadline is not None]
+                timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+
+                ready = wait(
+                    [self._wakeup_reader] + [worker.conn for worker in busy]
+                    + [worker.process.sentinel for worker in busy],
+                    timeout=timeout
+                )
+                if self._wakeup_reader in ready:
+                    while self._wakeup_reader.poll():
+                        self._wakeup_reader.recv_bytes()
+
+                now = time.monotonic()
+                for worker in busy:
+                    if worker.conn in ready:
+                        try:
+                            self._finish_task(worker)
+                            continue
+                        except (EOFError, OSError):
+                            # The worker died while sending its result
+                            pass
+                    if worker.conn in ready or worker.process.sentinel in ready:
+                        worker.process.join()
+                        error = WorkerDied(f"Worker process {_describe_exit(worker.process.exitcode)}")
+                        logger.debug(f"Worker {worker.process.pid} {_describe_exit(worker.process.exitcode)}")
+                        self._finish_task(worker, error)
+                        self._replace(worker)
+                    elif worker.deadline is not None and now >= worker.deadline:
+                        logger.debug(f"Killing worker {worker.process.pid} after {self.limits.task_timeout}s")
+                        worker.kill()
+                        self._finish_task(worker, TaskTimeout(f"Timed out after {self.limits.task_timeout:g}s"))
+                        self._replace(worker)
+        finally:
+            for worker in list(self._workers):
+                worker.stop()
+            self._workers.clear()
+            self._wakeup_reader.close()
+            self._wakeup_writer.close()
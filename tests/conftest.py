@@ -0,0 +1,15 @@
+"""Shared pytest configuration for the bib4llm tests."""
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache_dir(tmp_path, monkeypatch):
+    """Point the user-level conversion cache at a temporary directory.
+
+    Processors without an explicit store use ConversionStore.default(), so
+    without this the tests would read and fill the real ~/.cache/bib4llm.
+    """
+    cache_dir = tmp_path / "bib4llm-cache"
+    monkeypatch.setenv("BIB4LLM_CACHE_DIR", str(cache_dir))
+    return cache_dir
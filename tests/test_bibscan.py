@@ -0,0 +1,126 @@
+"""Test the streaming BibTeX scanner."""
+
+import unittest
+import tempfile
+import shutil
+import logging
+from pathlib import Path
+from unittest import mock
+
+import bibtexparser
+
+from bib4llm import bibscan
+from bib4llm.bibscan import ScannedEntry, scan_bibtex
+
+
+TRICKY_BIBTEX = """Text before the first entry, with an @ sign
+@string{pdfdir = {/tmp/pdfs}}
+@comment{ a comment @article{Fake, file={/tmp/fake.pdf}} }
+@article{Quoted2023,
+  title = {An @ inside {nested} braces},
+  author = "Doe, J. and {Smith}, A.",
+  note = "quoted, file = {/not/this.pdf}",
+  month = jan,
+  year = 2023,
+  FILE = {/tmp/a.pdf;
+     /tmp/b b.pdf}
+}
+@Book{NoFile2023, title={No file}}
+@misc{QuotedFile2023, file = "/tmp/quoted {x}.pdf"}
+@book(Parens2023, file = {/tmp/parens.pdf})
+@misc{Macro2023, file = pdfdir # {/x.pdf}}
+@online{Online2023, file = {/tmp/online.pdf}}
+@article{Empty2023, file = {}}
+@article{AtLineStart2023,
+  abstract = {First line
+  @inproceedings at the start of a line},
+  file = {/tmp/at.pdf}
+}
+@article{SameLine1, file={/tmp/one.pdf}} @article{SameLine2, file={/tmp/two.pdf}}
+  @article{Indented2023,
+    file = {/tmp/indented.pdf},
+  }
+"""
+
+
+class TestBibScan(unittest.TestCase):
+    """Test that the scanner finds the same entries as bibtexparser."""
+
+    def setUp(self):
+        """Set up the test environment."""
+        # Set up a null handler for logging instead of disabling it
+        self.root_logger = logging.getLogger()
+        self.old_handlers = self.root_logger.handlers.copy()
+        self.root_logger.handlers.clear()
+        self.null_handler = logging.NullHandler()
+        self.root_logger.addHandler(self.null_handler)
+
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.bibtex_file = self.temp_dir / "library.bib"
+        self.bibtex_file.write_text(TRICKY_BIBTEX)
+
+    def tearDown(self):
+        """Clean up after the test."""
+        # Restore original logging handlers
+        self.root_logger.removeHandler(self.null_handler)
+        for handler in self.old_handlers:
+            self.root_logger.addHandler(handler)
+
+    def _expected(self, path: Path):
+        with open(path, "r", encoding="utf-8") as f:
+            return [(entry["ID"], entry.get("file")) for entry in bibtexparser.load(f).entries]
+
+    def _scanned(self, path: Path, **kwargs):
+        return [(entry.citation_key, entry.file) for entry in scan_bibtex(path, **kwargs)]
+
+    def test_matches_bibtexparser(self):
+        """Test entries with nested braces, quotes, macros and odd layouts."""
+        expected = self._expected(self.bibtex_file)
+        self.assertIn(("Macro2023", "/tmp/pdfs/x.pdf"), expected)
+        self.assertNotIn("Online2023", [key for key, _ in expected])
+        self.assertEqual(self._scanned(self.bibtex_file), expected)
+
+    def test_example_library(self):
+        """Test the example library."""
+        example = Path(__file__).parent.parent / "examples" / "bibtex_library.bib"
+        self.assertEqual(self._scanned(example), self._expected(example))
+
+    def test_entries_spanning_chunks(self):
+        """Test that entries split across read chunks are reassembled."""
+        expected = self._expected(self.bibtex_file)
+        for chunk_size in (1, 7, 64):
+            with mock.patch.object(bibscan, "CHUNK_SIZE", chunk_size):
+                self.assertEqual(self._scanned(self.bibtex_file), expected, f"chunk size {chunk_size}")
+
+    def test_parallel_scan(self):
+        """Test that parsing in worker processes keeps the order of the entries."""
+        with mock.patch.object(bibscan, "PARALLEL_THRESHOLD", 0), mock.patch.object(bibscan, "BATCH_SIZE", 2):
+            scanned = self._scanned(self.bibtex_file, num_workers=2)
+        self.assertEqual(scanned, self._expected(self.bibtex_file))
+
+    def test_parallel_scan_start_method(self):
+        """Test that the parsing processes are not forked from the possibly multi-threaded caller."""
+        with mock.patch.object(bibscan, "PARALLEL_THRESHOLD", 0), mock.patch.object(
+            bibscan, "ProcessPoolExecutor", side_effect=bibscan.ProcessPoolExecutor
+        ) as executor:
+            scanned = self._scanned(self.bibtex_file, num_workers=2, start_method="forkserver")
+        self.assertEqual(scanned, self._expected(self.bibtex_file))
+        self.assertEqual(executor.call_args.kwargs["mp_context"].get_start_method(), "forkserver")
+
+    def test_digests(self):
+        """Test that digests change only for modified entries."""
+        before = {entry.citation_key: entry.digest for entry in scan_bibtex(self.bibtex_file)}
+        self.bibtex_file.write_text(TRICKY_BIBTEX.replace("No file", "Still no file"))
+        after = {entry.citation_key: entry.digest for entry in scan_bibtex(self.bibtex_file)}
+        changed = [key for key in before if before[key] != after[key]]
+        self.assertEqual(changed, ["NoFile2023"])
+
+    def test_as_entry(self):
+        """Test conversion to the dictionary form of bibtexparser."""
+        self.assertEqual(ScannedEntry("A", "/a.pdf", "0").as_entry(), {"ID": "A", "file": "/a.pdf"})
+        self.assertEqual(ScannedEntry("B", None, "0").as_entry(), {"ID": "B"})
+
+
+if __name__ == "__main__":
+    unittest.main()
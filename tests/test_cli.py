@@ -91,6 +91,21 @@ class TestCLI(unittest.TestCase):
             f"Watch help output should mention path to BibTeX/PDF/directory, got: {result.stdout}",
         )
 
+    def test_conversion_options(self):
+        """Test that convert and watch share the same conversion options."""
+        sections = []
+        for command in ("convert", "watch"):
+            result = subprocess.run(
+                ["bib4llm", command, "--help"],
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            self.assertIn("conversion options:", result.stdout)
+            sections.append(result.stdout.split("conversion options:", 1)[1])
+        self.assertEqual(sections[0], sections[1], "Conversion options of convert and watch should be identical")
+        self.assertIn("--start-method", sections[0])
+
     def test_clean_help(self):
         """Test the clean help command."""
         result = subprocess.run(
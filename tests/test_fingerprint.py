@@ -0,0 +1,130 @@
+"""Test the fingerprint module."""
+
+import unittest
+import tempfile
+import shutil
+import hashlib
+import logging
+from pathlib import Path
+
+from bib4llm import fingerprint
+from bib4llm.fingerprint import FileHasher
+
+
+class TestFileHasher(unittest.TestCase):
+    """Test the FileHasher class."""
+
+    def setUp(self):
+        """Set up the test environment."""
+        # Set up a null handler for logging instead of disabling it
+        self.root_logger = logging.getLogger()
+        self.old_handlers = self.root_logger.handlers.copy()
+        self.root_logger.handlers.clear()
+        self.null_handler = logging.NullHandler()
+        self.root_logger.addHandler(self.null_handler)
+        
+        # Create a temporary directory
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        
+        # Create a file spanning several read chunks
+        self.data = bytes(range(256)) * (fingerprint.CHUNK_SIZE // 256 * 2 + 7)
+        self.file = Path(self.temp_dir) / "data.bin"
+        self.file.write_bytes(self.data)
+
+    def tearDown(self):
+        """Clean up after the test."""
+        # Restore original logging handlers
+        self.root_logger.removeHandler(self.null_handler)
+        for handler in self.old_handlers:
+            self.root_logger.addHandler(handler)
+
+    def test_full_hash_matches_hashlib(self):
+        """Test that chunked hashing gives the same digest as hashing the whole file at once."""
+        for algorithm, reference in (("sha256", hashlib.sha256), ("blake2b", hashlib.blake2b)):
+            digest = FileHasher(algorithm).hash_file(self.file)
+            self.assertEqual(
+                digest,
+                reference(self.data).hexdigest(),
+                f"Chunked {algorithm} digest should match hashlib",
+            )
+
+    def test_name(self):
+        """Test the identifier recorded in the state database."""
+        self.assertEqual(FileHasher().name, "sha256", "Default hasher should be full SHA-256")
+        self.assertEqual(
+            FileHasher("blake2b", sampled=True).name,
+            "blake2b-sampled",
+            "Sampled hashers should be distinguishable from full hashers",
+        )
+
+    def test_unsupported_algorithm(self):
+        """Test that unsupported algorithms are rejected on construction."""
+        with self.assertRaises(ValueError):
+            FileHasher("md4-unsupported")
+
+    def test_missing_file(self):
+        """Test that hashing a missing file returns an empty string."""
+        self.assertEqual(
+            FileHasher().hash_file(Path(self.temp_dir) / "missing.pdf"),
+            "",
+            "Hash of a missing file should be an empty string",
+        )
+
+    def test_sampled_hash(self):
+        """Test that sampled hashing only looks at the size and the sampled blocks."""
+        hasher = FileHasher(sampled=True)
+        original = hasher.hash_file(self.file)
+        
+        # A change outside of the head, middle and tail blocks goes unnoticed
+        data = bytearray(self.data)
+        data[fingerprint.SAMPLE_BLOCK_SIZE + 1] ^= 0xFF
+        self.file.write_bytes(data)
+        self.assertEqual(
+            hasher.hash_file(self.file),
+            original,
+            "Sampled hash should ignore bytes outside of the sampled blocks",
+        )
+        
+        # A change of the tail block or of the size is detected
+        data[-1] ^= 0xFF
+        self.file.write_bytes(data)
+        self.assertNotEqual(hasher.hash_file(self.file), original, "Sampled hash should cover the tail block")
+        self.file.write_bytes(self.data + b"x")
+        self.assertNotEqual(hasher.hash_file(self.file), original, "Sampled hash should cover the file size")
+
+    def test_sampled_hash_small_file(self):
+        """Test that small files are hashed in full in sampled mode."""
+        small = Path(self.temp_dir) / "small.bin"
+        small.write_bytes(b"small file")
+        self.assertEqual(
+            FileHasher(sampled=True).hash_file(small),
+            hashlib.sha256(b"small file").hexdigest(),
+            "Files smaller than three sample blocks should be hashed in full",
+        )
+
+    def test_hash_directory(self):
+        """Test that directory hashes track file contents and symlink targets."""
+        directory = Path(self.temp_dir) / "out"
+        directory.mkdir()
+        (directory / "a.md").write_text("a")
+        (directory / "link.pdf").symlink_to(self.file)
+        hasher = FileHasher()
+        original = hasher.hash_directory(directory)
+        
+        self.assertEqual(hasher.hash_directory(directory), original, "Directory hash should be stable")
+        (directory / "a.md").write_text("b")
+        self.assertNotEqual(
+            hasher.hash_directory(directory),
+            original,
+            "Directory hash should change when a file changes",
+        )
+        self.assertEqual(
+            hasher.hash_directory(Path(self.temp_dir) / "missing"),
+            "",
+            "Hash of a missing directory should be an empty string",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
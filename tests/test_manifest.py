@@ -0,0 +1,99 @@
+"""Test the manifest module."""
+
+import unittest
+import tempfile
+import shutil
+import os
+import logging
+from pathlib import Path
+
+from bib4llm.fingerprint import FileHasher
+from bib4llm.manifest import build_manifest, manifest_digest, manifest_matches, verify_manifest
+
+
+class TestManifest(unittest.TestCase):
+    """Test building and checking output manifests."""
+
+    def setUp(self):
+        """Set up the test environment."""
+        # Set up a null handler for logging instead of disabling it
+        self.root_logger = logging.getLogger()
+        self.old_handlers = self.root_logger.handlers.copy()
+        self.root_logger.handlers.clear()
+        self.null_handler = logging.NullHandler()
+        self.root_logger.addHandler(self.null_handler)
+        
+        # Create a temporary output directory with a markdown file, an image and a symlink
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.output_dir = Path(self.temp_dir) / "Test2023"
+        self.output_dir.mkdir()
+        (self.output_dir / "Test2023.md").write_text("# Citation Key: Test2023")
+        (self.output_dir / "Test2023.pdf-1-0.png").write_bytes(b"\x89PNG")
+        self.source = Path(self.temp_dir) / "source.pdf"
+        self.source.write_bytes(b"%PDF")
+        (self.output_dir / "Test2023.pdf").symlink_to(self.source)
+        
+        self.hasher = FileHasher()
+        self.manifest = build_manifest(self.output_dir, self.hasher)
+
+    def tearDown(self):
+        """Clean up after the test."""
+        # Restore original logging handlers
+        self.root_logger.removeHandler(self.null_handler)
+        for handler in self.old_handlers:
+            self.root_logger.addHandler(handler)
+
+    def test_build_manifest(self):
+        """Test that the manifest lists all output files, including symlinks."""
+        self.assertEqual(
+            sorted(self.manifest),
+            ["Test2023.md", "Test2023.pdf", "Test2023.pdf-1-0.png"],
+            f"Manifest should list all output files, got {sorted(self.manifest)}",
+        )
+        self.assertEqual(
+            self.manifest["Test2023.pdf"][2],
+            self.hasher.hash_bytes(str(self.source).encode()),
+            "Symlinks should be recorded by the hash of their target path",
+        )
+
+    def test_manifest_matches(self):
+        """Test the stat-only comparison against the manifest."""
+        self.assertTrue(manifest_matches(self.output_dir, self.manifest), "Unchanged output should match")
+        
+        (self.output_dir / "extra.png").write_bytes(b"extra")
+        self.assertFalse(manifest_matches(self.output_dir, self.manifest), "Additional files should not match")
+        (self.output_dir / "extra.png").unlink()
+        
+        md_file = self.output_dir / "Test2023.md"
+        stat = md_file.stat()
+        os.utime(md_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        self.assertFalse(manifest_matches(self.output_dir, self.manifest), "Touched files should not match")
+
+    def test_verify_manifest(self):
+        """Test the full content verification against the manifest."""
+        self.assertEqual(verify_manifest(self.output_dir, self.manifest, self.hasher), [], "Intact output should verify")
+        
+        (self.output_dir / "Test2023.pdf-1-0.png").write_bytes(b"\x89PNX")
+        (self.output_dir / "Test2023.md").unlink()
+        self.assertEqual(
+            verify_manifest(self.output_dir, self.manifest, self.hasher),
+            ["missing: Test2023.md", "modified: Test2023.pdf-1-0.png"],
+            "Verification should report missing and modified files",
+        )
+
+    def test_manifest_digest(self):
+        """Test that the digest summarizes the manifest content."""
+        self.assertEqual(manifest_digest({}, self.hasher), "", "Empty manifest should have an empty digest")
+        digest = manifest_digest(self.manifest, self.hasher)
+        
+        (self.output_dir / "Test2023.md").write_text("changed")
+        self.assertNotEqual(
+            manifest_digest(build_manifest(self.output_dir, self.hasher), self.hasher),
+            digest,
+            "Digest should change when the output content changes",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
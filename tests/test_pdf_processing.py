@@ -5,10 +5,16 @@ import tempfile
 import shutil
 import logging
 import multiprocessing
+import os
 import subprocess
+import threading
 from pathlib import Path
+from unittest import mock
+
+import pymupdf
 
 from bib4llm.process_bibliography import DirectoryProcessor
+from bib4llm.store import ConversionStore
 
 
 class TestPDFProcessing(unittest.TestCase):
@@ -150,5 +156,139 @@ class TestPDFProcessing(unittest.TestCase):
         self.assertTrue(result is not None, "PDF processing with force option should succeed on second run")
 
 
+
+class TestDirectoryChangeTracking(unittest.TestCase):
+    """Test that directory mode skips PDFs that are unchanged since their last conversion."""
+
+    def setUp(self):
+        """Set up the test environment."""
+        # Set up a null handler for logging instead of disabling it
+        self.root_logger = logging.getLogger()
+        self.old_handlers = self.root_logger.handlers.copy()
+        self.root_logger.handlers.clear()
+        self.null_handler = logging.NullHandler()
+        self.root_logger.addHandler(self.null_handler)
+        
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.pdf_dir = self.temp_dir / "pdf_dir"
+        (self.pdf_dir / "subfolder").mkdir(parents=True)
+        self.first_pdf = self.pdf_dir / "paper1.pdf"
+        self.second_pdf = self.pdf_dir / "subfolder" / "paper2.pdf"
+        self._write_pdf(self.first_pdf, "First paper")
+        self._write_pdf(self.second_pdf, "Second paper")
+        self.store = ConversionStore(self.temp_dir / "store")
+
+    def tearDown(self):
+        """Clean up after the test."""
+        # Restore original logging handlers
+        self.root_logger.removeHandler(self.null_handler)
+        for handler in self.old_handlers:
+            self.root_logger.addHandler(handler)
+
+    def _write_pdf(self, path: Path, text: str):
+        doc = pymupdf.open()
+        doc.new_page().insert_text((72, 72), text)
+        doc.save(path)
+        doc.close()
+
+    def _process(self, **kwargs):
+        processor = DirectoryProcessor(self.pdf_dir, store=self.store)
+        return processor.process_directory(num_processes=1, **kwargs)
+
+    def test_unchanged_pdfs_are_skipped(self):
+        """Test that a second run converts only modified PDFs and PDFs with modified output."""
+        result = self._process()
+        self.assertEqual((result["pdf_processed"], result["pdf_skipped"]), (2, 0))
+        output_dir = Path(f"{self.pdf_dir}-bib4llm")
+        self.assertTrue((output_dir / "processed_files.db").exists())
+        second_md = output_dir / "subfolder" / "paper2" / "paper2.md"
+        self.assertTrue(second_md.exists())
+        
+        result = self._process()
+        self.assertEqual((result["pdf_processed"], result["pdf_skipped"]), (0, 2))
+        
+        self._write_pdf(self.first_pdf, "First paper (revised)")
+        second_md.unlink()
+        result = self._process()
+        self.assertEqual((result["pdf_processed"], result["pdf_skipped"]), (2, 0))
+        self.assertIn("revised", (output_dir / "paper1" / "paper1.md").read_text())
+        self.assertTrue(second_md.exists(), "Deleted output should be regenerated")
+
+    def test_force(self):
+        """Test that force converts unchanged PDFs again."""
+        self._process()
+        result = self._process(force=True)
+        self.assertEqual((result["pdf_processed"], result["pdf_skipped"]), (2, 0))
+
+    def test_subdirectory(self):
+        """Test that processing a subdirectory only converts the PDFs in it."""
+        result = self._process(subdirectory=self.pdf_dir / "subfolder")
+        self.assertEqual((result["pdf_processed"], result["pdf_skipped"]), (1, 0))
+        output_dir = Path(f"{self.pdf_dir}-bib4llm")
+        self.assertTrue((output_dir / "subfolder" / "paper2" / "paper2.md").exists())
+        self.assertFalse((output_dir / "paper1").exists())
+        
+        result = self._process()
+        self.assertEqual((result["pdf_processed"], result["pdf_skipped"]), (1, 1))
+
+    def test_verify(self):
+        """Test that verify detects modified output of PDFs in the directory and marks them for conversion."""
+        self._process()
+        second_md = Path(f"{self.pdf_dir}-bib4llm") / "subfolder" / "paper2" / "paper2.md"
+        stat = second_md.stat()
+        second_md.write_text(second_md.read_text(encoding="utf-8").upper(), encoding="utf-8")
+        os.utime(second_md, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        
+        processor = DirectoryProcessor(self.pdf_dir, dry_run=True, quiet=True, store=self.store)
+        problems = processor.verify(invalidate=False)
+        self.assertEqual(
+            problems,
+            {"subfolder/paper2": ["modified: paper2.md"]},
+            f"Verify should report the modified markdown file, got {problems}",
+        )
+        result = self._process()
+        self.assertEqual(
+            (result["pdf_processed"], result["pdf_skipped"]), (0, 2),
+            "Verify without invalidation should not reset the PDF",
+        )
+        
+        processor.verify()
+        result = self._process()
+        self.assertEqual(
+            (result["pdf_processed"], result["pdf_skipped"]), (1, 1),
+            "PDFs that failed verification should be converted again",
+        )
+        self.assertEqual(processor.verify(), {})
+
+    def test_stale_pdfs_are_streamed(self):
+        """Test that stale PDFs are scheduled while other PDFs are still being checked."""
+        self._process()
+        self._write_pdf(self.first_pdf, "First paper (revised)")
+        
+        original_needs_processing = DirectoryProcessor._needs_processing
+        scheduled = threading.Event()
+        checks_waited = []
+        def needs_processing(processor, key, paths, paranoid=False):
+            if paths[0] == self.second_pdf:
+                # Only finishes once the first PDF was handed to the scheduler
+                checks_waited.append(scheduled.wait(timeout=30))
+            return original_needs_processing(processor, key, paths, paranoid)
+        
+        scheduled_keys = []
+        def run_scheduled(processor, tasks, worker, handle_result, num_processes, desc, unit):
+            for key, _, _ in tasks:
+                scheduled_keys.append(key)
+                scheduled.set()
+        
+        with mock.patch.object(
+            DirectoryProcessor, "_needs_processing", autospec=True, side_effect=needs_processing
+        ), mock.patch.object(DirectoryProcessor, "_run_scheduled", autospec=True, side_effect=run_scheduled):
+            result = DirectoryProcessor(self.pdf_dir, store=self.store).process_directory(num_processes=2)
+        self.assertEqual(checks_waited, [True], "The first stale PDF should be scheduled before all checks finish")
+        self.assertEqual(scheduled_keys, ["paper1"])
+        self.assertEqual(result["pdf_skipped"], 1)
+
+
 if __name__ == "__main__":
     unittest.main() 
\ No newline at end of file
@@ -5,10 +5,31 @@ import tempfile
 import shutil
 import os
 import sqlite3
+import threading
 from pathlib import Path
 import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from unittest import mock
 
-from bib4llm.process_bibliography import BibliographyProcessor, ProcessingResult
+import pymupdf
+
+from bib4llm import process_bibliography
+from bib4llm.fingerprint import FileHasher
+from bib4llm.schedule import Estimate
+from bib4llm.process_bibliography import (
+    BibliographyProcessor, ChangeScan, ProcessingResult, standalone_process_entry
+)
+from bib4llm.workers import WorkerDied
+
+
+class ThreadWorkerPool(ThreadPoolExecutor):
+    """WorkerPool running the tasks in threads of the test process, so that workers can be mocked."""
+
+    def __init__(self, max_workers=None, limits=None):
+        super().__init__(max_workers)
+
+    def submit(self, fn, *args, memory=0):
+        return super().submit(fn, *args)
 
 
 class TestProcessingResult(unittest.TestCase):
@@ -260,5 +281,375 @@ class TestBibliographyProcessor(unittest.TestCase):
                 )
 
 
+class TestChangeDetection(unittest.TestCase):
+    """Test the detection of entries that need reprocessing."""
+
+    def setUp(self):
+        """Set up the test environment."""
+        # Set up a null handler for logging instead of disabling it
+        self.root_logger = logging.getLogger()
+        self.old_handlers = self.root_logger.handlers.copy()
+        self.root_logger.handlers.clear()
+        self.null_handler = logging.NullHandler()
+        self.root_logger.addHandler(self.null_handler)
+        
+        # Create a temporary directory
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        
+        # Create a text attachment, which is converted without invoking MuPDF
+        self.attachment = Path(self.temp_dir) / "notes.txt"
+        self.attachment.write_text("Some notes", encoding="utf-8")
+        
+        # Create a BibTeX file referencing the attachment
+        self.bib_file = Path(self.temp_dir) / "test.bib"
+        self.bib_file.write_text(f"""@article{{Test2023,
+  title = {{Test Article}},
+  file = {{{self.attachment}}}
+}}
+""", encoding="utf-8")
+
+    def tearDown(self):
+        """Clean up after the test."""
+        # Restore original logging handlers
+        self.root_logger.removeHandler(self.null_handler)
+        for handler in self.old_handlers:
+            self.root_logger.addHandler(handler)
+
+    def _count_hashed_files(self, hasher=None, **kwargs):
+        """Run process_all and return the number of attachments hashed in the parent process."""
+        with BibliographyProcessor(self.bib_file, quiet=True, hasher=hasher) as processor:
+            with mock.patch.object(
+                FileHasher,
+                "hash_file",
+                autospec=True,
+                side_effect=FileHasher.hash_file,
+            ) as hash_mock:
+                processor.process_all(num_processes=1, **kwargs)
+            return hash_mock.call_count
+
+    def _processed_keys(self, hasher=None, **kwargs):
+        """Run process_all with worker threads instead of processes and return the converted citation keys."""
+        with mock.patch(
+            "bib4llm.process_bibliography.WorkerPool", ThreadWorkerPool
+        ), mock.patch(
+            "bib4llm.process_bibliography.standalone_process_entry",
+            side_effect=standalone_process_entry,
+        ) as worker_mock:
+            with BibliographyProcessor(self.bib_file, quiet=True, hasher=hasher) as processor:
+                processor.process_all(**{"num_processes": 1, **kwargs})
+        return sorted(call.args[0][0]["ID"] for call in worker_mock.call_args_list)
+
+    def test_unchanged_attachment_is_not_hashed(self):
+        """Test that attachments with an unchanged stat signature are not read."""
+        self._count_hashed_files()
+        self.assertEqual(
+            self._count_hashed_files(),
+            0,
+            "Unchanged attachment should not be hashed on a no-op run",
+        )
+
+    def test_modified_attachment_is_hashed(self):
+        """Test that a changed mtime causes the attachment to be hashed again."""
+        self._count_hashed_files()
+        stat = self.attachment.stat()
+        os.utime(self.attachment, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.assertEqual(
+            self._count_hashed_files(),
+            1,
+            "Attachment with a changed mtime should be hashed",
+        )
+
+    def test_paranoid_hashes_unchanged_attachment(self):
+        """Test that paranoid mode hashes attachments even if their stat signature is unchanged."""
+        self._count_hashed_files()
+        self.assertEqual(
+            self._count_hashed_files(paranoid=True),
+            1,
+            "Paranoid mode should hash every attachment",
+        )
+
+    def test_hash_algorithm_is_recorded(self):
+        """Test that the hash algorithm is stored and that switching algorithms invalidates entries."""
+        self._count_hashed_files()
+        with sqlite3.connect(Path(self.temp_dir) / "test-bib4llm" / "processed_files.db") as conn:
+            algorithm = conn.execute(
+                "SELECT hash_algorithm FROM processed_items WHERE citation_key = 'Test2023'"
+            ).fetchone()[0]
+        self.assertEqual(algorithm, "sha256", f"Expected 'sha256' to be recorded, got '{algorithm}'")
+        
+        processed = self._processed_keys(hasher=FileHasher("blake2b"))
+        self.assertEqual(
+            processed,
+            ["Test2023"],
+            f"Switching the hash algorithm should reprocess the entry, got {processed}",
+        )
+
+    def test_output_manifest(self):
+        """Test that outputs are checked against the manifest recorded at conversion time."""
+        self.assertEqual(self._processed_keys(), ["Test2023"], "First run should convert the entry")
+        self.assertEqual(self._processed_keys(), [], "Unchanged outputs should not trigger a conversion")
+        
+        # Touching an output file is detected by the stat-only check
+        md_file = Path(self.temp_dir) / "test-bib4llm" / "Test2023" / "Test2023.md"
+        stat = md_file.stat()
+        os.utime(md_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.assertEqual(self._processed_keys(), ["Test2023"], "Modified output should trigger a conversion")
+        
+        # Deleting an output file is detected as well
+        md_file.unlink()
+        self.assertEqual(self._processed_keys(), ["Test2023"], "Missing output should trigger a conversion")
+
+    def test_parallel_change_detection(self):
+        """Test that checking many entries in parallel threads finds exactly the changed ones."""
+        entries = []
+        for i in range(8):
+            attachment = Path(self.temp_dir) / f"notes{i}.txt"
+            attachment.write_text(f"Notes {i}", encoding="utf-8")
+            entries.append(f"@article{{Test{i},\n  file = {{{attachment}}}\n}}\n")
+        self.bib_file.write_text("\n".join(entries), encoding="utf-8")
+        
+        self.assertEqual(len(self._processed_keys(num_processes=4)), 8, "First run should convert all entries")
+        (Path(self.temp_dir) / "notes5.txt").write_text("Changed notes", encoding="utf-8")
+        self.assertEqual(
+            self._processed_keys(num_processes=4),
+            ["Test5"],
+            "Only the entry with the changed attachment should be converted",
+        )
+
+    def test_stale_entries_are_streamed(self):
+        """Test that stale entries are yielded lazily while the scan is still running."""
+        self._processed_keys()
+        entries = [{"ID": "Test2023", "file": str(self.attachment)}, {"ID": "New2024", "file": str(self.attachment)}]
+        with BibliographyProcessor(self.bib_file, quiet=True) as processor:
+            scan = ChangeScan()
+            stale = processor._find_stale_entries(iter(entries), scan, num_threads=2)
+            self.assertEqual(
+                [entry["ID"] for entry in stale],
+                ["New2024"],
+                "Only the entry without recorded state should be stale",
+            )
+            
+            scan = ChangeScan()
+            stale = processor._find_stale_entries(iter(entries), scan, force=True)
+            self.assertEqual(next(stale)["ID"], "Test2023", "Forced entries should be yielded in order")
+            self.assertEqual(scan.duration, 0.0, "Scan statistics should be final only once the scan is exhausted")
+            list(stale)
+            self.assertGreater(scan.duration, 0.0, "Scan duration should be recorded when the scan is exhausted")
+
+    def test_entries_are_submitted_while_scanning(self):
+        """Test that entries are submitted before the change detection has finished, longest first within windows."""
+        submitted = []
+        preflight_threads = set()
+        
+        class RecordingPool(ThreadWorkerPool):
+            def submit(self, fn, *args, memory=0):
+                if fn is process_bibliography.standalone_process_measured:
+                    submitted.append(args[1])
+                return super().submit(fn, *args, memory=memory)
+        
+        scanned = []
+        def tasks():
+            for key, cost in [("A", 1.0), ("B", 2.0), ("C", 3.0), ("D", 1.0), ("E", 5.0), ("F", 4.0)]:
+                scanned.append((key, len(submitted)))
+                yield key, [Path(f"{cost}.txt")], cost
+        
+        def worker(cost):
+            return ProcessingResult(citation_key="", file_hashes={}, dir_hash="", success=False)
+        
+        with mock.patch(
+            "bib4llm.process_bibliography.WorkerPool", RecordingPool
+        ), mock.patch(
+            "bib4llm.process_bibliography.estimate",
+            side_effect=lambda paths, past_peak=None: (
+                preflight_threads.add(threading.current_thread()) or Estimate(float(paths[0].stem), 0)
+            ),
+        ) as estimate_mock, BibliographyProcessor(self.bib_file, quiet=True) as processor:
+            processor._run_scheduled(tasks(), worker, lambda key, result: None, 2, desc="Test", unit="entry")
+        
+        self.assertEqual(submitted, [2.0, 1.0, 5.0, 4.0, 3.0, 1.0], "Each window should be submitted longest first")
+        self.assertEqual(estimate_mock.call_count, 6)
+        self.assertEqual(
+            preflight_threads, {threading.current_thread()}, "PDFs should only be opened in the calling thread"
+        )
+        self.assertEqual(
+            scanned,
+            [("A", 0), ("B", 0), ("C", 2), ("D", 2), ("E", 2), ("F", 2)],
+            "Entries of the first window should be submitted before the scan continues",
+        )
+
+    def test_pdfs_converted_in_advance_are_cache_misses(self):
+        """Test that PDFs converted by separate tasks of their entry count as cache misses."""
+        attachments = []
+        for name in ("first", "second"):
+            doc = pymupdf.open()
+            doc.new_page().insert_text((72, 72), f"The {name} PDF")
+            doc.save(Path(self.temp_dir) / f"{name}.pdf")
+            doc.close()
+            attachments.append(str(Path(self.temp_dir) / f"{name}.pdf"))
+        self.bib_file.write_text(f"@article{{Test2023,\n  file = {{{';'.join(attachments)}}}\n}}\n", encoding="utf-8")
+        
+        def run():
+            with mock.patch(
+                "bib4llm.process_bibliography.WorkerPool", ThreadWorkerPool
+            ), mock.patch(
+                "bib4llm.process_bibliography.add_conversions",
+                side_effect=process_bibliography.add_conversions,
+            ) as add_mock:
+                with BibliographyProcessor(self.bib_file, quiet=True) as processor:
+                    processor.process_all(num_processes=2, force=True)
+            result = add_mock.call_args.args[0]
+            return result.cache_hits, result.cache_misses
+        
+        self.assertEqual(run(), (0, 2), "PDFs converted in this run should be cache misses")
+        self.assertEqual(run(), (2, 0), "PDFs converted in an earlier run should be cache hits")
+
+    def test_entry_is_submitted_after_its_conversions(self):
+        """Test that the task of an entry is only submitted once the conversions done in advance are done."""
+        submitted = []
+        
+        class RecordingPool(ThreadWorkerPool):
+            def submit(self, fn, *args, memory=0):
+                submitted.append(args[1])
+                return super().submit(fn, *args, memory=memory)
+        
+        def worker(key):
+            return ProcessingResult(citation_key=key, file_hashes={}, dir_hash="", success=True)
+        
+        parts = [Future(), Future()]
+        with RecordingPool(1) as pool:
+            future = process_bibliography.submit_batch_after(pool, parts, worker, ["entry"])
+            parts[0].set_result((0, False))
+            self.assertEqual(submitted, [], "The entry should not be submitted while a conversion is pending")
+            parts[1].set_exception(WorkerDied("Worker process was killed"))
+            self.assertEqual(future.result(timeout=10).citation_key, "entry")
+            self.assertEqual(submitted, ["entry"])
+            
+            parts = [Future()]
+            future = process_bibliography.submit_batch_after(pool, parts, worker, ["cancelled"])
+            self.assertTrue(future.cancel())
+            parts[0].set_result((0, False))
+        self.assertEqual(submitted, ["entry"], "A cancelled entry should not be submitted")
+
+    def test_verify(self):
+        """Test that verify detects content changes that the stat-only check misses."""
+        self._processed_keys()
+        md_file = Path(self.temp_dir) / "test-bib4llm" / "Test2023" / "Test2023.md"
+        stat = md_file.stat()
+        md_file.write_text(md_file.read_text(encoding="utf-8").upper(), encoding="utf-8")
+        os.utime(md_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(self._processed_keys(), [], "Stat-only check should not notice the change")
+        
+        processor = BibliographyProcessor(self.bib_file, dry_run=True, quiet=True)
+        problems = processor.verify(invalidate=False)
+        self.assertEqual(
+            problems,
+            {"Test2023": ["modified: Test2023.md"]},
+            f"Verify should report the modified markdown file, got {problems}",
+        )
+        self.assertEqual(self._processed_keys(), [], "Verify without invalidation should not reset the entry")
+        
+        processor.verify()
+        self.assertEqual(
+            self._processed_keys(),
+            ["Test2023"],
+            "Entries that failed verification should be converted again",
+        )
+
+    def test_verify_reports_duplicates(self):
+        """Test that verify lists attachments with the same content at different paths."""
+        copy = Path(self.temp_dir) / "copy of notes.txt"
+        shutil.copy2(self.attachment, copy)
+        self.bib_file.write_text(
+            f"@article{{Test2023,\n  file = {{{self.attachment}}}\n}}\n"
+            f"@article{{Copy2023,\n  file = {{{copy}}}\n}}\n",
+            encoding="utf-8",
+        )
+        self._processed_keys()
+        
+        processor = BibliographyProcessor(self.bib_file, dry_run=True, quiet=True)
+        with self.assertLogs("bib4llm.process_bibliography", level="INFO") as logs:
+            self.assertEqual(processor.verify(invalidate=False), {})
+        self.assertIn(
+            f"INFO:bib4llm.process_bibliography:Identical attachments of Copy2023, Test2023: {copy}, {self.attachment}",
+            logs.output,
+        )
+        self.assertTrue(any("1 attachments stored at several paths" in line for line in logs.output))
+
+
+
+class TestResumableRuns(unittest.TestCase):
+    """Test that interrupted runs resume with the entries that were not finished."""
+
+    def setUp(self):
+        """Set up the test environment."""
+        # Set up a null handler for logging instead of disabling it
+        self.root_logger = logging.getLogger()
+        self.old_handlers = self.root_logger.handlers.copy()
+        self.root_logger.handlers.clear()
+        self.null_handler = logging.NullHandler()
+        self.root_logger.addHandler(self.null_handler)
+        
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.keys = ["First2023", "Second2023", "Third2023", "Fourth2023"]
+        entries = []
+        for key in self.keys:
+            attachment = self.temp_dir / f"{key}.txt"
+            attachment.write_text(f"Notes on {key}", encoding="utf-8")
+            entries.append(f"@article{{{key},\n  file = {{{attachment}}}\n}}\n")
+        self.bib_file = self.temp_dir / "test.bib"
+        self.bib_file.write_text("\n".join(entries), encoding="utf-8")
+
+    def tearDown(self):
+        """Clean up after the test."""
+        # Restore original logging handlers
+        self.root_logger.removeHandler(self.null_handler)
+        for handler in self.old_handlers:
+            self.root_logger.addHandler(handler)
+
+    def _run(self, failing_key: str = None, error: BaseException = None):
+        """Run process_all with worker threads, failing the given entry, and return the processed keys."""
+        def worker(args):
+            if args[0]["ID"] == failing_key:
+                raise error
+            return standalone_process_entry(args)
+        
+        # Entries are processed one by one, the cheapest (First2023, Third2023) last
+        with mock.patch(
+            "bib4llm.process_bibliography.WorkerPool", ThreadWorkerPool
+        ), mock.patch(
+            "bib4llm.process_bibliography.standalone_process_entry", side_effect=worker
+        ) as worker_mock, mock.patch("bib4llm.schedule.BATCH_COST", 0):
+            with BibliographyProcessor(self.bib_file, quiet=True) as processor:
+                processor.process_all(num_processes=1)
+        return sorted(call.args[0][0]["ID"] for call in worker_mock.call_args_list)
+
+    def _recorded_keys(self):
+        with BibliographyProcessor(self.bib_file, quiet=True) as processor:
+            return sorted(processor.state.items)
+
+    def _failures(self):
+        with BibliographyProcessor(self.bib_file, quiet=True) as processor:
+            return processor.state.failures
+
+    def test_crashed_worker(self):
+        """Test that a crashing worker doesn't lose the results of the other entries."""
+        self._run("Third2023", WorkerDied("Worker process was killed by SIGSEGV"))
+        self.assertEqual(self._recorded_keys(), ["First2023", "Fourth2023", "Second2023"])
+        self.assertEqual(self._failures(), {"Third2023": "Worker process was killed by SIGSEGV"})
+        self.assertEqual(self._run(), ["Third2023"])
+        self.assertEqual(self._failures(), {})
+
+    def test_interrupted_run(self):
+        """Test that the entries completed before an interruption are recorded."""
+        with self.assertRaises(KeyboardInterrupt):
+            self._run("Third2023", KeyboardInterrupt())
+        recorded = self._recorded_keys()
+        self.assertIn("First2023", recorded)
+        self.assertNotIn("Third2023", recorded)
+        self.assertEqual(self._run(), sorted(set(self.keys) - set(recorded)))
+
+
 if __name__ == "__main__":
     unittest.main() 
\ No newline at end of file
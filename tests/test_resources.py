@@ -0,0 +1,111 @@
+"""Test the detection of the CPUs and memory available to the worker processes."""
+
+import unittest
+import tempfile
+import shutil
+import logging
+from pathlib import Path
+from unittest import mock
+
+from bib4llm import resources
+from bib4llm.resources import (
+    AUTO_PROCESSES, available_cpus, cgroup_cpu_limit, cgroup_memory_limit, cgroup_memory_max, default_memory_budget,
+    default_processes, parse_processes, total_memory
+)
+
+
+class TestResources(unittest.TestCase):
+    """Test cgroup limits, CPU affinity and the parsing of --processes."""
+
+    def setUp(self):
+        """Set up the test environment."""
+        # Set up a null handler for logging instead of disabling it
+        self.root_logger = logging.getLogger()
+        self.old_handlers = self.root_logger.handlers.copy()
+        self.root_logger.handlers.clear()
+        self.null_handler = logging.NullHandler()
+        self.root_logger.addHandler(self.null_handler)
+
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.cgroup_root = self.temp_dir / "cgroup"
+        self.proc_cgroup = self.temp_dir / "proc_cgroup"
+        for name, value in (("CGROUP_ROOT", self.cgroup_root), ("PROC_CGROUP", self.proc_cgroup)):
+            patcher = mock.patch.object(resources, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Clean up after the test."""
+        # Restore original logging handlers
+        self.root_logger.removeHandler(self.null_handler)
+        for handler in self.old_handlers:
+            self.root_logger.addHandler(handler)
+
+    def _write(self, relative_path: str, content: str):
+        path = self.cgroup_root / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+    def test_cgroup_v2(self):
+        """Test the CPU quota and memory limit of a cgroup v2 container."""
+        self.proc_cgroup.write_text("0::/kubepods/pod1\n")
+        self._write("kubepods/pod1/cpu.max", "max 100000\n")
+        # The quota of a parent cgroup applies as well
+        self._write("kubepods/cpu.max", "250000 100000\n")
+        self._write("kubepods/pod1/memory.max", str(4 * 1024**3))
+        self._write("kubepods/pod1/memory.current", str(1024**3))
+
+        self.assertEqual(cgroup_cpu_limit(), 2.5)
+        self.assertEqual(cgroup_memory_limit(), 3 * 1024**3)
+        self.assertEqual(cgroup_memory_max(), 4 * 1024**3)
+        with mock.patch("os.sched_getaffinity", return_value=set(range(64)), create=True):
+            self.assertEqual(available_cpus(), 3)
+
+    def test_cgroup_v1(self):
+        """Test the CPU quota and memory limit of a cgroup v1 container."""
+        self.proc_cgroup.write_text("4:cpu,cpuacct:/\n3:memory:/\n")
+        self._write("cpu,cpuacct/cpu.cfs_quota_us", "400000\n")
+        self._write("cpu,cpuacct/cpu.cfs_period_us", "100000\n")
+        self._write("memory/memory.limit_in_bytes", "9223372036854771712\n")
+
+        self.assertEqual(cgroup_cpu_limit(), 4.0)
+        self.assertIsNone(cgroup_memory_limit())
+        self.assertIsNone(cgroup_memory_max())
+
+    def test_affinity_and_memory(self):
+        """Test that the default number of processes follows the affinity mask and the available memory."""
+        self.proc_cgroup.write_text("0::/\n")
+        with mock.patch("os.sched_getaffinity", return_value={0, 1}, create=True):
+            self.assertEqual(available_cpus(), 2)
+            with mock.patch.object(resources, "available_memory", return_value=100 * 1024**3):
+                self.assertEqual(default_processes(), 2)
+            with mock.patch.object(resources, "available_memory", return_value=resources.MEMORY_PER_WORKER // 2):
+                self.assertEqual(default_processes(), 1)
+
+    def test_memory_budget(self):
+        """Test that the default memory budget follows the total memory, not the memory in use."""
+        meminfo = self.temp_dir / "meminfo"
+        meminfo.write_text(f"MemTotal: {16 * 1024**2} kB\nMemFree: 1024 kB\nMemAvailable: {1024**2} kB\n")
+        self.proc_cgroup.write_text("0::/pod\n")
+        with mock.patch.object(resources, "PROC_MEMINFO", meminfo):
+            self.assertEqual(total_memory(), 16 * 1024**3)
+            self.assertEqual(default_memory_budget(), int(16 * 1024**3 * resources.DEFAULT_MEMORY_SHARE))
+
+            # A cgroup limit bounds the budget, regardless of its current usage
+            self._write("pod/memory.max", str(8 * 1024**3))
+            self._write("pod/memory.current", str(7 * 1024**3))
+            self.assertEqual(total_memory(), 8 * 1024**3)
+            self.assertEqual(default_memory_budget(), int(8 * 1024**3 * resources.DEFAULT_MEMORY_SHARE))
+
+    def test_parse_processes(self):
+        """Test parsing the value of --processes."""
+        self.assertEqual(parse_processes("4"), 4)
+        self.assertEqual(parse_processes("Auto"), AUTO_PROCESSES)
+        for value in ("0", "-1", "many"):
+            with self.assertRaises(ValueError):
+                parse_processes(value)
+
+
+if __name__ == "__main__":
+    unittest.main()
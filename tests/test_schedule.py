@@ -0,0 +1,147 @@
+"""Test the cost-aware scheduling of conversion tasks."""
+
+import unittest
+import tempfile
+import shutil
+import logging
+from pathlib import Path
+from unittest import mock
+
+import pymupdf
+
+from bib4llm import schedule
+from bib4llm.schedule import Calibration, estimate, estimate_makespan, plan_batches, windows
+
+
+class TestSchedule(unittest.TestCase):
+    """Test cost estimates, batching and makespan estimates."""
+
+    def setUp(self):
+        """Set up the test environment."""
+        # Set up a null handler for logging instead of disabling it
+        self.root_logger = logging.getLogger()
+        self.old_handlers = self.root_logger.handlers.copy()
+        self.root_logger.handlers.clear()
+        self.null_handler = logging.NullHandler()
+        self.root_logger.addHandler(self.null_handler)
+
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    def tearDown(self):
+        """Clean up after the test."""
+        # Restore original logging handlers
+        self.root_logger.removeHandler(self.null_handler)
+        for handler in self.old_handlers:
+            self.root_logger.addHandler(handler)
+
+    def _write_pdf(self, name: str, num_pages: int) -> Path:
+        path = self.temp_dir / name
+        doc = pymupdf.open()
+        for i in range(num_pages):
+            doc.new_page().insert_text((72, 72), f"Page {i + 1}")
+        doc.save(path)
+        doc.close()
+        return path
+
+    def test_estimate_cost(self):
+        """Test that the estimated cost grows with the number of pages."""
+        paper = self._write_pdf("paper.pdf", 10)
+        book = self._write_pdf("book.pdf", 300)
+        notes = self.temp_dir / "notes.txt"
+        notes.write_text("Some notes")
+
+        def cost(paths):
+            return estimate(paths).cost
+
+        self.assertAlmostEqual(cost([notes]), schedule.TASK_OVERHEAD, places=3)
+        self.assertGreater(cost([book]), 20 * cost([paper]) / 2)
+        self.assertAlmostEqual(cost([paper, notes]), cost([paper]) + cost([notes]) - schedule.TASK_OVERHEAD)
+        # Missing files are left to the conversion to report
+        self.assertEqual(cost([self.temp_dir / "missing.pdf"]), schedule.TASK_OVERHEAD)
+
+    def test_estimate_memory(self):
+        """Test that the memory estimate grows with the pages and is replaced by a measured peak."""
+        paper = self._write_pdf("paper.pdf", 10)
+        book = self._write_pdf("book.pdf", 300)
+
+        self.assertGreaterEqual(estimate([paper]).memory, schedule.BASE_MEMORY)
+        self.assertGreater(estimate([book]).memory, estimate([paper]).memory)
+        # Attachments are converted one after another
+        self.assertEqual(estimate([paper, book]).memory, estimate([book]).memory)
+        self.assertEqual(estimate([book], past_peak=123).memory, 123)
+
+    def test_longest_first(self):
+        """Test that expensive entries get their own task and are submitted first."""
+        items = ["small1", "book", "small2", "paper", "small3"]
+        costs = [0.1, 30.0, 0.1, 2.0, 0.1]
+        batches = plan_batches(items, costs, num_workers=1)
+        self.assertEqual([batch.items for batch in batches], [["book"], ["paper"], ["small1", "small2", "small3"]])
+        self.assertAlmostEqual(batches[-1].cost, 0.3)
+
+        batches = plan_batches(items, costs, num_workers=1, memories=[10, 500, 30, 200, 20])
+        self.assertEqual([batch.memory for batch in batches], [500, 200, 30])
+
+    def test_batches_are_limited(self):
+        """Test that small entries are spread over enough batches to keep all workers busy."""
+        items = list(range(100))
+        batches = plan_batches(items, [0.1] * 100, num_workers=4)
+        self.assertEqual(sorted(item for batch in batches for item in batch.items), items)
+        self.assertGreaterEqual(len(batches), 3 * 4)
+        self.assertTrue(all(len(batch.items) <= schedule.MAX_BATCH_SIZE for batch in batches))
+
+        batches = plan_batches(items, [0.01] * 100, num_workers=1)
+        self.assertTrue(all(len(batch.items) <= schedule.MAX_BATCH_SIZE for batch in batches))
+
+    def test_windows(self):
+        """Test that windows grow up to their maximum size and consume items only when collected."""
+        self.assertEqual(
+            [len(window) for window in windows(range(40), first=2, size=8)],
+            [2, 4, 8, 8, 8, 8, 2],
+        )
+        self.assertEqual([item for window in windows(range(40), 2, 8) for item in window], list(range(40)))
+        self.assertEqual(list(windows([], 2)), [])
+
+        consumed = []
+        def items():
+            for i in range(10):
+                consumed.append(i)
+                yield i
+        self.assertEqual(next(windows(items(), first=3)), [0, 1, 2])
+        self.assertEqual(consumed, [0, 1, 2], "Only the items of the first window should be consumed")
+
+    def test_estimate_makespan(self):
+        """Test that a large task submitted last decides the makespan."""
+        costs = [1.0] * 8 + [8.0]
+        self.assertEqual(estimate_makespan(costs, num_workers=2), 12.0)
+        self.assertEqual(estimate_makespan(sorted(costs, reverse=True), num_workers=2), 8.0)
+        self.assertEqual(estimate_makespan([], num_workers=2), 0.0)
+
+    def _calibrate(self, max_workers: int, throughput) -> Calibration:
+        """Run a calibration where each step takes one second and completes throughput(workers) work."""
+        clock = [0.0]
+        with mock.patch("bib4llm.schedule.time.monotonic", side_effect=lambda: clock[0]):
+            calibration = Calibration(max_workers)
+            while not calibration.done:
+                workers = calibration.workers
+                clock[0] += schedule.CALIBRATION_WINDOW
+                for _ in range(workers - 1):
+                    self.assertEqual(calibration.observe(0.0), workers)
+                calibration.observe(throughput(workers) * schedule.CALIBRATION_WINDOW)
+        return calibration
+
+    def test_calibration(self):
+        """Test that the calibration settles on the number of workers with the best throughput."""
+        # Throughput grows up to 4 workers, e.g. because of a CPU quota
+        calibration = self._calibrate(16, lambda workers: min(workers, 4))
+        self.assertEqual(calibration.candidates, [1, 2, 4, 8, 16])
+        self.assertEqual(calibration.workers, 4)
+
+        # Throughput drops with more workers, e.g. because of memory pressure
+        self.assertEqual(self._calibrate(6, lambda workers: {1: 1, 2: 3, 4: 2}.get(workers, 0)).workers, 2)
+        self.assertEqual(self._calibrate(6, lambda workers: workers).workers, 6)
+        self.assertTrue(Calibration(1).done)
+
+
+if __name__ == "__main__":
+    unittest.main()
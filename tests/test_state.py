@@ -0,0 +1,177 @@
+"""Test the state database."""
+
+import unittest
+import tempfile
+import shutil
+import sqlite3
+import logging
+import time
+from pathlib import Path
+
+from bib4llm.state import ItemState, StateDB
+
+
+class TestStateDB(unittest.TestCase):
+    """Test loading and writing the state database in bulk."""
+
+    def setUp(self):
+        """Set up the test environment."""
+        # Set up a null handler for logging instead of disabling it
+        self.root_logger = logging.getLogger()
+        self.old_handlers = self.root_logger.handlers.copy()
+        self.root_logger.handlers.clear()
+        self.null_handler = logging.NullHandler()
+        self.root_logger.addHandler(self.null_handler)
+
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.db_path = self.temp_dir / "processed_files.db"
+
+    def tearDown(self):
+        """Clean up after the test."""
+        # Restore original logging handlers
+        self.root_logger.removeHandler(self.null_handler)
+        for handler in self.old_handlers:
+            self.root_logger.addHandler(handler)
+
+    def _item(self, i: int, manifest=None) -> ItemState:
+        return ItemState(
+            file_hashes={f"/papers/{i}.pdf": f"hash{i}"},
+            dir_hash=f"dir{i}",
+            file_stats={f"/papers/{i}.pdf": [i, i, i, 1]},
+            hash_algorithm="sha256",
+            manifest=manifest
+        )
+
+    def test_record_and_reload(self):
+        """Test that recorded entries and manifests are loaded again."""
+        with StateDB(self.db_path) as state:
+            state.record({
+                "A": self._item(1, manifest={"A.md": [10, 20, "md"], "A.pdf-0-0.png": [30, 40, "png"]}),
+                "B": ItemState(dir_hash="dir2", manifest={}, peak_memory=300 * 1024**2),
+            })
+            state.record({"A": self._item(3, manifest={"A.md": [11, 21, "md2"]})})
+            state.record_manifest("B", {"B.md": [1, 2, "b"]})
+
+        with StateDB(self.db_path) as state:
+            self.assertEqual(set(state.items), {"A", "B"})
+            self.assertEqual(state.get("A").file_hashes, {"/papers/3.pdf": "hash3"})
+            self.assertEqual(state.get("A").manifest, {"A.md": [11, 21, "md2"]})
+            self.assertEqual(state.get("B").manifest, {"B.md": [1, 2, "b"]})
+            self.assertEqual(state.get("B").dir_hash, "dir2")
+            self.assertEqual(state.get("B").peak_memory, 300 * 1024**2)
+            self.assertIsNone(state.get("C"))
+
+            state.remove(["A"])
+        with StateDB(self.db_path) as state:
+            self.assertEqual(set(state.items), {"B"})
+
+    def test_wal_mode(self):
+        """Test that the database runs in WAL mode."""
+        with StateDB(self.db_path) as state:
+            self.assertEqual(state.conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+    def test_legacy_schema_is_migrated(self):
+        """Test that databases without the newer columns can be opened."""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE processed_items (
+                    citation_key TEXT PRIMARY KEY,
+                    file_hashes TEXT,
+                    last_processed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    dir_hash TEXT
+                )
+            """)
+            conn.execute("INSERT INTO processed_items (citation_key, file_hashes, dir_hash) VALUES ('A', '{}', 'x')")
+        conn.close()
+
+        with StateDB(self.db_path) as state:
+            item = state.get("A")
+            self.assertIsNone(item.hash_algorithm)
+            self.assertIsNone(item.manifest)
+            self.assertIsNone(item.peak_memory)
+            self.assertEqual(item.file_stats, {})
+
+    def test_json_attachments_are_migrated(self):
+        """Test that attachments stored as JSON by older versions are moved into the attachments table."""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE processed_items (
+                    citation_key TEXT PRIMARY KEY,
+                    file_hashes TEXT,
+                    last_processed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    dir_hash TEXT,
+                    file_stats TEXT,
+                    hash_algorithm TEXT
+                )
+            """)
+            conn.execute(
+                "INSERT INTO processed_items (citation_key, file_hashes, dir_hash, file_stats, hash_algorithm) "
+                "VALUES ('A', '{\"/papers/a.pdf\": \"00ff\"}', 'x', '{\"/papers/a.pdf\": [1, 2, 3, 4]}', 'sha256')"
+            )
+        conn.close()
+
+        with StateDB(self.db_path) as state:
+            self.assertEqual(state.get("A").file_hashes, {"/papers/a.pdf": "00ff"})
+            self.assertEqual(state.get("A").file_stats, {"/papers/a.pdf": [1, 2, 3, 4]})
+            self.assertEqual(state.citation_keys_for_path("/papers/a.pdf"), ["A"])
+            row = state.conn.execute(
+                "SELECT hash, file_hashes FROM attachments JOIN processed_items USING (citation_key)"
+            ).fetchone()
+            self.assertEqual(row, (b"\x00\xff", None))
+
+    def test_attachment_lookups(self):
+        """Test finding the entries of an attachment and attachments with the same content."""
+        digest = "ab" * 32
+        with StateDB(self.db_path) as state:
+            state.record({
+                "A": ItemState(file_hashes={"/papers/a.pdf": digest, "/papers/s.pdf": "cd" * 32}),
+                "B": ItemState(file_hashes={"/papers/a.pdf": digest}),
+                "C": ItemState(file_hashes={"/copies/a.pdf": digest}, file_stats={"/copies/a.pdf": [1, 2, 3, 4]}),
+            })
+            self.assertEqual(state.citation_keys_for_path("/papers/a.pdf"), ["A", "B"])
+            self.assertEqual(state.citation_keys_for_path("/papers/missing.pdf"), [])
+            self.assertEqual(state.citation_keys_for_hash(digest), ["A", "B", "C"])
+            self.assertEqual(state.duplicate_attachments(), {digest: ["/copies/a.pdf", "/papers/a.pdf"]})
+
+            state.remove(["C"])
+            self.assertEqual(state.duplicate_attachments(), {})
+            self.assertEqual(state.citation_keys_for_hash(digest), ["A", "B"])
+            plan = " ".join(str(row) for row in state.conn.execute(
+                "EXPLAIN QUERY PLAN SELECT citation_key FROM attachments WHERE path = ?", ("/papers/a.pdf",)
+            ))
+            self.assertIn("attachments_path", plan)
+
+    def test_failures(self):
+        """Test that failures are recorded with their reason until the entry is converted."""
+        with StateDB(self.db_path) as state:
+            state.record({"A": self._item(1)})
+            state.record_failures({"A": "Timed out after 60s", "B": "Worker process was killed by SIGSEGV"})
+
+        with StateDB(self.db_path) as state:
+            self.assertEqual(state.failures, {"A": "Timed out after 60s", "B": "Worker process was killed by SIGSEGV"})
+            # A failed entry keeps its previous state
+            self.assertEqual(state.get("A").dir_hash, "dir1")
+            state.record({"A": self._item(2)})
+            state.remove(["B"])
+            self.assertEqual(state.failures, {})
+
+        with StateDB(self.db_path) as state:
+            self.assertEqual(state.failures, {})
+
+    def test_batched_writes(self):
+        """Test that many results are written quickly in one transaction."""
+        items = {f"Key{i}": self._item(i, manifest={f"Key{i}.md": [i, i, "md"]}) for i in range(10000)}
+        with StateDB(self.db_path) as state:
+            start = time.perf_counter()
+            state.record(items)
+            elapsed = time.perf_counter() - start
+        self.assertLess(elapsed, 5, f"Recording 10k entries took {elapsed:.2f}s")
+
+        with StateDB(self.db_path) as state:
+            self.assertEqual(len(state.items), 10000)
+            self.assertEqual(state.get("Key42").manifest, {"Key42.md": [42, 42, "md"]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,280 @@
+"""Test the conversion store."""
+
+import unittest
+import tempfile
+import shutil
+import os
+import logging
+from pathlib import Path
+from unittest import mock
+
+import pymupdf
+
+from bib4llm import store as store_module
+from bib4llm.convert import page_fingerprints
+from bib4llm.fingerprint import FileHasher
+from bib4llm.store import ConversionStore, convert_pdf, parse_size
+
+
+def _write_pdf(path: Path, text: str):
+    """Write a one-page PDF with some text and an embedded image."""
+    doc = pymupdf.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), text)
+    pixmap = pymupdf.Pixmap(pymupdf.csRGB, pymupdf.IRect(0, 0, 64, 64), False)
+    pixmap.set_rect(pixmap.irect, (200, 30, 30))
+    page.insert_image(pymupdf.Rect(72, 100, 272, 300), pixmap=pixmap)
+    doc.save(path)
+    doc.close()
+
+
+def _write_book(path: Path, num_pages: int, revised_page: int = None):
+    """Write a PDF with a heading, some text and an image on every page."""
+    doc = pymupdf.open()
+    for i in range(num_pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Chapter {i + 1}", fontsize=20)
+        page.insert_text((72, 110), f"Revised text of page {i + 1}" if i == revised_page else f"Text of page {i + 1}")
+        pixmap = pymupdf.Pixmap(pymupdf.csRGB, pymupdf.IRect(0, 0, 64, 64), False)
+        pixmap.set_rect(pixmap.irect, (20 * i % 256, 30, 30))
+        page.insert_image(pymupdf.Rect(72, 150, 272, 350), pixmap=pixmap)
+    doc.save(path)
+    doc.close()
+
+
+class TestConversionStore(unittest.TestCase):
+    """Test converting PDFs through the content-addressed store."""
+
+    def setUp(self):
+        """Set up the test environment."""
+        # Set up a null handler for logging instead of disabling it
+        self.root_logger = logging.getLogger()
+        self.old_handlers = self.root_logger.handlers.copy()
+        self.root_logger.handlers.clear()
+        self.null_handler = logging.NullHandler()
+        self.root_logger.addHandler(self.null_handler)
+
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.pdf = self.temp_dir / "paper.pdf"
+        _write_pdf(self.pdf, "Hello store")
+        # A copy of the same PDF under another name with spaces
+        self.duplicate = self.temp_dir / "paper copy 1.pdf"
+        shutil.copy2(self.pdf, self.duplicate)
+
+        self.store = ConversionStore(self.temp_dir / "store")
+        self.hasher = FileHasher()
+
+    def tearDown(self):
+        """Clean up after the test."""
+        # Restore original logging handlers
+        self.root_logger.removeHandler(self.null_handler)
+        for handler in self.old_handlers:
+            self.root_logger.addHandler(handler)
+
+    def _convert(self, pdf_path: Path, name: str, hasher: FileHasher = None):
+        output_dir = self.temp_dir / "output" / name
+        output_dir.mkdir(parents=True)
+        md_text, _, stored = convert_pdf(pdf_path, output_dir, name, self.store, hasher or self.hasher)
+        return output_dir, md_text, stored
+
+    def test_duplicates_are_converted_once(self):
+        """Test that identical PDFs are converted once and linked afterwards."""
+        with mock.patch.object(store_module, "pdf_to_markdown", wraps=store_module.pdf_to_markdown) as convert:
+            first_dir, first_md, first_stored = self._convert(self.pdf, "First2023")
+            second_dir, second_md, second_stored = self._convert(self.duplicate, "Second 2023")
+
+        self.assertEqual(convert.call_count, 1, "Identical PDFs should be converted only once")
+        self.assertFalse(first_stored, "The first conversion should not come from the store")
+        self.assertTrue(second_stored, "The duplicate should be taken from the store")
+        self.assertIn("Hello store", second_md)
+
+        first_images = sorted(p.name for p in first_dir.glob("*.png"))
+        second_images = sorted(p.name for p in second_dir.glob("*.png"))
+        self.assertTrue(first_images, "The test PDF should produce an image")
+        self.assertTrue(all(name.startswith("First2023.pdf-") for name in first_images), first_images)
+        self.assertTrue(all(name.startswith("Second-2023.pdf-") for name in second_images), second_images)
+
+        # Images are hard links to the store and referenced at their new location
+        self.assertEqual(os.stat(first_dir / first_images[0]).st_nlink, 3)
+        self.assertIn(f"{second_dir.as_posix()}/{second_images[0]}", second_md)
+        self.assertNotIn(str(self.store.root), second_md)
+        self.assertEqual((second_dir / "Second 2023.pdf").resolve(), self.duplicate.resolve())
+
+    def test_changed_content_is_converted(self):
+        """Test that a PDF with different content gets its own store entry."""
+        self._convert(self.pdf, "First2023")
+        _write_pdf(self.duplicate, "Different content")
+        _, md_text, stored = self._convert(self.duplicate, "Second2023")
+        self.assertFalse(stored, "Different content should be converted")
+        self.assertIn("Different content", md_text)
+
+    def test_sampled_hasher_uses_full_hash(self):
+        """Test that store keys are full content hashes even when change tracking samples files."""
+        self._convert(self.pdf, "First2023", hasher=FileHasher(sampled=True))
+        digest = FileHasher().hash_file(self.pdf)
+        self.assertTrue(self.store.entry_path("sha256", digest).exists())
+
+    def test_converter_signature_is_part_of_the_key(self):
+        """Test that conversions made by another converter version are not reused."""
+        self._convert(self.pdf, "First2023")
+        with mock.patch.object(store_module, "converter_signature", return_value="pymupdf4llm-99"):
+            _, _, stored = self._convert(self.duplicate, "Second2023")
+        self.assertFalse(stored, "A different converter signature should not hit the cache")
+
+    def test_evict_least_recently_used(self):
+        """Test that eviction removes the least recently used conversions first."""
+        _write_pdf(self.duplicate, "Different content")
+        self._convert(self.pdf, "First2023")
+        self._convert(self.duplicate, "Second2023")
+        digests = [FileHasher().hash_file(path) for path in (self.pdf, self.duplicate)]
+        entries = [self.store.entry_path("sha256", digest) for digest in digests]
+
+        # Make the first conversion the most recently used one
+        meta = entries[1] / store_module.META_FILE
+        os.utime(meta, ns=(meta.stat().st_atime_ns, meta.stat().st_mtime_ns - 10**9))
+        self._convert(self.pdf, "Third2023")
+
+        entry_size = sum(f.stat().st_size for f in entries[0].iterdir())
+        store = ConversionStore(self.store.root, max_size=entry_size)
+        removed, freed = store.evict()
+        self.assertEqual(removed, 1)
+        self.assertGreater(freed, 0)
+        self.assertTrue(entries[0].exists(), "The most recently used conversion should be kept")
+        self.assertFalse(entries[1].exists(), "The least recently used conversion should be evicted")
+        # Outputs materialized from an evicted conversion are not affected
+        self.assertTrue(list((self.temp_dir / "output" / "Second2023").glob("*.png")))
+
+        self.assertEqual(ConversionStore(self.store.root, max_size=None).evict(), (0, 0))
+
+    def test_split_conversion(self):
+        """Test that converting a PDF in page ranges gives the same output as converting it at once."""
+        book = self.temp_dir / "book.pdf"
+        _write_book(book, 7)
+        whole_dir, whole_md, _ = self._convert(book, "Whole2023")
+
+        self.store = ConversionStore(self.temp_dir / "split-store", split_pages=3)
+        self.assertEqual(self.store.page_ranges(book), [(0, 3), (3, 6), (6, 7)])
+        with mock.patch.object(store_module, "pdf_to_markdown", wraps=store_module.pdf_to_markdown) as convert:
+            split_dir, split_md, stored = self._convert(book, "Split2023")
+        self.assertFalse(stored)
+        self.assertEqual(convert.call_count, 3)
+
+        self.assertEqual(
+            split_md.replace(f"{split_dir.as_posix()}/Split2023", ""),
+            whole_md.replace(f"{whole_dir.as_posix()}/Whole2023", "")
+        )
+        self.assertIn("Text of page 7", split_md)
+        whole_images = sorted(p.name.replace("Whole2023", "") for p in whole_dir.glob("*.png"))
+        split_images = sorted(p.name.replace("Split2023", "") for p in split_dir.glob("*.png"))
+        self.assertEqual(len(split_images), 7)
+        self.assertEqual(split_images, whole_images)
+        for image in split_dir.glob("*.png"):
+            self.assertIn(f"{split_dir.as_posix()}/{image.name}", split_md)
+
+        # The parts are removed once they are stitched together
+        digest = FileHasher().hash_file(book)
+        self.assertFalse(self.store.part_path("sha256", digest, 0, 3).parent.exists())
+
+    def test_parts_are_reused(self):
+        """Test that page ranges converted by other workers are not converted again."""
+        book = self.temp_dir / "book.pdf"
+        _write_book(book, 5)
+        self.store = ConversionStore(self.temp_dir / "split-store", split_pages=2)
+        digest = FileHasher().hash_file(book)
+        self.store.convert_part(book, "sha256", digest, 0, 2)
+        self.store.convert_part(book, "sha256", digest, 4, 5)
+
+        with mock.patch.object(store_module, "pdf_to_markdown", wraps=store_module.pdf_to_markdown) as convert:
+            _, md_text, _ = self._convert(book, "Book2023")
+        self.assertEqual(convert.call_count, 1, "Only the missing page range should be converted")
+        self.assertEqual(list(convert.call_args.args[2]), [2, 3])
+        self.assertLess(md_text.index("Text of page 2"), md_text.index("Text of page 3"))
+        self.assertLess(md_text.index("Text of page 4"), md_text.index("Text of page 5"))
+
+        # Once the whole PDF is stored, its parts are not converted again
+        with mock.patch.object(store_module, "pdf_to_markdown") as convert:
+            self.store.convert_part(book, "sha256", digest, 0, 2)
+        convert.assert_not_called()
+
+    def _annotate(self, pdf_path: Path):
+        """Highlight some text and change the metadata, like a PDF reader saving annotations."""
+        doc = pymupdf.open(pdf_path)
+        page = doc[1]
+        page.add_highlight_annot(page.search_for("Text of page 2")[0])
+        page.add_text_annot((300, 300), "A note")
+        doc.set_metadata({"title": "Annotated"})
+        doc.saveIncr()
+        doc.close()
+
+    def test_page_fingerprints(self):
+        """Test that fingerprints change with the content of a page, but not with annotations."""
+        book = self.temp_dir / "book.pdf"
+        _write_book(book, 4)
+        fingerprints = page_fingerprints(book)
+        self.assertEqual(len(set(fingerprints)), 4)
+
+        self._annotate(book)
+        self.assertEqual(page_fingerprints(book), fingerprints)
+
+        _write_book(book, 4, revised_page=2)
+        revised = page_fingerprints(book)
+        self.assertEqual([a == b for a, b in zip(fingerprints, revised)], [True, True, False, True])
+
+    def test_annotations_are_not_converted(self):
+        """Test that adding annotations to a PDF reuses its earlier conversion."""
+        book = self.temp_dir / "book.pdf"
+        _write_book(book, 4)
+        _, before, _ = self._convert(book, "Before2023")
+        self._annotate(book)
+
+        with mock.patch.object(store_module, "pdf_to_markdown", wraps=store_module.pdf_to_markdown) as convert:
+            after_dir, after, stored = self._convert(book, "After2023")
+        convert.assert_not_called()
+        self.assertFalse(stored, "The annotated PDF is a new store entry")
+        self.assertEqual(after.replace("After2023", "Before2023"), before.replace("After2023", "Before2023"))
+        self.assertEqual(len(list(after_dir.glob("*.png"))), 4)
+
+    def test_changed_pages_are_reconverted(self):
+        """Test that only the changed pages of a PDF are converted again."""
+        book = self.temp_dir / "book.pdf"
+        _write_book(book, 5)
+        self._convert(book, "Before2023")
+        _write_book(book, 5, revised_page=3)
+
+        with mock.patch.object(store_module, "pdf_to_markdown", wraps=store_module.pdf_to_markdown) as convert:
+            updated_dir, updated, _ = self._convert(book, "Updated2023")
+        self.assertEqual(convert.call_count, 1)
+        self.assertEqual(list(convert.call_args.args[2]), [3])
+        self.assertIn("Revised text of page 4", updated)
+
+        # The result is the same as converting the new version from scratch
+        self.store = ConversionStore(self.temp_dir / "fresh-store")
+        fresh_dir, fresh, _ = self._convert(book, "Fresh2023")
+        self.assertEqual(
+            updated.replace(f"{updated_dir.as_posix()}/Updated2023", ""),
+            fresh.replace(f"{fresh_dir.as_posix()}/Fresh2023", "")
+        )
+        self.assertEqual(
+            sorted(p.name.replace("Updated2023", "") for p in updated_dir.glob("*.png")),
+            sorted(p.name.replace("Fresh2023", "") for p in fresh_dir.glob("*.png"))
+        )
+
+    def test_default_store_is_isolated(self):
+        """Test that the tests never touch the real user-level cache."""
+        default = ConversionStore.default()
+        self.assertEqual(default.root, Path(os.environ["BIB4LLM_CACHE_DIR"]))
+        self.assertNotEqual(default.root, Path.home() / ".cache" / "bib4llm")
+
+    def test_parse_size(self):
+        """Test parsing of cache size limits."""
+        self.assertEqual(parse_size("1024"), 1024)
+        self.assertEqual(parse_size("500M"), 500 * 1024**2)
+        self.assertEqual(parse_size("1.5g"), int(1.5 * 1024**3))
+        self.assertEqual(parse_size("10GB"), 10 * 1024**3)
+        with self.assertRaises(ValueError):
+            parse_size("lots")
+
+
+if __name__ == "__main__":
+    unittest.main()
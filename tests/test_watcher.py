@@ -11,6 +11,17 @@ import os
 import subprocess
 import sys
 from pathlib import Path
+from unittest import mock
+
+import pymupdf
+from watchdog.events import DirCreatedEvent, FileClosedEvent, FileCreatedEvent, FileModifiedEvent, FileMovedEvent
+from watchdog.observers import Observer
+
+from bib4llm.bibscan import ScannedEntry
+from bib4llm.process_bibliography import BibliographyProcessor, DirectoryProcessor
+from bib4llm.state import ItemState, StateDB
+from bib4llm.store import ConversionStore
+from bib4llm.watcher import BibTexHandler, ChangeQueue, DirectoryHandler, EntryTracker, recorded_citation_keys
 
 
 class TestWatcher(unittest.TestCase):
@@ -117,5 +128,291 @@ if __name__ == "__main__":
                 watcher_process.wait(timeout=2)
 
 
+class TestIncrementalBibTeX(unittest.TestCase):
+    """Test that the BibTeX watcher only processes changed entries."""
+
+    def setUp(self):
+        """Set up the test environment."""
+        # Set up a null handler for logging instead of disabling it
+        self.root_logger = logging.getLogger()
+        self.old_handlers = self.root_logger.handlers.copy()
+        self.root_logger.handlers.clear()
+        self.null_handler = logging.NullHandler()
+        self.root_logger.addHandler(self.null_handler)
+        
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.bibtex_file = self.temp_dir / "test.bib"
+        for key in ("First2023", "Second2023", "Third2023"):
+            (self.temp_dir / f"{key}.txt").write_text(f"Notes of {key}")
+        self.store = ConversionStore(self.temp_dir / "cache")
+
+    def tearDown(self):
+        """Clean up after the test."""
+        # Restore original logging handlers
+        self.root_logger.removeHandler(self.null_handler)
+        for handler in self.old_handlers:
+            self.root_logger.addHandler(handler)
+
+    def _write_bib(self, titles):
+        self.bibtex_file.write_text("\n".join(
+            f"@article{{{key},\n  title={{{title}}},\n  file={{{self.temp_dir / f'{key}.txt'}}}\n}}\n"
+            for key, title in titles.items()
+        ))
+
+    def test_entry_tracker(self):
+        """Test computing added, modified and removed entries."""
+        tracker = EntryTracker()
+        entries = [ScannedEntry("A", "/a.pdf", "a"), ScannedEntry("B", None, "b")]
+        changes = tracker.diff(entries)
+        self.assertEqual(changes.changed, [{"ID": "A", "file": "/a.pdf"}, {"ID": "B"}],
+                         "All entries should be new before the first apply")
+        tracker.apply(changes)
+        
+        changes = tracker.diff([ScannedEntry("A", "/a.pdf", "a2"), ScannedEntry("C", None, "c")])
+        self.assertEqual([entry["ID"] for entry in changes.changed], ["A", "C"])
+        self.assertEqual(changes.removed, ["B"])
+        
+        # Nothing is recorded until the changes are applied
+        self.assertEqual(tracker.diff(entries).changed, [])
+
+    def test_only_changed_entries_are_processed(self):
+        """Test that rewriting the file processes only the modified and removed entries."""
+        self._write_bib({"First2023": "One", "Second2023": "Two", "Third2023": "Three"})
+        with mock.patch("bib4llm.watcher.BibliographyProcessor.process_entries",
+                        autospec=True, side_effect=BibliographyProcessor.process_entries) as process_entries:
+            handler = BibTexHandler(self.bibtex_file, num_processes=1, store=self.store)
+            output_dir = BibliographyProcessor.get_output_dir(self.bibtex_file)
+            self.assertTrue((output_dir / "Third2023" / "Third2023.md").exists())
+            
+            self._write_bib({"First2023": "One", "Second2023": "Two (revised)"})
+            handler._process()
+        
+        processed = [[entry["ID"] for entry in call.args[1]] for call in process_entries.call_args_list]
+        self.assertEqual(processed, [["First2023", "Second2023", "Third2023"], ["Second2023"]])
+        self.assertFalse((output_dir / "Third2023").exists(), "Output of removed entries should be removed")
+        self.assertTrue((output_dir / "First2023" / "First2023.md").exists())
+
+    def test_atomic_save(self):
+        """Test that saving by renaming a temporary file over the BibTeX file is processed."""
+        self._write_bib({"First2023": "One"})
+        handler = BibTexHandler(self.bibtex_file, num_processes=1, store=self.store, quiet_period=0.1)
+        self.addCleanup(handler.changes.stop)
+        output_dir = BibliographyProcessor.get_output_dir(self.bibtex_file)
+
+        temp_file = self.temp_dir / ".test.bib.tmp"
+        self._write_bib({"First2023": "One", "Second2023": "Two"})
+        self.bibtex_file.rename(temp_file)
+        temp_file.rename(self.bibtex_file)
+        handler.on_moved(FileMovedEvent(str(temp_file), str(self.bibtex_file)))
+        self.assertTrue(handler.changes.wait_idle(timeout=30))
+        self.assertTrue((output_dir / "Second2023" / "Second2023.md").exists())
+
+    def test_attachments_are_watched(self):
+        """Test that the directories of attachments are watched and changed attachments reconverted."""
+        storage = {}
+        for key in ("First2023", "Second2023", "Third2023"):
+            storage[key] = self.temp_dir / "storage" / key / f"{key}.txt"
+            storage[key].parent.mkdir(parents=True)
+            storage[key].write_text(f"Notes of {key}")
+
+        def write_bib(keys):
+            self.bibtex_file.write_text("\n".join(
+                f"@article{{{key},\n  title={{{key}}},\n  file={{{storage[key]}}}\n}}\n"
+                for key in keys
+            ))
+
+        write_bib(["First2023", "Second2023"])
+        observer = Observer()
+        with mock.patch("bib4llm.watcher.BibliographyProcessor.process_entries",
+                        autospec=True, side_effect=BibliographyProcessor.process_entries) as process_entries:
+            handler = BibTexHandler(
+                self.bibtex_file, num_processes=1, store=self.store, quiet_period=0.1, observer=observer
+            )
+            self.addCleanup(handler.changes.stop)
+            self.assertEqual(
+                set(handler.attachment_watches), {storage["First2023"].parent, storage["Second2023"].parent}
+            )
+
+            # Entries added or removed are followed
+            write_bib(["Second2023", "Third2023"])
+            handler._process()
+            self.assertEqual(
+                set(handler.attachment_watches), {storage["Second2023"].parent, storage["Third2023"].parent}
+            )
+            process_entries.reset_mock()
+
+            # Annotating an attachment only converts its entry again
+            storage["Third2023"].write_text("Annotated notes")
+            handler.on_modified(FileModifiedEvent(str(storage["Third2023"])))
+            handler.on_closed(FileClosedEvent(str(storage["Third2023"])))
+            # Other files in the watched directories are ignored
+            handler.on_modified(FileModifiedEvent(str(storage["Third2023"].parent / ".zotero-ft-cache")))
+            self.assertTrue(handler.changes.wait_idle(timeout=30))
+
+        processed = [[entry["ID"] for entry in call.args[1]] for call in process_entries.call_args_list]
+        self.assertEqual(processed, [["Third2023"]])
+        output_dir = BibliographyProcessor.get_output_dir(self.bibtex_file)
+        self.assertIn("Annotated notes", (output_dir / "Third2023" / "Third2023.md").read_text())
+
+    def test_recorded_citation_keys(self):
+        """Test that attachments recorded with relative or absolute paths are found by their absolute path."""
+        relative = Path(os.path.relpath(self.temp_dir / "storage" / "a.pdf"))
+        with StateDB(self.temp_dir / "state.db") as state:
+            state.record({
+                "Relative2023": ItemState(file_hashes={str(relative): "ab" * 32}),
+                "Absolute2023": ItemState(file_hashes={str(relative.absolute()): "ab" * 32}),
+                "Other2023": ItemState(file_hashes={str(self.temp_dir / "b.pdf"): "cd" * 32}),
+            })
+            self.assertEqual(
+                recorded_citation_keys(state, relative.absolute()), ["Absolute2023", "Relative2023"]
+            )
+            self.assertEqual(recorded_citation_keys(state, self.temp_dir / "missing.pdf"), [])
+
+
+class TestChangeQueue(unittest.TestCase):
+    """Test that events are coalesced per path and processed in the background."""
+
+    def setUp(self):
+        """Set up the test environment."""
+        # Set up a null handler for logging instead of disabling it
+        self.root_logger = logging.getLogger()
+        self.old_handlers = self.root_logger.handlers.copy()
+        self.root_logger.handlers.clear()
+        self.null_handler = logging.NullHandler()
+        self.root_logger.addHandler(self.null_handler)
+
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    def tearDown(self):
+        """Clean up after the test."""
+        # Restore original logging handlers
+        self.root_logger.removeHandler(self.null_handler)
+        for handler in self.old_handlers:
+            self.root_logger.addHandler(handler)
+
+    def _touch(self, *names):
+        paths = [self.temp_dir / name for name in names]
+        for path in paths:
+            path.write_text(path.name)
+        return paths
+
+    def _write_pdf(self, path: Path):
+        doc = pymupdf.open()
+        doc.new_page().insert_text((72, 72), path.stem)
+        doc.save(path)
+        doc.close()
+
+    def test_events_are_coalesced(self):
+        """Test that every path is processed once its events became quiet, and none is dropped."""
+        a, b = self._touch("a.pdf", "b.pdf")
+        processed = []
+        changes = ChangeQueue(processed.append, quiet_period=0.2)
+        self.addCleanup(changes.stop)
+        for _ in range(3):
+            changes.put(a)
+            changes.put(b)
+        changes.put(self.temp_dir / "removed.pdf")
+        self.assertEqual(processed, [], "Paths should only be processed after the quiet period")
+        self.assertTrue(changes.wait_idle(timeout=5))
+        self.assertEqual(processed, [[a, b]])
+
+    def test_wait_for_write_completion(self):
+        """Test that files are only processed once they were closed and stopped changing."""
+        bib_file, = self._touch("library.bib")
+        processed = []
+        changes = ChangeQueue(processed.append, quiet_period=0.1, wait_for_close=True)
+        self.addCleanup(changes.stop)
+
+        # The first chunk of an export was written, but the file is still open
+        changes.put(bib_file)
+        time.sleep(0.3)
+        self.assertEqual(processed, [])
+        changes.put(bib_file, closed=True)
+        self.assertTrue(changes.wait_idle(timeout=5))
+        self.assertEqual(processed, [[bib_file]])
+
+        # Changes without an event restart the quiet period
+        changes.put(bib_file, closed=True)
+        with open(bib_file, "a") as f:
+            f.write("@article{More,\n}\n")
+        time.sleep(0.15)
+        self.assertEqual(len(processed), 1)
+        self.assertTrue(changes.wait_idle(timeout=5))
+        self.assertEqual(processed, [[bib_file], [bib_file]])
+
+    def test_put_does_not_block(self):
+        """Test that events arriving while processing are recorded and processed afterwards."""
+        a, b = self._touch("a.pdf", "b.pdf")
+        processed = []
+        release = threading.Event()
+
+        def process(paths):
+            processed.append(paths)
+            release.wait(5)
+
+        changes = ChangeQueue(process, quiet_period=0.0)
+        self.addCleanup(changes.stop)
+        changes.put(a)
+        while not processed:
+            time.sleep(0.01)
+        start = time.monotonic()
+        changes.put(a)
+        changes.put(b)
+        self.assertLess(time.monotonic() - start, 1)
+        release.set()
+        self.assertTrue(changes.wait_idle(timeout=5))
+        self.assertEqual(processed, [[a], [a, b]])
+
+    def test_pdfs_copied_at_once(self):
+        """Test that all PDFs copied into a watched directory at once are converted."""
+        watched = self.temp_dir / "papers"
+        watched.mkdir()
+        store = ConversionStore(self.temp_dir / "cache")
+        handler = DirectoryHandler(watched, num_processes=1, store=store, quiet_period=0.1)
+        self.addCleanup(handler.changes.stop)
+
+        for i in range(10):
+            pdf_path = watched / f"paper{i}.pdf"
+            doc = pymupdf.open()
+            doc.new_page().insert_text((72, 72), f"Paper {i}")
+            doc.save(pdf_path)
+            doc.close()
+            handler.on_created(FileCreatedEvent(str(pdf_path)))
+            handler.on_modified(FileModifiedEvent(str(pdf_path)))
+            handler.on_closed(FileClosedEvent(str(pdf_path)))
+        self.assertTrue(handler.changes.wait_idle(timeout=60))
+
+        for i in range(10):
+            self.assertTrue((handler.output_dir / f"paper{i}" / f"paper{i}.md").exists(), f"paper{i} not converted")
+
+    def test_new_directory_is_scanned_alone(self):
+        """Test that a directory created in the watched tree is processed without rescanning the tree."""
+        watched = self.temp_dir / "archive"
+        (watched / "old").mkdir(parents=True)
+        self._write_pdf(watched / "old" / "old.pdf")
+        store = ConversionStore(self.temp_dir / "cache")
+        handler = DirectoryHandler(watched, num_processes=1, store=store, quiet_period=0.1)
+        self.addCleanup(handler.changes.stop)
+
+        new = watched / "new"
+        (new / "nested").mkdir(parents=True)
+        self._write_pdf(new / "new.pdf")
+        self._write_pdf(new / "nested" / "nested.pdf")
+        with mock.patch("bib4llm.watcher.DirectoryProcessor.find_files", autospec=True,
+                        side_effect=DirectoryProcessor.find_files) as find_files:
+            handler.on_created(DirCreatedEvent(str(new)))
+            handler.on_created(DirCreatedEvent(str(new / "nested")))
+            handler.on_created(FileCreatedEvent(str(new / "new.pdf")))
+            handler.on_closed(FileClosedEvent(str(new / "new.pdf")))
+            self.assertTrue(handler.changes.wait_idle(timeout=60))
+
+        self.assertEqual([call.kwargs["subdirectory"] for call in find_files.call_args_list], [new])
+        self.assertTrue((handler.output_dir / "new" / "new" / "new.md").exists())
+        self.assertTrue((handler.output_dir / "new" / "nested" / "nested" / "nested.md").exists())
+
+
+
 if __name__ == "__main__":
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,181 @@
+"""Test the supervised worker pool."""
+
+import unittest
+import logging
+import os
+import time
+
+from unittest import mock
+
+from bib4llm import workers
+from bib4llm.workers import START_METHODS, TaskTimeout, WorkerDied, WorkerLimits, WorkerPool, resource
+
+
+def _square(x):
+    return x * x
+
+
+def _fail(message):
+    raise ValueError(message)
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def _crash():
+    os._exit(3)
+
+
+def _pid():
+    return os.getpid()
+
+
+def _allocate(size):
+    return len(bytearray(size))
+
+
+_initialized = False
+
+
+def _initialize():
+    global _initialized
+    _initialized = True
+
+
+def _is_initialized():
+    return _initialized
+
+
+def _interval(seconds):
+    start = time.monotonic()
+    time.sleep(seconds)
+    return start, time.monotonic()
+
+
+class TestWorkerPool(unittest.TestCase):
+    """Test timeouts, crashes, memory limits and recycling of worker processes."""
+
+    def setUp(self):
+        """Set up the test environment."""
+        # Set up a null handler for logging instead of disabling it
+        self.root_logger = logging.getLogger()
+        self.old_handlers = self.root_logger.handlers.copy()
+        self.root_logger.handlers.clear()
+        self.null_handler = logging.NullHandler()
+        self.root_logger.addHandler(self.null_handler)
+
+    def tearDown(self):
+        """Clean up after the test."""
+        # Restore original logging handlers
+        self.root_logger.removeHandler(self.null_handler)
+        for handler in self.old_handlers:
+            self.root_logger.addHandler(handler)
+
+    def test_results_and_exceptions(self):
+        """Test that results and exceptions of tasks are returned."""
+        with WorkerPool(2) as pool:
+            futures = [pool.submit(_square, i) for i in range(10)]
+            failing = pool.submit(_fail, "broken PDF")
+        self.assertEqual([future.result() for future in futures], [i * i for i in range(10)])
+        with self.assertRaisesRegex(ValueError, "broken PDF"):
+            failing.result()
+
+    def test_timeout(self):
+        """Test that a hanging task is aborted and the pool continues with the other tasks."""
+        with WorkerPool(1, WorkerLimits(task_timeout=0.5)) as pool:
+            start = time.monotonic()
+            hanging = pool.submit(_sleep, 60)
+            after = pool.submit(_square, 3)
+        self.assertLess(time.monotonic() - start, 30)
+        with self.assertRaises(TaskTimeout):
+            hanging.result()
+        self.assertEqual(after.result(), 9)
+
+    def test_crashed_worker(self):
+        """Test that a dying worker only fails its own task and is replaced."""
+        with WorkerPool(1) as pool:
+            crashed = pool.submit(_crash)
+            after = pool.submit(_square, 4)
+        with self.assertRaisesRegex(WorkerDied, "exited with code 3"):
+            crashed.result()
+        self.assertEqual(after.result(), 16)
+
+    def test_workers_are_recycled(self):
+        """Test that workers are replaced after max_tasks tasks."""
+        with WorkerPool(1, WorkerLimits(max_tasks=2)) as pool:
+            pids = [pool.submit(_pid).result() for _ in range(4)]
+        self.assertEqual(pids[0], pids[1])
+        self.assertEqual(pids[2], pids[3])
+        self.assertNotEqual(pids[1], pids[2])
+
+    @unittest.skipIf(resource is None, "Memory limits require the resource module")
+    def test_memory_limit(self):
+        """Test that an allocation beyond the memory limit fails in the worker."""
+        with WorkerPool(1, WorkerLimits(memory_limit=1024**3)) as pool:
+            too_large = pool.submit(_allocate, 2 * 1024**3)
+            small = pool.submit(_allocate, 1024**2)
+        with self.assertRaises(MemoryError):
+            too_large.result()
+        self.assertEqual(small.result(), 1024**2)
+
+    def test_memory_budget(self):
+        """Test that tasks are only started while their estimated memory fits into the budget."""
+        with WorkerPool(3, WorkerLimits(max_memory=100)) as pool:
+            large = [pool.submit(_interval, 0.3, memory=60) for _ in range(2)]
+            small = pool.submit(_interval, 0.3, memory=30)
+            too_large = pool.submit(_square, 5, memory=200)
+        (start1, end1), (start2, end2) = [future.result() for future in large]
+        # The large tasks don't run at the same time, but the small one runs next to the first
+        self.assertTrue(end1 <= start2 or end2 <= start1)
+        self.assertLess(small.result()[0], min(end1, end2))
+        # A task exceeding the budget on its own is still run
+        self.assertEqual(too_large.result(), 25)
+
+    def test_large_task_is_not_starved(self):
+        """Test that a stream of small tasks doesn't keep overtaking a large task forever."""
+        with mock.patch.object(workers, "MAX_OVERTAKE_TIME", 0.2), \
+                WorkerPool(2, WorkerLimits(max_memory=100)) as pool:
+            first = pool.submit(_interval, 0.3, memory=40)
+            large = pool.submit(_interval, 0.1, memory=100)
+            small = [pool.submit(_interval, 0.3, memory=40) for _ in range(10)]
+        large_start, _ = large.result()
+        overtaking = [start for start, _ in (future.result() for future in small) if start < large_start]
+        # Only the task started before the large one had waited long enough overtakes it
+        self.assertLess(first.result()[0], large_start)
+        self.assertEqual(len(overtaking), 1, f"{len(overtaking)} small tasks overtook the large one")
+
+    def test_resize(self):
+        """Test that resizing the pool changes the number of tasks run at the same time."""
+        with WorkerPool(1) as pool:
+            pool.resize(2)
+            intervals = [pool.submit(_interval, 0.3) for _ in range(2)]
+        (start1, end1), (start2, end2) = [future.result() for future in intervals]
+        self.assertLess(max(start1, start2), min(end1, end2))
+
+    def test_warm_pool(self):
+        """Test that a warm pool starts and initializes its workers before the first task and replaces retired ones."""
+        with WorkerPool(2, WorkerLimits(max_tasks=1), warm=True, initializer=_initialize) as pool:
+            deadline = time.monotonic() + 10
+            while len(pool._workers) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(len(pool._workers), 2)
+            self.assertTrue(pool.submit(_is_initialized).result())
+            # The retired worker is replaced without a new task
+            deadline = time.monotonic() + 10
+            while len(pool._workers) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(len(pool._workers), 2)
+
+    def test_start_methods(self):
+        """Test that tasks run in workers started with each available start method."""
+        for start_method in START_METHODS:
+            with self.subTest(start_method=start_method):
+                with WorkerPool(1, WorkerLimits(start_method=start_method)) as pool:
+                    self.assertEqual(pool._context.get_start_method(), start_method)
+                    self.assertEqual(pool.submit(_square, 3).result(), 9)
+
+
+if __name__ == "__main__":
+    unittest.main()